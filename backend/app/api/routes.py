@@ -1,49 +1,91 @@
-from fastapi import APIRouter, HTTPException, Request, File, UploadFile
-from app.services.providers import provider_service, STATS
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from app.services.providers import provider_service, STREAM_STATS
+from app.services.stats_store import stats_store
+from app.services.live_stats import live_stats
+from app.services.http_clients import http_clients
+from app.services.circuit import get_circuit_stats
+from app.services.complexity import get_complexity_stats
+from app.services.latency import get_latency_stats
+from app.services.registry import REGISTRY
+from app.services.usage import get_usage_stats
+from app.services.rate_limits import get_rate_limit_stats
+from app.services.admission import get_admission_stats
+from app.services.batches import BatchError, batch_manager
+from app.services.documents import DocumentError, document_extractor, join_pages
+from app.core.config import settings
+from app.core.metrics import CONTENT_TYPE, render_metrics
+from app.core.cache import embedder, CACHE_STATS, READINESS, get_cache_stats, is_ready
 import traceback
-import io
-import pypdf
+import json
+import os
 
 router = APIRouter()
 
-@router.post("/api/parse-document")
-async def parse_document(file: UploadFile = File(...)):
+_UPLOAD_SCHEMA = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"],
+    "properties": {"file": {"type": "string", "format": "binary"}}}}}}}
+
+@router.post("/api/parse-document", openapi_extra=_UPLOAD_SCHEMA)
+async def parse_document(request: Request, stream: bool = False):
     """
     Parses an uploaded document (PDF or Text) and returns the extracted text.
+    The `file` form field is streamed to disk by the extractor, not parsed
+    as a form up front, so oversized uploads are refused before they are
+    read. With ?stream=true the response is JSONL: one {"page", "text"}
+    line per page as it is extracted, then {"done": true, "pages": N}.
     """
     try:
-        contents = await file.read()
-        filename = file.filename.lower()
-        extracted_text = ""
+        filename, path, digest = await document_extractor.receive(request)
+    except DocumentError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
-        if filename.endswith(".pdf"):
-            try:
-                pdf_file = io.BytesIO(contents)
-                reader = pypdf.PdfReader(pdf_file)
-                for page in reader.pages:
-                    text = page.extract_text()
-                    if text:
-                        extracted_text += text + "\n"
-            except Exception as e:
-                print(f"Error parsing PDF: {e}")
-                raise HTTPException(status_code=400, detail=f"Invalid PDF file: {str(e)}")
-        
-        else:
-            # Assume text/code file
-            try:
-                extracted_text = contents.decode("utf-8")
-            except UnicodeDecodeError:
-                # Try latin-1 fallback
-                extracted_text = contents.decode("latin-1")
-        
-        if not extracted_text.strip():
-             return {"text": f"[No text extracted from {file.filename}]"}
+    is_pdf = (filename or "").lower().endswith(".pdf")
+    pages = document_extractor.pages(path, is_pdf, digest)
 
-        return {"text": extracted_text}
+    async def cleanup():
+        # Safe to call twice: the generator's finally and the response's background task
+        await pages.aclose()
+        if os.path.exists(path):
+            os.unlink(path)
+
+    if stream:
+        async def page_lines():
+            try:
+                count = await pages.__anext__()
+                number = 0
+                async for text in pages:
+                    number += 1
+                    yield _ndjson({"page": number, "text": text})
+                yield _ndjson({"done": True, "pages": count})
+            except DocumentError as e:
+                yield _ndjson({"error": {"message": str(e), "status_code": e.status_code}})
+            finally:
+                await cleanup()
+        # The background task runs even when the client disconnects mid-stream,
+        # which leaves page_lines suspended and its finally never reached
+        return StreamingResponse(page_lines(), media_type="application/x-ndjson",
+                                 headers={"X-Accel-Buffering": "no"},
+                                 background=BackgroundTask(cleanup))
 
+    try:
+        count = await pages.__anext__()
+        texts = [text async for text in pages]
+    except DocumentError as e:
+        print(f"Error parsing document: {e}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         print(f"File upload error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
+    finally:
+        await cleanup()
+
+    extracted_text = join_pages(texts) if is_pdf else texts[0]
+    if not extracted_text.strip():
+         return {"text": f"[No text extracted from {filename}]"}
+
+    return {"text": extracted_text, "pages": count}
 
 @router.post("/v1/chat/completions")
 async def chat_completions(request: Request):
@@ -54,6 +96,13 @@ async def chat_completions(request: Request):
         if not messages:
             raise HTTPException(status_code=400, detail="Messages required")
 
+        if body.get("stream"):
+            return StreamingResponse(
+                provider_service.stream_request(messages),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
         response = await provider_service.route_request(messages)
         return response
 
@@ -64,27 +113,142 @@ async def chat_completions(request: Request):
         full_error = f"{str(e)}\n\n{traceback.format_exc()}"
         raise HTTPException(status_code=500, detail=full_error)
 
+def _ndjson(obj: dict) -> bytes:
+    return (json.dumps(obj, separators=(",", ":")) + "\n").encode("utf-8")
+
+async def _batch_output(job):
+    async for line in job.results_stream():
+        yield _ndjson(line)
+    yield _ndjson(job.to_dict())  # final line: the job summary
+
+@router.post("/v1/batches")
+async def create_batch(request: Request):
+    """
+    Submit many chat requests at once. Body: JSON {"requests": [...], "stream": bool}
+    or JSONL, one request per line ({"custom_id", "body": {"messages"}} or
+    {"custom_id", "messages"}). Returns the job; with stream (or ?stream=true)
+    the response is the JSONL output, one line per request as it completes.
+    """
+    raw = await request.body()
+    stream = request.query_params.get("stream", "").lower() in ("1", "true", "yes")
+    try:
+        text = raw.decode("utf-8")
+        try:
+            body = json.loads(text)
+        except ValueError:
+            body = None  # not one JSON document: JSONL
+        if isinstance(body, dict) and "requests" in body:
+            items = body["requests"]
+            stream = stream or bool(body.get("stream"))
+        else:
+            items = [json.loads(line) for line in text.splitlines() if line.strip()]
+        job = batch_manager.submit(items)
+    except (ValueError, BatchError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {e}")
+
+    if stream:
+        return StreamingResponse(_batch_output(job), media_type="application/x-ndjson",
+                                 headers={"X-Batch-Id": job.id, "X-Accel-Buffering": "no"})
+    return job.to_dict()
+
+def _get_job(batch_id: str):
+    job = batch_manager.get(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return job
+
+@router.get("/v1/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    return _get_job(batch_id).to_dict()
+
+@router.get("/v1/batches/{batch_id}/results")
+async def get_batch_results(batch_id: str):
+    """JSONL output so far, then the rest as it completes"""
+    return StreamingResponse(_batch_output(_get_job(batch_id)), media_type="application/x-ndjson",
+                             headers={"X-Accel-Buffering": "no"})
+
+@router.post("/v1/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    _get_job(batch_id)
+    return batch_manager.cancel(batch_id).to_dict()
+
 @router.get("/api/stats")
 async def get_stats():
     """
-    Returns the real-time stats for the dashboard.
+    Returns the real-time stats for the dashboard. Request/cache/savings
+    counters are summed over all workers (see stats_store); the rest
+    describes the worker that answered.
     """
-    total = STATS["cache_hits"] + STATS["cache_misses"]
-    hit_rate = round((STATS["cache_hits"] / total) * 100, 1) if total > 0 else 0
+    shared = await stats_store.snapshot()
+    totals = shared["totals"]
+    hits, misses = totals.get("cache_hits", 0), totals.get("cache_misses", 0)
+    total = hits + misses
+    hit_rate = round((hits / total) * 100, 1) if total > 0 else 0
     
     return {
-        "requests": STATS["total_requests"],
-        "savings": round(STATS["total_savings"], 4),
+        "requests": int(totals.get("total_requests", 0)),
+        "savings": round(totals.get("total_savings", 0.0), 4),
         "hit_rate": hit_rate,
-        "provider_groq": STATS.get("provider_groq", 0),
-        "provider_local": STATS.get("provider_local", 0),
-        "latest_request": STATS.get("latest_request", {
+        "provider_groq": int(totals.get("provider_groq", 0)),
+        "provider_local": int(totals.get("provider_local", 0)),
+        "providers": {name: int(totals.get(f"provider_{name}", 0)) for name in REGISTRY},
+        "routing_policy": settings.ROUTING_POLICY,
+        "windows": shared["windows"],
+        "stats_store": {"source": shared["source"], **stats_store.get_stats()},
+        "usage": get_usage_stats(),
+        "coalesced": int(totals.get("coalesced_requests", 0)),
+        "embedding": embedder.get_stats(),
+        "cache_tiers": CACHE_STATS,
+        "cache": await get_cache_stats(),
+        "connections": http_clients.get_stats(),
+        "streaming": STREAM_STATS,
+        "latency": get_latency_stats(),
+        "circuits": get_circuit_stats(),
+        "rate_limits": get_rate_limit_stats(),
+        "queues": get_admission_stats(),
+        "batches": batch_manager.get_stats(),
+        "documents": document_extractor.get_stats(),
+        "complexity": get_complexity_stats(),
+        "hedged": int(totals.get("hedged_requests", 0)),
+        "latest_request": shared["latest_request"] or {
             "type": "Waiting...",
             "provider": "Waiting...",
             "timestamp": 0
-        })
+        }
     }
 
+@router.get("/api/stats/stream")
+async def stream_stats():
+    """
+    Server-Sent Events for the dashboard: a `snapshot` of the /api/stats
+    payload, then coalesced `delta` updates and per-request `request` events.
+    """
+    return StreamingResponse(
+        live_stats.subscribe(get_stats),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/health")
 async def health():
     return {"status": "ok"}
+
+@router.get("/ready")
+async def ready():
+    """
+    Readiness (vs /health liveness): 503 while startup (embedding model,
+    cache index, tokenizer, classifier) is still running, 200 once it has
+    finished. Parts that failed to start are listed in `degraded`; the
+    app serves without them (no semantic cache, keyword routing, ...).
+    """
+    if not is_ready():
+        status = "warming_up"
+    else:
+        status = "degraded" if READINESS["degraded"] else "ready"
+    body = {"status": status, **READINESS}
+    return JSONResponse(status_code=200 if is_ready() else 503, content=body)
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint (per-stage latency histograms, counters, in-flight gauges)"""
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
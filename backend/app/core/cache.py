@@ -1,110 +1,429 @@
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from sentence_transformers import SentenceTransformer
-import json
-import os
+import asyncio
+import copy
+import time
+from dataclasses import dataclass
+from typing import Optional
 from app.core.config import settings
+from app.core.embeddings import EmbeddingBatcher
+from app.core.cache_writer import CacheWriter
+from app.core.exact_cache import l1_cache, l2_cache
+from app.core.keys import build_cache_key, point_id
+from app.core.metrics import CACHE_LOOKUPS, STAGE_SECONDS
+from app.core.vector_store import StoredPoint, create_backend
 
-# Initialize Qdrant in Local Mode (saves to disk, no Docker needed)
-# "location" argument creates a local database
-client = QdrantClient(path="./qdrant_data") 
+# multi-qa-MiniLM-L6-cos-v1 is small, fast and great for semantic search
+EMBEDDING_MODEL_NAME = "multi-qa-MiniLM-L6-cos-v1"
 
-# Load embedding model (Small and fast)
-# multi-qa-MiniLM-L6-cos-v1 is great for semantic search
-print("Loading Embedding Model (this may take a moment first time)...")
-embedding_model = SentenceTransformer('multi-qa-MiniLM-L6-cos-v1')
+# Encodes run in a worker thread; concurrent prompts share one batched forward pass.
+# The model itself is attached by init_cache() once it has loaded.
+embedder = EmbeddingBatcher(None)
 
 COLLECTION_NAME = "llm_cache_v1"
 
-# Global flag to track if cache is active
+# Vector store for the semantic tier (CACHE_BACKEND: qdrant or numpy), opened by init_cache()
+store = None
+
+# Global flag to track if the semantic tier is usable (model loaded, index open, warmed up)
 CACHE_ENABLED = False
 
-def init_cache():
-    """Create collection if it doesn't exist"""
-    global CACHE_ENABLED
+# Startup progress reported by /ready. warmup_done is set by the app's warmup
+# task once every startup step has finished or failed; the parts that failed
+# are listed in degraded (the app still serves, without them).
+READINESS = {
+    "model_loaded": False,
+    "index_ready": False,
+    "warmed_up": False,
+    "warmup_done": False,
+    "degraded": [],
+    "error": None,
+}
+
+# Hit/miss counters per lookup tier: l1 (in-process), l2 (Redis), semantic (vector store)
+CACHE_STATS = {
+    "l1": {"hits": 0, "misses": 0},
+    "l2": {"hits": 0, "misses": 0},
+    "semantic": {"hits": 0, "misses": 0},
+}
+
+# Background eviction counters (see evict_once)
+EVICTION_STATS = {
+    "runs": 0,
+    "evicted_ttl": 0,
+    "evicted_capacity": 0,
+    "last_run": 0,
+}
+
+def _load_model():
+    # Imported here: pulling in torch alone takes seconds
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+async def init_cache():
+    """Load the embedding model, open the vector index and warm both up.
+    Runs in the background from the app lifespan; until it finishes,
+    lookups skip the semantic tier instead of waiting."""
+    global CACHE_ENABLED, store
     try:
-        collections = client.get_collections()
-        if COLLECTION_NAME not in [c.name for c in collections.collections]:
-            client.create_collection(
-                collection_name=COLLECTION_NAME,
-                vectors_config=models.VectorParams(
-                    size=384, # Output size of MiniLM-L6
-                    distance=models.Distance.COSINE
-                )
-            )
-            print(f"Created Qdrant collection: {COLLECTION_NAME}")
+        if embedder.model is None:
+            print("Loading Embedding Model (this may take a moment first time)...")
+            embedder.model = await asyncio.to_thread(_load_model)
+        READINESS["model_loaded"] = True
+
+        if store is None:
+            store = create_backend(COLLECTION_NAME)
+        await store.init()
+        READINESS["index_ready"] = True
+
+        # First forward pass pays for lazy allocations; keep that off a real request
+        await embedder.encode("warmup")
+        READINESS["warmed_up"] = True
+
         CACHE_ENABLED = True
         print("✅ Cache System Initialized Successfully")
     except Exception as e:
+        READINESS["error"] = str(e)
+        READINESS["degraded"].append("semantic_cache")
         print(f"⚠️ Cache Initialization Failed: {e}")
         print("⚠️ Continuing without caching...")
         CACHE_ENABLED = False
 
-def _get_prompt_text(messages: list) -> str:
-    """Concatenate messages to form the search query"""
-    return json.dumps(messages)
+def is_ready() -> bool:
+    return READINESS["warmup_done"]
+
+@dataclass
+class CacheLookup:
+    """Handle returned by check_cache and accepted by save_to_cache so a miss
+    never embeds the same prompt twice"""
+    key: str                          # CacheKey.digest (hash of normalized messages)
+    prompt_text: str                  # CacheKey.text, what gets embedded
+    vector: Optional[list] = None     # filled in once the semantic tier ran
+    response: Optional[dict] = None   # cached response on a hit
+    tier: Optional[str] = None        # "l1", "l2" or "semantic" on a hit
+    point: Optional[str] = None       # vector store point that answered (hits)
+
+    @property
+    def hit(self) -> bool:
+        return self.response is not None
+
+def _new_lookup(messages: list) -> CacheLookup:
+    with STAGE_SECONDS.time("canonicalize"):
+        cache_key = build_cache_key(messages)
+    return CacheLookup(key=cache_key.digest, prompt_text=cache_key.text)
+
+@dataclass
+class CacheTouch:
+    """Write-behind item: a cached entry was served, refresh its hit metadata"""
+    point: str
+    hit_at: float
+
+def _exact_entry(response: dict, point: str) -> dict:
+    """L1/L2 value: the response plus the vector store point it came from,
+    so exact hits keep the point's LRU/LFU metadata current"""
+    return {"point_id": point, "response": response}
+
+def _unpack(key: str, entry: dict) -> tuple:
+    """(response, point id) of an L1/L2 value"""
+    if isinstance(entry, dict) and entry.keys() == {"point_id", "response"}:
+        return entry["response"], entry["point_id"]
+    return entry, point_id(key)  # bare response written by an older version
+
+async def _serve(lookup: CacheLookup, entry: dict, tier: str):
+    lookup.response, lookup.point = _unpack(lookup.key, entry)
+    lookup.tier = tier
+    if CACHE_ENABLED:
+        await cache_writer.submit(CacheTouch(lookup.point, time.time()))
+
+def _count(tier: str, result: str):
+    CACHE_STATS[tier][result] += 1
+    CACHE_LOOKUPS.inc(tier, "hit" if result == "hits" else "miss")
+
+async def check_cache(messages: list, threshold: float = 0.9) -> CacheLookup:
+    lookup = _new_lookup(messages)
+
+    # Tier 1/2: exact repeats never touch the embedding model
+    cached = l1_cache.get(lookup.key)
+    if cached is not None:
+        _count("l1", "hits")
+        print("🔥 Cache HIT (L1 exact)")
+        await _serve(lookup, cached, "l1")
+        return lookup
+    _count("l1", "misses")
+
+    if l2_cache is not None:
+        cached = await l2_cache.get(lookup.key)
+        if cached is not None:
+            _count("l2", "hits")
+            l1_cache.set(lookup.key, cached)
+            print("🔥 Cache HIT (L2 Redis)")
+            await _serve(lookup, cached, "l2")
+            return lookup
+        _count("l2", "misses")
 
-def check_cache(messages: list, threshold: float = 0.9):
     if not CACHE_ENABLED:
-        return None
-        
+        return lookup
+
+    # Tier 3: semantic search
     try:
-        prompt_text = _get_prompt_text(messages)
-        vector = embedding_model.encode(prompt_text).tolist()
+        with STAGE_SECONDS.time("embed"):
+            lookup.vector = await embedder.encode(lookup.prompt_text)
         
-        results = client.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=vector,
-            limit=1
-        )
+        with STAGE_SECONDS.time("vector_search"):
+            results = await store.search(lookup.vector, limit=1)
         
-        if results:
-            best_match = results[0]
-            if best_match.score >= threshold:
-                print(f"🔥 Cache HIT! Score: {best_match.score}")
-                return best_match.payload.get("response")
+        if results and await _use_match(lookup, results[0], threshold):
+            return lookup
     except Exception as e:
         print(f"Error checking cache: {e}")
             
+    _count("semantic", "misses")
     print("🧊 Cache MISS")
-    return None
+    return lookup
+
+async def _use_match(lookup: CacheLookup, best_match, threshold: float) -> bool:
+    """Serve `lookup` from a semantic match if it is close enough and not expired"""
+    if best_match.score < threshold or _is_expired(best_match.payload):
+        return False
+    print(f"🔥 Cache HIT! Score: {best_match.score}")
+    _count("semantic", "hits")
+    # Copy: local stores hand back their own payload and the router annotates it
+    response = copy.deepcopy(best_match.payload.get("response"))
+    await cache_writer.submit(CacheTouch(best_match.id, time.time()))
+    # Promote so the next identical prompt is served from the exact tiers
+    entry = _exact_entry(response, best_match.id)
+    l1_cache.set(lookup.key, entry)
+    if l2_cache is not None:
+        await l2_cache.set(lookup.key, entry)
+    lookup.response, lookup.tier, lookup.point = response, "semantic", best_match.id
+    return True
+
+async def check_cache_many(messages_list: list, threshold: float = 0.9) -> list:
+    """
+    check_cache for a batch job. Identical prompts share one CacheLookup
+    (returned once per input, same object). The exact tiers are read per
+    prompt (one MGET for Redis); whatever they miss is embedded and
+    searched in one batched call each.
+    """
+    lookups, by_key = [], {}
+    for messages in messages_list:
+        lookup = _new_lookup(messages)
+        lookups.append(by_key.setdefault(lookup.key, lookup))
+    pending = []
+    for lookup in by_key.values():
+        cached = l1_cache.get(lookup.key)
+        if cached is not None:
+            _count("l1", "hits")
+            await _serve(lookup, cached, "l1")
+        else:
+            _count("l1", "misses")
+            pending.append(lookup)
+
+    if l2_cache is not None and pending:
+        found = await l2_cache.get_many([lookup.key for lookup in pending])
+        missed = []
+        for lookup, cached in zip(pending, found):
+            if cached is not None:
+                _count("l2", "hits")
+                l1_cache.set(lookup.key, cached)
+                await _serve(lookup, cached, "l2")
+            else:
+                _count("l2", "misses")
+                missed.append(lookup)
+        pending = missed
+
+    if not CACHE_ENABLED or not pending:
+        return lookups
+
+    try:
+        with STAGE_SECONDS.time("embed"):
+            vectors = await embedder.encode_many([lookup.prompt_text for lookup in pending])
+        for lookup, vector in zip(pending, vectors):
+            lookup.vector = vector
+        with STAGE_SECONDS.time("vector_search"):
+            results = await store.search_many(vectors, limit=1)
+        for lookup, hits in zip(pending, results):
+            if hits:
+                await _use_match(lookup, hits[0], threshold)
+    except Exception as e:
+        print(f"Error checking cache: {e}")
+
+    misses = [lookup for lookup in pending if not lookup.hit]
+    for _ in misses:
+        _count("semantic", "misses")
+    print(f"🧊 Batch cache lookup: {len(by_key)} unique prompt(s), {len(misses)} miss(es)")
+    return lookups
+
+async def save_to_cache(messages: list, response: dict, lookup: Optional[CacheLookup] = None):
+    """Make the response visible in L1 immediately and queue the shared
+    tiers (Redis + vector store) for the background writer"""
+    if lookup is None:
+        lookup = _new_lookup(messages)
+
+    l1_cache.set(lookup.key, _exact_entry(response, point_id(lookup.key)))
+    await cache_writer.submit((lookup, response, time.time()))
+
+async def _write_batch(items: list):
+    """CacheWriter flush: one Redis pipeline and one upsert per batch"""
+    with STAGE_SECONDS.time("cache_write"):
+        await _write_items(items)
+
+async def _write_items(items: list):
+    touches = [item for item in items if isinstance(item, CacheTouch)]
+    items = [item for item in items if not isinstance(item, CacheTouch)]
+    if l2_cache is not None and items:
+        await l2_cache.set_many([(lookup.key, _exact_entry(response, point_id(lookup.key)))
+                                 for lookup, response, _ in items])
 
-def save_to_cache(messages: list, response: dict):
     if not CACHE_ENABLED:
         return
+    if touches:
+        await _write_touches(touches)
+    if not items:
+        return
 
-    try:
-        prompt_text = _get_prompt_text(messages)
-        vector = embedding_model.encode(prompt_text).tolist()
-        
-        client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=[
-                models.PointStruct(
-                    id=abs(hash(prompt_text)), # Simple deterministic ID
-                    vector=vector,
-                    payload={
-                        "prompt": prompt_text,
-                        "response": response
-                    }
-                )
-            ]
+    # Reuse the lookup vectors; the embedder batches and memoizes the rest
+    missing = [lookup for lookup, _, _ in items if lookup.vector is None]
+    if missing:
+        vectors = await asyncio.gather(*[embedder.encode(lookup.prompt_text) for lookup in missing])
+        for lookup, vector in zip(missing, vectors):
+            lookup.vector = vector
+
+    points = {}
+    for lookup, response, created_at in items:
+        points[lookup.key] = StoredPoint(
+            id=point_id(lookup.key),
+            vector=lookup.vector,
+            payload={
+                "key": lookup.key,
+                "prompt": lookup.prompt_text,
+                "response": response,
+                "created_at": created_at,
+                "last_hit_at": created_at,
+                "hit_count": 0,
+            }
         )
-        print("Saved response to cache")
-    except Exception as e:
-        print(f"Error saving to cache: {e}")
+    await store.upsert(list(points.values()))
+    print(f"Saved {len(points)} response(s) to cache")
+
+async def _write_touches(touches: list):
+    """Fold a batch of hits into each point's last_hit_at / hit_count"""
+    hits = {}
+    for touch in touches:
+        count, last = hits.get(touch.point, (0, 0.0))
+        hits[touch.point] = (count + 1, max(last, touch.hit_at))
+    current = await store.get_payloads(list(hits), ["hit_count"])
+    # Points evicted or re-keyed since the hit are skipped
+    await store.set_payloads({
+        point: {"last_hit_at": last, "hit_count": current[point].get("hit_count", 0) + count}
+        for point, (count, last) in hits.items() if point in current
+    })
 
-def clear_cache():
-    """Wipe the entire cache collection"""
+# Cache persistence happens off the response path (CACHE_WRITE_* settings)
+cache_writer = CacheWriter(_write_batch)
+
+def _is_expired(payload: dict, now: float = None) -> bool:
+    if settings.CACHE_TTL_SECONDS <= 0:
+        return False
+    created_at = payload.get("created_at")
+    if created_at is None:
+        return False  # legacy entry, backfilled by the next eviction run
+    return (now or time.time()) - created_at > settings.CACHE_TTL_SECONDS
+
+def _eviction_order(point) -> tuple:
+    """Sort key: entries that sort first are evicted first"""
+    payload = point.payload or {}
+    last_hit = payload.get("last_hit_at") or payload.get("created_at") or 0
+    if settings.CACHE_EVICTION_POLICY == "lfu":
+        return (payload.get("hit_count", 0), last_hit)
+    return (last_hit,)
+
+async def _delete_points(ids: list):
+    batch_size = settings.CACHE_EVICTION_BATCH_SIZE
+    for i in range(0, len(ids), batch_size):
+        await store.delete(ids[i:i + batch_size])
+
+async def evict_once() -> dict:
+    """Delete expired entries, then trim to CACHE_MAX_ENTRIES using the
+    configured LRU/LFU policy. Returns what was removed in this run."""
+    now = time.time()
+    points = []
+    async for batch in store.scroll(settings.CACHE_EVICTION_BATCH_SIZE, ["created_at", "last_hit_at", "hit_count"]):
+        points.extend(batch)
+
+    # Entries written before metadata existed start their TTL now
+    legacy = {p.id for p in points if (p.payload or {}).get("created_at") is None}
+    if legacy:
+        await store.set_payload(list(legacy), {"created_at": now, "last_hit_at": now, "hit_count": 0})
+        for p in points:
+            if p.id in legacy:
+                p.payload = {"created_at": now, "last_hit_at": now, "hit_count": 0}
+
+    expired = [p.id for p in points if _is_expired(p.payload or {}, now)]
+    expired_set = set(expired)
+    live = [p for p in points if p.id not in expired_set]
+
+    overflow = []
+    if settings.CACHE_MAX_ENTRIES > 0 and len(live) > settings.CACHE_MAX_ENTRIES:
+        live.sort(key=_eviction_order)
+        overflow = [p.id for p in live[:len(live) - settings.CACHE_MAX_ENTRIES]]
+
+    await _delete_points(expired + overflow)
+
+    EVICTION_STATS["runs"] += 1
+    EVICTION_STATS["evicted_ttl"] += len(expired)
+    EVICTION_STATS["evicted_capacity"] += len(overflow)
+    EVICTION_STATS["last_run"] = now
+    if expired or overflow:
+        print(f"🧹 Cache eviction: {len(expired)} expired, {len(overflow)} over capacity")
+    return {"expired": len(expired), "capacity": len(overflow)}
+
+async def eviction_loop():
+    """Background task: run evict_once every CACHE_EVICTION_INTERVAL_SECONDS"""
+    while True:
+        if CACHE_ENABLED:
+            try:
+                await evict_once()
+                await store.persist()
+            except Exception as e:
+                print(f"Error during cache eviction: {e}")
+        await asyncio.sleep(settings.CACHE_EVICTION_INTERVAL_SECONDS)
+
+async def get_cache_stats() -> dict:
+    size = 0
+    if CACHE_ENABLED:
+        try:
+            size = await store.count()
+        except Exception as e:
+            print(f"Error counting cache entries: {e}")
+    return {
+        "size": size,
+        "max_entries": settings.CACHE_MAX_ENTRIES,
+        "ttl_seconds": settings.CACHE_TTL_SECONDS,
+        "policy": settings.CACHE_EVICTION_POLICY,
+        "backend": store.name if store is not None else settings.CACHE_BACKEND,
+        **EVICTION_STATS,
+        "writer": cache_writer.get_stats(),
+    }
+
+async def clear_cache():
+    """Wipe the entire cache collection and the exact-match tiers"""
+    l1_cache.clear()
+    if l2_cache is not None:
+        await l2_cache.clear()
+    for tier in CACHE_STATS.values():
+        tier["hits"] = 0
+        tier["misses"] = 0
+    if store is None:
+        return True
     try:
-        client.delete_collection(COLLECTION_NAME)
-        print(f"🗑️ Deleted collection: {COLLECTION_NAME}")
-        # Re-init immediately
-        init_cache()
+        await store.clear()
         return True
     except Exception as e:
         print(f"Error clearing cache: {e}")
         return False
 
-# Initialize on module load
-init_cache()
+async def close_cache():
+    """Flush queued writes and release the vector store and model worker"""
+    await cache_writer.close()
+    if store is not None:
+        await store.close()
+    await embedder.close()
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from app.core.config import settings
+
+
+class CacheWriter:
+    """
+    Write-behind queue for cache persistence. save_to_cache enqueues and
+    returns immediately; a background task drains the queue and hands
+    batches to flush_fn, so response latency never depends on store writes.
+    """
+
+    def __init__(self, flush_fn, max_queue: int = None, batch_size: int = None,
+                 max_wait_ms: float = None, overflow: str = None):
+        self.flush_fn = flush_fn
+        self.max_queue = max_queue or settings.CACHE_WRITE_QUEUE_SIZE
+        self.batch_size = batch_size or settings.CACHE_WRITE_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.CACHE_WRITE_MAX_WAIT_MS) / 1000.0
+        self.overflow = overflow or settings.CACHE_WRITE_OVERFLOW  # "drop" or "block"
+        self._queue = None
+        self._worker = None
+        self._closing = False
+        self.stats = {
+            "queued": 0,
+            "written": 0,
+            "dropped": 0,
+            "batches": 0,
+            "errors": 0,
+        }
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item) -> bool:
+        """Queue one write. Returns False if it was dropped."""
+        if self._closing:
+            self.stats["dropped"] += 1
+            return False
+        self._ensure_worker()
+        if self.overflow == "block":
+            await self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.stats["dropped"] += 1
+                return False
+        self.stats["queued"] += 1
+        return True
+
+    async def _collect_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: list):
+        try:
+            await self.flush_fn(batch)
+            self.stats["written"] += len(batch)
+            self.stats["batches"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"Error writing {len(batch)} cache entries: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            await self._write(batch)
+
+    async def close(self, timeout: float = 10.0):
+        """Stop accepting writes and flush everything still pending"""
+        self._closing = True
+        if self._worker is None:
+            return
+        pending = self._queue.qsize()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            if pending:
+                print(f"Flushed cache writer ({pending} queued at shutdown)")
+        except asyncio.TimeoutError:
+            print(f"⚠️ Gave up flushing cache writes after {timeout}s ({self._queue.qsize()} lost)")
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "overflow": self.overflow,
+        }
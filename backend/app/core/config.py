@@ -12,8 +12,134 @@ class Settings(BaseSettings):
 
     REDIS_URL: str = "redis://redis:6379"
     QDRANT_URL: str = "http://qdrant:6333"
+    QDRANT_PATH: str = "./qdrant_data"
+
+    # Semantic cache vector store: "qdrant" (QDRANT_MODE below) or "numpy" (in-process index, single worker)
+    CACHE_BACKEND: str = "qdrant"
+    NUMPY_INDEX_PATH: str = "./numpy_index"
+    NUMPY_INDEX_DTYPE: str = "float32"  # float16 halves memory but has no BLAS fast path
+    QDRANT_MODE: str = "local"  # "local" (embedded, single process) or "server" (QDRANT_URL)
+    QDRANT_API_KEY: Optional[str] = None
+    QDRANT_PREFER_GRPC: bool = True
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_TIMEOUT_SECONDS: int = 5
+    QDRANT_POOL_SIZE: int = 20
     LM_STUDIO_URL: str = "http://localhost:1234/v1"
 
+    # Upstream provider HTTP clients (one pooled client per provider)
+    HTTP2_ENABLED: bool = True
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    GROQ_TIMEOUT_SECONDS: float = 30.0
+    OPENAI_TIMEOUT_SECONDS: float = 60.0
+    GEMINI_TIMEOUT_SECONDS: float = 30.0
+    LOCAL_LLM_TIMEOUT_SECONDS: float = 120.0
+
+    # Provider registry and routing policy
+    PROVIDERS_FILE: Optional[str] = None  # JSON overrides/additions, see app/services/registry.py
+    ROUTING_POLICY: str = "cost"  # "cost", "latency" or "cost_under_slo"
+    ROUTING_LATENCY_SLO_MS: float = 5000.0
+    ROUTING_EXPECTED_OUTPUT_TOKENS: int = 512
+    TOKENIZER_LOAD_TIMEOUT_SECONDS: float = 10.0  # tiktoken may download its BPE file on first use
+    SAVINGS_BASELINE_PROVIDER: str = "openai"
+
+    # Complexity classifier (nearest centroid over the cache embedding)
+    COMPLEXITY_MODEL_PATH: str = "./complexity_model.json"  # written by app.scripts.fit_complexity
+    COMPLEXITY_EXAMPLES_PATH: str = "./data/complexity_examples.jsonl"  # fitted at startup if no model file
+
+    # Per-provider RPM/TPM scheduling: wait up to this long for quota, else spill over
+    RATE_LIMIT_MAX_WAIT_SECONDS: float = 2.0
+    RATE_LIMIT_LAST_RESORT_WAIT_SECONDS: float = 30.0  # when no other provider is left
+    RATE_LIMIT_MAX_QUEUE: int = 50
+    RATE_LIMIT_DEFAULT_RETRY_SECONDS: float = 5.0
+    # Groq's limits depend on the account's plan. Unset, the per-minute token limit is
+    # learned from x-ratelimit-* headers and requests are only held back after a 429
+    GROQ_RPM: Optional[int] = None
+    GROQ_TPM: Optional[int] = None
+
+    # Local LLM admission: concurrent generations, queue bound, and the expected
+    # queue wait beyond which complex queries spill over to a cloud provider
+    LOCAL_MAX_CONCURRENCY: int = 2
+    LOCAL_MAX_QUEUE: int = 16
+    LOCAL_QUEUE_WAIT_BUDGET_SECONDS: float = 15.0
+    ADMISSION_DEFAULT_SERVICE_SECONDS: float = 10.0  # until a provider has latency samples
+
+    # Rolling provider latency and hedged requests
+    LATENCY_EWMA_ALPHA: float = 0.2
+    LATENCY_WINDOW: int = 200
+    LATENCY_STALE_SECONDS: int = 300
+    HEDGE_ENABLED: bool = False
+    HEDGE_MIN_SAMPLES: int = 20
+
+    # Per-provider circuit breakers and background health probes
+    CIRCUIT_WINDOW_SECONDS: float = 60.0
+    CIRCUIT_MIN_CALLS: int = 5
+    CIRCUIT_ERROR_RATE: float = 0.5
+    CIRCUIT_CONSECUTIVE_FAILURES: int = 3
+    CIRCUIT_OPEN_SECONDS: float = 30.0
+    CIRCUIT_PROBE_INTERVAL_SECONDS: float = 10.0
+    CIRCUIT_PROBE_TIMEOUT_SECONDS: float = 2.0
+
+    # Batch jobs (/v1/batches): size cap, a job's requests in flight, retries
+    # after rate limits, and how many jobs each worker remembers
+    BATCH_MAX_REQUESTS: int = 10000
+    BATCH_MAX_CONCURRENCY: int = 8
+    BATCH_MAX_RETRIES: int = 3
+    BATCH_MAX_JOBS: int = 100
+
+    # Document extraction (/api/parse-document): upload and page limits, the
+    # process pool that extracts PDF pages, and a content-hash result cache
+    DOCUMENT_MAX_BYTES: int = 50 * 1024 * 1024
+    DOCUMENT_MAX_PAGES: int = 1000
+    DOCUMENT_WORKERS: int = 2
+    DOCUMENT_PAGES_PER_CHUNK: int = 16
+    DOCUMENT_CACHE_ENTRIES: int = 64
+    DOCUMENT_CACHE_TTL_SECONDS: float = 3600.0
+
+    # Embedding micro-batching (semantic cache)
+    EMBED_MAX_BATCH_SIZE: int = 32
+    EMBED_MAX_WAIT_MS: float = 5.0
+    EMBED_MEMO_SIZE: int = 512
+
+    # Canonical cache key: caps on the text that reaches the tokenizer
+    CACHE_KEY_MAX_CHARS: int = 1024
+    CACHE_KEY_BLOCK_CHARS: int = 384
+
+    # Semantic cache size bounds (0 disables the limit)
+    CACHE_MAX_ENTRIES: int = 50000
+    CACHE_TTL_SECONDS: float = 7 * 24 * 3600
+    CACHE_EVICTION_POLICY: str = "lru"  # "lru" or "lfu"
+    CACHE_EVICTION_INTERVAL_SECONDS: float = 300.0
+    CACHE_EVICTION_BATCH_SIZE: int = 1000
+
+    # Write-behind cache persistence
+    CACHE_WRITE_QUEUE_SIZE: int = 1000
+    CACHE_WRITE_BATCH_SIZE: int = 64
+    CACHE_WRITE_MAX_WAIT_MS: float = 50.0
+    CACHE_WRITE_OVERFLOW: str = "drop"  # "drop" or "block"
+
+    # Exact-match cache tiers in front of the semantic lookup
+    L1_CACHE_MAX_ENTRIES: int = 2048
+    L1_CACHE_TTL_SECONDS: float = 3600.0
+    REDIS_CACHE_ENABLED: bool = True
+    REDIS_CACHE_TTL_SECONDS: int = 86400
+    REDIS_TIMEOUT_SECONDS: float = 0.25
+
+    # Dashboard stats: "redis" sums every worker's counts (this process only while
+    # Redis is unreachable), "local" keeps them per process
+    STATS_BACKEND: str = "redis"
+    STATS_FLUSH_INTERVAL_SECONDS: float = 1.0
+
+    # Live dashboard stream (/api/stats/stream): at most one update per interval,
+    # a rebuild at least every refresh (other workers' traffic), idle keepalives
+    STATS_STREAM_MIN_INTERVAL_SECONDS: float = 0.5
+    STATS_STREAM_REFRESH_SECONDS: float = 5.0
+    STATS_STREAM_KEEPALIVE_SECONDS: float = 15.0
+    STATS_STREAM_CLIENT_QUEUE: int = 32
+    STATS_STREAM_RETRY_MS: int = 3000
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+
+
+class EmbeddingBatcher:
+    """
+    Runs SentenceTransformer encodes off the event loop and coalesces
+    prompts that arrive within a short window into one batched encode() call.
+    """
+
+    def __init__(self, model, max_batch_size: int = None, max_wait_ms: float = None, memo_size: int = None):
+        self.model = model
+        self.max_batch_size = max_batch_size or settings.EMBED_MAX_BATCH_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMBED_MAX_WAIT_MS) / 1000.0
+        # One worker thread: the model is not guaranteed thread-safe and parallel
+        # forward passes on the same CPU only contend with each other anyway.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        self._queue = None
+        self._worker = None
+        # Recent text -> vector pairs, so retries and fallback paths never re-encode
+        self.memo_size = memo_size if memo_size is not None else settings.EMBED_MEMO_SIZE
+        self._memo = OrderedDict()
+        # Texts currently queued or encoding; duplicates share the same future
+        self._pending = {}
+        self.stats = {
+            "batches": 0,
+            "items": 0,
+            "memo_hits": 0,
+            "max_batch": 0,
+            "encode_time_ms": 0.0,
+        }
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def encode(self, text: str) -> list:
+        """Embed a single text, sharing a forward pass with concurrent callers"""
+        vector = self._memo.get(text)
+        if vector is not None:
+            self._memo.move_to_end(text)
+            self.stats["memo_hits"] += 1
+            return vector
+
+        future = self._pending.get(text)
+        if future is None:
+            self._ensure_worker()
+            future = asyncio.get_running_loop().create_future()
+            self._pending[text] = future
+            await self._queue.put((text, future))
+        else:
+            self.stats["memo_hits"] += 1
+        # Shielded: one caller giving up must not cancel the vector for the others
+        return await asyncio.shield(future)
+
+    async def encode_many(self, texts: list) -> list:
+        """Embed a whole batch job's prompts: memo hits are free, the rest go
+        to the model in max_batch_size chunks. Chunks share the one encode
+        thread with interactive traffic, so single encodes can run in between."""
+        vectors = {t: self._memo[t] for t in texts if t in self._memo}
+        self.stats["memo_hits"] += sum(1 for t in texts if t in vectors)
+        missing = list(dict.fromkeys(t for t in texts if t not in vectors))
+        loop = asyncio.get_running_loop()
+        for i in range(0, len(missing), self.max_batch_size):
+            chunk = missing[i:i + self.max_batch_size]
+            start = time.perf_counter()
+            encoded = await loop.run_in_executor(self._executor, self._encode_batch, chunk)
+            self.stats["batches"] += 1
+            self.stats["items"] += len(chunk)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(chunk))
+            self.stats["encode_time_ms"] += (time.perf_counter() - start) * 1000
+            for text, vector in zip(chunk, encoded):
+                vectors[text] = vector
+                self._remember(text, vector)
+        return [vectors[t] for t in texts]
+
+    def _remember(self, text: str, vector: list):
+        if self.memo_size <= 0:
+            return
+        self._memo[text] = vector
+        self._memo.move_to_end(text)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+    async def _collect_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            texts = [text for text, _ in batch]
+            start = time.perf_counter()
+            try:
+                vectors = await loop.run_in_executor(self._executor, self._encode_batch, texts)
+            except Exception as e:
+                for text, fut in batch:
+                    self._pending.pop(text, None)
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            self.stats["encode_time_ms"] += (time.perf_counter() - start) * 1000
+
+            for (text, fut), vector in zip(batch, vectors):
+                self._pending.pop(text, None)
+                self._remember(text, vector)
+                if not fut.done():
+                    fut.set_result(vector)
+
+    def _encode_batch(self, texts: list) -> list:
+        return self.model.encode(texts, batch_size=len(texts)).tolist()
+
+    def get_stats(self) -> dict:
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "encode_time_ms": round(self.stats["encode_time_ms"], 2),
+            "avg_batch_size": round(self.stats["items"] / batches, 2) if batches else 0,
+        }
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,122 @@
+import json
+import time
+from collections import OrderedDict
+import redis.asyncio as redis
+from app.core.config import settings
+
+REDIS_KEY_PREFIX = "smartroute:cache:"
+
+
+class LRUTTLCache:
+    """Bounded in-process LRU with a per-entry TTL. Values are stored serialized
+    so every hit hands out a fresh copy the caller is free to mutate."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._data = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, raw = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return json.loads(raw)
+
+    def set(self, key: str, value: dict):
+        self._data[key] = (time.monotonic() + self.ttl, json.dumps(value))
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisTier:
+    """Shared exact-match tier. Any Redis error disables the tier for a short
+    backoff so an unreachable server can't add a timeout to every request."""
+
+    def __init__(self, url: str, ttl_seconds: int, timeout: float, retry_after: float = 30.0):
+        self.ttl = ttl_seconds
+        self.retry_after = retry_after
+        self._disabled_until = 0.0
+        self._client = redis.from_url(
+            url,
+            socket_timeout=timeout,
+            socket_connect_timeout=timeout,
+        )
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._disabled_until
+
+    def _fail(self, e: Exception):
+        print(f"⚠️ Redis cache tier unavailable ({e}). Retrying in {self.retry_after:.0f}s")
+        self._disabled_until = time.monotonic() + self.retry_after
+
+    async def get(self, key: str):
+        if not self.available:
+            return None
+        try:
+            raw = await self._client.get(REDIS_KEY_PREFIX + key)
+        except Exception as e:
+            self._fail(e)
+            return None
+        return json.loads(raw) if raw else None
+
+    async def get_many(self, keys: list) -> list:
+        """Values for several keys in one MGET (None where missing)"""
+        if not self.available or not keys:
+            return [None] * len(keys)
+        try:
+            raws = await self._client.mget([REDIS_KEY_PREFIX + k for k in keys])
+        except Exception as e:
+            self._fail(e)
+            return [None] * len(keys)
+        return [json.loads(raw) if raw else None for raw in raws]
+
+    async def set(self, key: str, value: dict):
+        if not self.available:
+            return
+        try:
+            await self._client.set(REDIS_KEY_PREFIX + key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            self._fail(e)
+
+    async def set_many(self, items: list):
+        """Write several (key, value) pairs in one round trip"""
+        if not self.available or not items:
+            return
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for key, value in items:
+                pipe.set(REDIS_KEY_PREFIX + key, json.dumps(value), ex=self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            self._fail(e)
+
+    async def clear(self):
+        if not self.available:
+            return
+        try:
+            keys = [k async for k in self._client.scan_iter(match=REDIS_KEY_PREFIX + "*", count=500)]
+            for i in range(0, len(keys), 500):
+                await self._client.delete(*keys[i:i + 500])
+        except Exception as e:
+            self._fail(e)
+
+
+l1_cache = LRUTTLCache(settings.L1_CACHE_MAX_ENTRIES, settings.L1_CACHE_TTL_SECONDS)
+l2_cache = (
+    RedisTier(settings.REDIS_URL, settings.REDIS_CACHE_TTL_SECONDS, settings.REDIS_TIMEOUT_SECONDS)
+    if settings.REDIS_CACHE_ENABLED
+    else None
+)
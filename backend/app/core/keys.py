@@ -0,0 +1,96 @@
+import hashlib
+import uuid
+from dataclasses import dataclass
+from app.core.config import settings
+
+# Aliases seen from the extension / older clients
+ROLE_ALIASES = {
+    "human": "user",
+    "ai": "assistant",
+    "bot": "assistant",
+    "model": "assistant",
+    "developer": "system",
+}
+
+
+@dataclass(frozen=True)
+class CacheKey:
+    text: str    # bounded text handed to the embedding model
+    digest: str  # sha256 over the full normalized conversation (exact-match key)
+
+
+def _normalize_role(role) -> str:
+    role = str(role or "user").strip().lower()
+    return ROLE_ALIASES.get(role, role)
+
+
+def _normalize_content(content) -> str:
+    # OpenAI-style content parts: [{"type": "text", "text": "..."}, ...]
+    if isinstance(content, list):
+        content = " ".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return " ".join(str(content or "").split())
+
+
+def _summarize(content: str, limit: int) -> str:
+    """Keep the head of a long block and replace the rest with a short digest,
+    so two documents sharing an opening still produce different keys"""
+    if len(content) <= limit:
+        return content
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+    return f"{content[:limit]} [doc:{digest} {len(content)} chars]"
+
+
+def build_cache_key(messages: list, max_chars: int = None, block_chars: int = None) -> CacheKey:
+    """
+    Canonical cache key for a chat request.
+
+    The digest covers every turn (normalized role + whitespace-collapsed
+    content). The embedding text puts the most recent user turn first, then
+    system prompts, then earlier turns newest-first, with long blocks
+    hash-summarized and the whole thing capped at max_chars, so encode cost
+    stays flat no matter how long the conversation gets.
+    """
+    max_chars = max_chars or settings.CACHE_KEY_MAX_CHARS
+    block_chars = block_chars or settings.CACHE_KEY_BLOCK_CHARS
+
+    turns = [(_normalize_role(m.get("role")), _normalize_content(m.get("content"))) for m in messages]
+
+    hasher = hashlib.sha256()
+    for role, content in turns:
+        hasher.update(role.encode("utf-8"))
+        hasher.update(b"\x00")
+        hasher.update(content.encode("utf-8"))
+        hasher.update(b"\x01")
+
+    last_user = next((i for i in range(len(turns) - 1, -1, -1) if turns[i][0] == "user"), None)
+    ordered = []
+    if last_user is not None:
+        ordered.append(last_user)
+    ordered += [i for i, (role, _) in enumerate(turns) if role == "system" and i != last_user]
+    seen = set(ordered)
+    ordered += [i for i in range(len(turns) - 1, -1, -1) if i not in seen]
+
+    parts = []
+    used = 0
+    for i in ordered:
+        if used >= max_chars:
+            break
+        role, content = turns[i]
+        if not content:
+            continue
+        # The latest question may use most of the budget; context blocks get summarized
+        limit = max(block_chars, max_chars - 64) if i == last_user else block_chars
+        part = f"{role}: {_summarize(content, limit)}"
+        parts.append(part)
+        used += len(part) + 1
+
+    return CacheKey(text="\n".join(parts)[:max_chars], digest=hasher.hexdigest())
+
+
+def point_id(digest: str) -> str:
+    """Stable, content-addressed vector-store ID for a CacheKey.digest.
+    Unlike hash(), this is identical across restarts and workers."""
+    return str(uuid.UUID(bytes=bytes.fromhex(digest)[:16]))
@@ -0,0 +1,186 @@
+import os
+import time
+from bisect import bisect_left
+
+# Prometheus text exposition (format 0.0.4), served by GET /metrics.
+# Recording is a dict lookup plus a couple of additions, so it stays on in
+# the hot path; all the formatting work happens when the endpoint is scraped.
+# Values are per process and never reset (Prometheus handles restarts).
+# Every series carries a `worker` label (the process id): under
+# `--workers N` a scrape reaches one worker, and the label keeps each
+# worker's counters a separate monotonic series instead of one that jumps
+# between workers. Aggregate with `sum without (worker)`.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: in-process stages take microseconds, upstream calls take seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_METRICS = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'worker="{os.getpid()}"'] + [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _METRICS.append(self)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list:
+        lines = self._header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def track(self, *labels) -> "_InFlight":
+        """`with gauge.track(...)`: +1 for the duration of the block"""
+        return _InFlight(self, labels)
+
+
+class _InFlight:
+    __slots__ = ("gauge", "labels")
+
+    def __init__(self, gauge: Gauge, labels: tuple):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(*self.labels)
+
+    def __exit__(self, *exc):
+        self.gauge.dec(*self.labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            # Per-bucket counts (made cumulative at render time), then sum
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def bucket_counts(self) -> list:
+        """Per-bucket (non-cumulative) counts summed over every label set"""
+        totals = [0] * (len(self.buckets) + 1)
+        for counts, _ in self._values.values():
+            for i, count in enumerate(counts):
+                totals[i] += count
+        return totals
+
+    def time(self, *labels) -> "_Timer":
+        """`with histogram.time(...)`: observe the block's wall time"""
+        return _Timer(self, labels)
+
+    def render(self) -> list:
+        lines = self._header()
+        bounds = self.buckets + (float("inf"),)
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, labels, le)} {cumulative}")
+            label_text = _label_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_number(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+# --- SmartRoute metrics ---
+
+# canonicalize, embed, vector_search, classify, cache_write
+STAGE_SECONDS = Histogram(
+    "smartroute_stage_duration_seconds", "Time spent in each request-pipeline stage", ("stage",))
+UPSTREAM_SECONDS = Histogram(
+    "smartroute_upstream_duration_seconds", "Upstream LLM call time (to last byte)", ("provider", "outcome"))
+REQUEST_SECONDS = Histogram(
+    "smartroute_request_duration_seconds", "End-to-end request time", ("endpoint", "result"))
+
+CACHE_LOOKUPS = Counter(
+    "smartroute_cache_lookups_total", "Cache lookups by cache tier (l1, l2, semantic) and result", ("cache", "result"))
+ROUTED = Counter(
+    "smartroute_routed_requests_total", "Requests answered upstream, by provider and complexity tier", ("provider", "tier"))
+FALLBACKS = Counter(
+    "smartroute_fallbacks_total", "Requests answered by a provider other than the first choice", ("provider", "tier"))
+UPSTREAM_ERRORS = Counter(
+    "smartroute_upstream_errors_total", "Failed or skipped provider attempts", ("provider", "tier", "reason"))
+FAILED = Counter(
+    "smartroute_failed_requests_total", "Requests no provider could answer", ("tier",))
+
+IN_FLIGHT = Gauge(
+    "smartroute_requests_in_flight", "Requests currently being handled", ("endpoint",))
+UPSTREAM_IN_FLIGHT = Gauge(
+    "smartroute_upstream_in_flight", "Upstream calls currently open", ("provider",))
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,466 @@
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Optional
+import httpx
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models
+from app.core.config import settings
+
+try:
+    import fcntl  # directory lock for the NumPy index (POSIX only)
+except ImportError:
+    fcntl = None
+
+VECTOR_SIZE = 384  # Output size of MiniLM-L6
+
+
+@dataclass
+class VectorHit:
+    """Search result. The payload may be the store's own object (local modes),
+    so callers must copy before mutating it."""
+    id: str
+    score: float
+    payload: dict
+
+
+@dataclass
+class StoredPoint:
+    id: str
+    payload: dict = field(default_factory=dict)
+    vector: Optional[list] = None
+
+
+class CacheBackend(ABC):
+    """Vector store behind the semantic cache tier. All methods are awaited
+    from the event loop; implementations must not block it for long."""
+
+    name = "base"
+
+    @abstractmethod
+    async def init(self):
+        """Create or load the index"""
+
+    @abstractmethod
+    async def search(self, vector: list, limit: int = 1) -> list:
+        """Return up to `limit` VectorHits, best (highest cosine) first"""
+
+    async def search_many(self, vectors: list, limit: int = 1) -> list:
+        """search() for several query vectors: one list of VectorHits per vector"""
+        return [await self.search(v, limit) for v in vectors]
+
+    @abstractmethod
+    async def upsert(self, points: list):
+        """Insert or replace StoredPoints by id"""
+
+    @abstractmethod
+    async def delete(self, ids: list):
+        """Remove points by id"""
+
+    @abstractmethod
+    async def clear(self):
+        """Drop every point"""
+
+    @abstractmethod
+    async def count(self) -> int:
+        """Number of stored points"""
+
+    @abstractmethod
+    async def scroll(self, batch_size: int, fields: list = None):
+        """Async-iterate over stored points (without vectors) in batches"""
+
+    @abstractmethod
+    async def set_payload(self, ids: list, payload: dict):
+        """Merge `payload` into the payload of each point"""
+
+    async def set_payloads(self, updates: dict):
+        """set_payload with a different payload per point ({id: payload})"""
+        for pid, payload in updates.items():
+            await self.set_payload([pid], payload)
+
+    @abstractmethod
+    async def get_payloads(self, ids: list, fields: list = None) -> dict:
+        """{id: payload} for the points that exist, restricted to `fields` if given"""
+
+    async def persist(self):
+        """Flush in-memory state to disk (no-op for stores that persist on write)"""
+
+    async def close(self):
+        """Release connections / files"""
+
+
+class QdrantBackend(CacheBackend):
+    name = "qdrant"
+
+    def __init__(self, collection: str):
+        self.collection = collection
+        self.client = self._create_client()
+        self.name = f"qdrant-{settings.QDRANT_MODE}"
+
+    @staticmethod
+    def _create_client() -> AsyncQdrantClient:
+        if settings.QDRANT_MODE == "server":
+            # Shared Qdrant server: safe with `--workers N` and multiple replicas.
+            # One client per process keeps a pool of keep-alive HTTP/gRPC connections.
+            print(f"Connecting to Qdrant server at {settings.QDRANT_URL} (gRPC: {settings.QDRANT_PREFER_GRPC})")
+            return AsyncQdrantClient(
+                url=settings.QDRANT_URL,
+                api_key=settings.QDRANT_API_KEY,
+                prefer_grpc=settings.QDRANT_PREFER_GRPC,
+                grpc_port=settings.QDRANT_GRPC_PORT,
+                timeout=settings.QDRANT_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=settings.QDRANT_POOL_SIZE,
+                    max_keepalive_connections=settings.QDRANT_POOL_SIZE,
+                ),
+                grpc_options={
+                    "grpc.keepalive_time_ms": 30000,
+                    "grpc.keepalive_permit_without_calls": 1,
+                },
+            )
+        # Local Mode (saves to disk, no Docker needed). Locks the directory, so
+        # only a single worker process can use it.
+        return AsyncQdrantClient(path=settings.QDRANT_PATH)
+
+    async def init(self):
+        collections = await self.client.get_collections()
+        if self.collection not in [c.name for c in collections.collections]:
+            await self.client.create_collection(
+                collection_name=self.collection,
+                vectors_config=models.VectorParams(
+                    size=VECTOR_SIZE,
+                    distance=models.Distance.COSINE
+                )
+            )
+            print(f"Created Qdrant collection: {self.collection}")
+
+    async def search(self, vector: list, limit: int = 1) -> list:
+        results = await self.client.search(
+            collection_name=self.collection,
+            query_vector=vector,
+            limit=limit
+        )
+        return [VectorHit(id=r.id, score=r.score, payload=r.payload or {}) for r in results]
+
+    async def search_many(self, vectors: list, limit: int = 1) -> list:
+        # One round trip for the whole batch
+        batches = await self.client.search_batch(
+            collection_name=self.collection,
+            requests=[models.SearchRequest(vector=v, limit=limit, with_payload=True) for v in vectors],
+        )
+        return [[VectorHit(id=r.id, score=r.score, payload=r.payload or {}) for r in results]
+                for results in batches]
+
+    async def upsert(self, points: list):
+        await self.client.upsert(
+            collection_name=self.collection,
+            points=[models.PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points],
+        )
+
+    async def delete(self, ids: list):
+        await self.client.delete(
+            collection_name=self.collection,
+            points_selector=models.PointIdsList(points=ids),
+        )
+
+    async def clear(self):
+        await self.client.delete_collection(self.collection)
+        print(f"🗑️ Deleted collection: {self.collection}")
+        await self.init()
+
+    async def count(self) -> int:
+        return (await self.client.count(collection_name=self.collection, exact=False)).count
+
+    async def scroll(self, batch_size: int, fields: list = None):
+        offset = None
+        while True:
+            points, offset = await self.client.scroll(
+                collection_name=self.collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=fields if fields is not None else True,
+                with_vectors=False,
+            )
+            yield [StoredPoint(id=p.id, payload=p.payload or {}) for p in points]
+            if offset is None:
+                break
+
+    async def set_payload(self, ids: list, payload: dict):
+        await self.client.set_payload(collection_name=self.collection, payload=payload, points=ids)
+
+    async def set_payloads(self, updates: dict):
+        if not updates:
+            return
+        # One round trip for the whole batch
+        await self.client.batch_update_points(
+            collection_name=self.collection,
+            update_operations=[
+                models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[pid]))
+                for pid, payload in updates.items()
+            ],
+        )
+
+    async def get_payloads(self, ids: list, fields: list = None) -> dict:
+        records = await self.client.retrieve(
+            collection_name=self.collection,
+            ids=ids,
+            with_payload=fields if fields is not None else True,
+            with_vectors=False,
+        )
+        return {r.id: r.payload or {} for r in records}
+
+    async def close(self):
+        await self.client.close()
+
+
+class NumpyBackend(CacheBackend):
+    """
+    In-process exact index: one contiguous matrix of L2-normalized vectors,
+    so a lookup is a single matrix-vector product. Rows are preallocated and
+    grown geometrically; deletes move the last row into the hole to keep the
+    live rows contiguous. State is saved to `path` by persist() and close().
+    Like local Qdrant, the directory is locked, so only a single worker
+    process can use it; run `--workers N` against a Qdrant server instead.
+    """
+
+    name = "numpy"
+    SEARCH_BLOCK = 64  # queries per matrix product in search_many
+
+    def __init__(self, path: str, dim: int = VECTOR_SIZE, dtype: str = None, initial_capacity: int = 1024):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype or settings.NUMPY_INDEX_DTYPE)
+        self._initial_capacity = initial_capacity
+        self._lock_file = None
+        self._persist_lock = asyncio.Lock()
+        self._reset(initial_capacity)
+
+    def _reset(self, capacity: int):
+        self._vectors = np.zeros((capacity, self.dim), dtype=self.dtype)
+        self._ids = []
+        self._payloads = []
+        self._row_of = {}
+        self._dirty = False
+
+    def _grow(self, needed: int):
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        grown = np.zeros((capacity, self.dim), dtype=self.dtype)
+        grown[:len(self._ids)] = self._vectors[:len(self._ids)]
+        self._vectors = grown
+
+    def _normalize(self, vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def _lock(self):
+        if fcntl is None or self._lock_file is not None:
+            return
+        lock_file = open(os.path.join(self.path, ".lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(
+                f"NumPy cache index at {self.path} is already in use by another process "
+                "(it supports a single worker; use QDRANT_MODE=server for --workers N)")
+        self._lock_file = lock_file
+
+    SNAPSHOT = "index.npz"
+    # Written by older versions as two separately replaced files
+    LEGACY_FILES = ("vectors.npy", "points.json")
+
+    @staticmethod
+    def _load(snapshot_file: str) -> tuple:
+        with np.load(snapshot_file, allow_pickle=False) as data:
+            vectors = data["vectors"]
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+        return vectors, meta
+
+    @staticmethod
+    def _load_legacy(vectors_file: str, meta_file: str) -> tuple:
+        vectors = np.load(vectors_file)
+        with open(meta_file, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return vectors, meta
+
+    async def init(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._lock()
+        snapshot_file = os.path.join(self.path, self.SNAPSHOT)
+        legacy_files = [os.path.join(self.path, name) for name in self.LEGACY_FILES]
+        if os.path.exists(snapshot_file):
+            vectors, meta = await asyncio.to_thread(self._load, snapshot_file)
+            legacy = False
+        elif all(os.path.exists(f) for f in legacy_files):
+            vectors, meta = await asyncio.to_thread(self._load_legacy, *legacy_files)
+            legacy = True
+        else:
+            print(f"Created NumPy cache index at {self.path}")
+            return
+        n = len(meta["ids"])
+        if vectors.shape != (n, self.dim) or len(meta["payloads"]) != n:
+            # Rows would map to the wrong responses (e.g. legacy files from different saves)
+            print(f"⚠️ NumPy cache index at {self.path} is inconsistent "
+                  f"({vectors.shape[0]} vectors, {n} ids). Starting empty")
+            return
+        self._reset(max(self._initial_capacity, n))
+        self._vectors[:n] = vectors[:n].astype(self.dtype)
+        self._ids = list(meta["ids"])
+        self._payloads = list(meta["payloads"])
+        self._row_of = {pid: row for row, pid in enumerate(self._ids)}
+        self._dirty = legacy  # rewritten as a single snapshot on the next persist
+        print(f"Loaded NumPy cache index: {n} entries from {self.path}")
+
+    async def search(self, vector: list, limit: int = 1) -> list:
+        n = len(self._ids)
+        if n == 0:
+            return []
+        query = self._normalize(vector).astype(self.dtype)
+        scores = self._vectors[:n] @ query
+        if limit == 1:
+            rows = [int(np.argmax(scores))]
+        else:
+            k = min(limit, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows = top[np.argsort(-scores[top])].tolist()
+        return [VectorHit(id=self._ids[r], score=float(scores[r]), payload=self._payloads[r]) for r in rows]
+
+    async def search_many(self, vectors: list, limit: int = 1) -> list:
+        # One matrix product per block of queries; the score matrix stays
+        # block x entries, and other requests get the loop between blocks
+        n = len(self._ids)
+        if n == 0:
+            return [[] for _ in vectors]
+        k = min(limit, n)
+        results = []
+        for i in range(0, len(vectors), self.SEARCH_BLOCK):
+            queries = np.stack([self._normalize(v) for v in vectors[i:i + self.SEARCH_BLOCK]]).astype(self.dtype)
+            for row_scores in queries @ self._vectors[:n].T:
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                rows = top[np.argsort(-row_scores[top])].tolist()
+                results.append([VectorHit(id=self._ids[r], score=float(row_scores[r]), payload=self._payloads[r])
+                                for r in rows])
+            await asyncio.sleep(0)
+        return results
+
+    async def upsert(self, points: list):
+        for p in points:
+            row = self._row_of.get(p.id)
+            if row is None:
+                row = len(self._ids)
+                self._grow(row + 1)
+                self._ids.append(p.id)
+                self._payloads.append(p.payload)
+                self._row_of[p.id] = row
+            else:
+                self._payloads[row] = p.payload
+            self._vectors[row] = self._normalize(p.vector)
+        self._dirty = True
+
+    async def delete(self, ids: list):
+        for pid in ids:
+            row = self._row_of.pop(pid, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = self._ids[last]
+                self._payloads[row] = self._payloads[last]
+                self._row_of[self._ids[row]] = row
+            self._ids.pop()
+            self._payloads.pop()
+        self._dirty = True
+
+    async def clear(self):
+        self._reset(self._initial_capacity)
+        self._dirty = True
+        await self.persist()
+        print(f"🗑️ Cleared NumPy cache index at {self.path}")
+
+    async def count(self) -> int:
+        return len(self._ids)
+
+    async def scroll(self, batch_size: int, fields: list = None):
+        # Snapshot ids first so callers may delete while iterating
+        ids = list(self._ids)
+        for i in range(0, len(ids), batch_size):
+            batch = []
+            for pid in ids[i:i + batch_size]:
+                row = self._row_of.get(pid)
+                if row is None:
+                    continue
+                payload = self._payloads[row]
+                if fields is not None:
+                    payload = {k: payload[k] for k in fields if k in payload}
+                batch.append(StoredPoint(id=pid, payload=dict(payload)))
+            yield batch
+
+    async def set_payload(self, ids: list, payload: dict):
+        for pid in ids:
+            row = self._row_of.get(pid)
+            if row is not None:
+                self._payloads[row] = {**self._payloads[row], **payload}
+        self._dirty = True
+
+    async def get_payloads(self, ids: list, fields: list = None) -> dict:
+        found = {}
+        for pid in ids:
+            row = self._row_of.get(pid)
+            if row is not None:
+                payload = self._payloads[row]
+                found[pid] = {k: payload[k] for k in fields if k in payload} if fields is not None else dict(payload)
+        return found
+
+    def _save(self, vectors: np.ndarray, ids: list, payloads: list):
+        os.makedirs(self.path, exist_ok=True)
+        # Vectors and ids/payloads go in one file, swapped in by a single
+        # rename, so a crash can never pair rows with another save's payloads.
+        # Per-process temp name: a stray second process can't interleave with ours
+        tmp = os.path.join(self.path, f"index.{os.getpid()}.tmp.npz")
+        meta = json.dumps({"ids": ids, "payloads": payloads}).encode("utf-8")
+        with open(tmp, "wb") as f:
+            np.savez(f, vectors=vectors, meta=np.frombuffer(meta, dtype=np.uint8))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, self.SNAPSHOT))
+        for name in self.LEGACY_FILES:
+            legacy = os.path.join(self.path, name)
+            if os.path.exists(legacy):
+                os.unlink(legacy)
+
+    async def persist(self):
+        async with self._persist_lock:
+            if not self._dirty:
+                return
+            # Snapshot on the loop, write in a thread. Payload dicts are replaced,
+            # never mutated, so shallow copies are enough
+            n = len(self._ids)
+            snapshot = (self._vectors[:n].copy(), list(self._ids), list(self._payloads))
+            self._dirty = False  # changes made while writing mark it dirty again
+            try:
+                await asyncio.to_thread(self._save, *snapshot)
+            except BaseException:
+                self._dirty = True
+                raise
+
+    async def close(self):
+        await self.persist()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+def create_backend(collection: str) -> CacheBackend:
+    """Pick the vector store from settings.CACHE_BACKEND ("qdrant" or "numpy")"""
+    if settings.CACHE_BACKEND == "numpy":
+        return NumpyBackend(settings.NUMPY_INDEX_PATH)
+    return QdrantBackend(collection)
@@ -1,8 +1,56 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
+from app.core.cache import init_cache, close_cache, eviction_loop, embedder, EMBEDDING_MODEL_NAME, READINESS
+from app.services.http_clients import http_clients
+from app.services.circuit import health_probe_loop
+from app.services.complexity import init_classifier
+from app.services.stats_store import stats_flush_loop, stats_store
+from app.services.batches import batch_manager
+from app.services.documents import document_extractor
+from app.services.usage import init_tokenizer
 
-app = FastAPI(title="SmartRoute API", version="0.1.0")
+async def warmup():
+    try:
+        _, tokenizer_ok = await asyncio.gather(init_cache(), init_tokenizer())
+        if not tokenizer_ok:
+            READINESS["degraded"].append("tokenizer")
+        # The complexity classifier needs the embedding model; keywords route until then
+        if embedder.model is None or not await init_classifier(embedder, EMBEDDING_MODEL_NAME):
+            READINESS["degraded"].append("complexity_classifier")
+    finally:
+        # Ready from here on, even if a step failed: /ready lists what is degraded
+        READINESS["warmup_done"] = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Long-lived, pooled upstream clients (keep-alive + HTTP/2)
+    await http_clients.start()
+    # Model + index load in the background so the port binds immediately;
+    # requests that arrive first skip the semantic cache (see /ready)
+    warmup_task = asyncio.create_task(warmup())
+    # Keep the semantic cache bounded (TTL + LRU/LFU) in the background
+    eviction_task = asyncio.create_task(eviction_loop())
+    # Re-check providers with open circuits so they recover without user traffic
+    probe_task = asyncio.create_task(health_probe_loop())
+    # Publish this worker's counters for the cross-worker dashboard totals
+    stats_task = asyncio.create_task(stats_flush_loop())
+    yield
+    tasks = [warmup_task, eviction_task, probe_task, stats_task]
+    for task in tasks:
+        task.cancel()
+    # Let them unwind (finally blocks, final writes) before their resources close
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await batch_manager.close()
+    document_extractor.close()
+    await stats_store.close()
+    # Don't lose responses that are still queued for the cache
+    await close_cache()
+    await http_clients.close()
+
+app = FastAPI(title="SmartRoute API", version="0.1.0", lifespan=lifespan)
 
 # CORS is important for the React Dashboard to talk to this API
 app.add_middleware(
@@ -19,9 +67,10 @@ app.include_router(router)
 async def clear_cache_endpoint():
     from app.core.cache import clear_cache
     from app.services.providers import STATS
+    from app.services.usage import reset_usage
     
-    # 1. Clear Qdrant
-    success = clear_cache()
+    # 1. Clear Qdrant + exact-match tiers
+    success = await clear_cache()
     
     # 2. Reset In-Memory Stats
     STATS["requests"] = 0
@@ -29,13 +78,19 @@ async def clear_cache_endpoint():
     STATS["cache_hits"] = 0
     STATS["cache_misses"] = 0
     STATS["total_savings"] = 0.0
-    STATS["provider_groq"] = 0
-    STATS["provider_local"] = 0
+    for key in [k for k in STATS if k.startswith("provider_")]:
+        STATS[key] = 0
+    STATS["coalesced_requests"] = 0
+    STATS["hedged_requests"] = 0
+    STATS["hedge_wins"] = 0
+    reset_usage()
     STATS["latest_request"] = {
         "type": "Waiting...",
         "provider": "Waiting...",
         "timestamp": 0
     }
+    # 3. Reset the shared (all-worker) totals and rolling windows
+    await stats_store.reset()
     
     return {"status": "success", "message": "Cache purged and stats reset"}
 
@@ -0,0 +1,98 @@
+"""
+Compare semantic-cache backends on lookup latency and memory.
+
+Loads N random unit vectors (same shape as MiniLM embeddings) into each
+backend in a scratch directory, then times single-vector searches.
+Memory is the Python-heap growth (tracemalloc) while loading, which
+covers NumPy buffers and Qdrant local-mode storage alike.
+
+    cd backend
+    python -m app.scripts.bench_backends --entries 20000 --queries 500
+    QDRANT_MODE=server python -m app.scripts.bench_backends   # against QDRANT_URL
+"""
+import argparse
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+import numpy as np
+from app.core.config import settings
+from app.core.vector_store import VECTOR_SIZE, NumpyBackend, QdrantBackend, StoredPoint
+
+
+def _random_vectors(n: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, VECTOR_SIZE)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+async def _bench(backend, vectors: np.ndarray, queries: np.ndarray, batch_size: int) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    await backend.init()
+    await backend.clear()
+    for i in range(0, len(vectors), batch_size):
+        await backend.upsert([
+            StoredPoint(id=str(uuid.uuid4()), vector=v.tolist(), payload={"response": {"i": i + j}})
+            for j, v in enumerate(vectors[i:i + batch_size])
+        ])
+    load_s = time.perf_counter() - start
+    memory_mb = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+
+    # Warm up, then time lookups one by one like the request path does
+    for q in queries[:10]:
+        await backend.search(q.tolist(), limit=1)
+    timings = []
+    for q in queries:
+        t0 = time.perf_counter()
+        await backend.search(q.tolist(), limit=1)
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+
+    await backend.close()
+    return {
+        "load_s": round(load_s, 2),
+        "memory_mb": round(memory_mb, 1),
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+    }
+
+
+async def main(entries: int, queries: int, batch_size: int, backends: list):
+    vectors = _random_vectors(entries, seed=0)
+    query_vectors = _random_vectors(queries, seed=1)
+    scratch = tempfile.mkdtemp(prefix="smartroute-bench-")
+    results = {}
+    try:
+        if "numpy" in backends:
+            results["numpy-float32"] = await _bench(
+                NumpyBackend(f"{scratch}/numpy32", dtype="float32"), vectors, query_vectors, batch_size)
+            results["numpy-float16"] = await _bench(
+                NumpyBackend(f"{scratch}/numpy16", dtype="float16"), vectors, query_vectors, batch_size)
+        if "qdrant" in backends:
+            if settings.QDRANT_MODE != "server":
+                settings.QDRANT_PATH = f"{scratch}/qdrant"
+            backend = QdrantBackend("llm_cache_bench")
+            results[backend.name] = await _bench(backend, vectors, query_vectors, batch_size)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"\n{entries} entries, {queries} lookups")
+    print(f"{'backend':<16}{'load s':>10}{'mem MB':>10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['load_s']:>10}{r['memory_mb']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['mean_ms']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark semantic-cache backends")
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--backends", nargs="+", default=["numpy", "qdrant"], choices=["numpy", "qdrant"])
+    args = parser.parse_args()
+    asyncio.run(main(args.entries, args.queries, args.batch_size, args.backends))
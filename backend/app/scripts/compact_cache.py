@@ -0,0 +1,214 @@
+"""
+Offline compaction for the semantic cache collection.
+
+Older builds keyed points by abs(hash(prompt)), which Python salts per
+process, so every restart or worker wrote a fresh duplicate of the same
+prompt. This tool scans an existing local Qdrant store, re-keys every
+point with the content-addressed ID used by save_to_cache, merges
+duplicates (newest response wins, hit counts are summed) and rewrites the
+collection in batches. Legacy entries (no stored key) are re-embedded from
+their canonical prompt text; --reembed does it for every entry.
+
+The rewrite is built and verified in a scratch collection, then upserted
+into the live one before the stale IDs are deleted, so the collection is
+never missing entries: a crash part-way leaves duplicates, not a loss, and
+re-running finishes the job.
+
+Stop the API first: local mode locks the storage directory.
+
+    cd backend
+    python -m app.scripts.compact_cache --path ./qdrant_data --dry-run
+    python -m app.scripts.compact_cache --path ./qdrant_data --reembed
+"""
+import argparse
+import hashlib
+import json
+import time
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from app.core.config import settings
+from app.core.keys import build_cache_key, point_id
+
+
+def _canonical(payload: dict):
+    """Return (digest, prompt_text) for a stored point.
+
+    Current entries carry their digest; legacy ones stored json.dumps(messages)
+    as the prompt, which we can re-canonicalize. Anything else is keyed by a
+    digest of its stored text so identical prompts still collapse together."""
+    prompt = payload.get("prompt", "")
+    if payload.get("key"):
+        return payload["key"], prompt
+    try:
+        messages = json.loads(prompt)
+        if isinstance(messages, list) and all(isinstance(m, dict) for m in messages):
+            cache_key = build_cache_key(messages)
+            return cache_key.digest, cache_key.text
+    except (TypeError, ValueError):
+        pass
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest(), prompt
+
+
+def _scroll(client: QdrantClient, collection: str, batch_size: int, with_vectors: bool):
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=with_vectors,
+        )
+        yield points
+        if offset is None:
+            break
+
+
+def _count(client: QdrantClient, collection: str) -> int:
+    return client.count(collection_name=collection, exact=True).count
+
+
+def _swap_in(client: QdrantClient, scratch: str, collection: str, batch_size: int):
+    """Make `collection` hold exactly the scratch points without ever deleting
+    it: upsert them (new IDs are added, already-canonical ones overwritten),
+    then delete the IDs that aren't in scratch. Returns the number kept."""
+    keep = set()
+    for points in _scroll(client, scratch, batch_size, with_vectors=True):
+        if points:
+            client.upsert(
+                collection_name=collection,
+                points=[models.PointStruct(id=p.id, vector=p.vector, payload=p.payload) for p in points],
+            )
+            keep.update(str(p.id) for p in points)
+    stale = []
+    for points in _scroll(client, collection, batch_size, with_vectors=False):
+        stale.extend(p.id for p in points if str(p.id) not in keep)
+    for i in range(0, len(stale), batch_size):
+        client.delete(collection_name=collection, points_selector=models.PointIdsList(points=stale[i:i + batch_size]))
+    return len(keep)
+
+
+def compact(path: str, collection: str, batch_size: int, dry_run: bool, reembed: bool,
+            keep_legacy_vectors: bool = False) -> dict:
+    client = QdrantClient(path=path)
+    vector_params = client.get_collection(collection).config.params.vectors
+
+    # Pass 1: group points by canonical key, keeping only small metadata in memory
+    groups = {}
+    total = 0
+    legacy = 0
+    for points in _scroll(client, collection, batch_size, with_vectors=False):
+        for p in points:
+            total += 1
+            payload = p.payload or {}
+            legacy += not payload.get("key")
+            digest, _ = _canonical(payload)
+            created = payload.get("created_at") or 0
+            group = groups.get(digest)
+            if group is None:
+                groups[digest] = {
+                    "winner": p.id,
+                    "created_at": created,
+                    "last_hit_at": payload.get("last_hit_at") or created,
+                    "hit_count": payload.get("hit_count", 0),
+                }
+                continue
+            if created > group["created_at"]:
+                group["winner"], group["created_at"] = p.id, created
+            group["last_hit_at"] = max(group["last_hit_at"], payload.get("last_hit_at") or created)
+            group["hit_count"] += payload.get("hit_count", 0)
+
+    report = {"scanned": total, "unique": len(groups), "duplicates": total - len(groups), "legacy": legacy}
+    print(f"Scanned {total} points: {len(groups)} unique, {total - len(groups)} duplicates, "
+          f"{legacy} legacy (no canonical key)")
+    if dry_run:
+        return report
+
+    # Legacy vectors embed the raw json.dumps(messages), not the canonical text
+    # lookups now embed, so they'd rarely match again unless re-embedded
+    if legacy and not reembed and keep_legacy_vectors:
+        print(f"⚠️ Keeping the old vectors of {legacy} legacy entries: they were embedded from the raw "
+              "prompt, not the canonical text lookups use, and will mostly miss")
+    model = None
+    if reembed or (legacy and not keep_legacy_vectors):
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer("multi-qa-MiniLM-L6-cos-v1")
+
+    # Pass 2: write winners with stable IDs into a scratch collection
+    winners = {g["winner"]: digest for digest, g in groups.items()}
+    scratch = f"{collection}_compact"
+    if scratch in [c.name for c in client.get_collections().collections]:
+        client.delete_collection(scratch)
+    client.create_collection(collection_name=scratch, vectors_config=vector_params)
+
+    now = time.time()
+    written = 0
+    for points in _scroll(client, collection, batch_size, with_vectors=True):
+        out = []
+        for p in points:
+            digest = winners.get(p.id)
+            if digest is None:
+                continue
+            group = groups[digest]
+            _, prompt_text = _canonical(p.payload or {})
+            stale_vector = not (p.payload or {}).get("key")
+            payload = {
+                **(p.payload or {}),
+                "key": digest,
+                "prompt": prompt_text,
+                "created_at": group["created_at"] or now,
+                "last_hit_at": group["last_hit_at"] or now,
+                "hit_count": group["hit_count"],
+            }
+            out.append((point_id(digest), p.vector, payload, reembed or stale_vector))
+        if not out:
+            continue
+        if model is not None:
+            redo = [i for i, item in enumerate(out) if item[3]]
+            if redo:
+                vectors = model.encode([out[i][2]["prompt"] for i in redo], batch_size=len(redo)).tolist()
+                for i, vec in zip(redo, vectors):
+                    out[i] = (out[i][0], vec, out[i][2], False)
+        client.upsert(
+            collection_name=scratch,
+            points=[models.PointStruct(id=pid, vector=vec, payload=payload) for pid, vec, payload, _ in out],
+        )
+        written += len(out)
+        print(f"  rewrote {written}/{len(groups)}")
+
+    # Swap: local mode has no rename or aliases. Only touch the live collection
+    # once the scratch copy is complete, and never delete it
+    scratch_count = _count(client, scratch)
+    if scratch_count != len(groups):
+        client.close()
+        raise RuntimeError(f"Scratch collection {scratch} has {scratch_count} points, "
+                           f"expected {len(groups)}. {collection} left unchanged")
+    _swap_in(client, scratch, collection, batch_size)
+    if _count(client, collection) != len(groups):
+        client.close()
+        raise RuntimeError(f"{collection} does not match {scratch} after the swap. "
+                           f"Nothing was lost, re-run to finish; {scratch} is kept")
+    client.delete_collection(scratch)
+    client.close()
+
+    report["written"] = written
+    print(f"✅ Compacted {collection}: {total} -> {written} points")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dedupe and re-key the semantic cache collection")
+    parser.add_argument("--path", default=settings.QDRANT_PATH, help="Local Qdrant storage directory")
+    parser.add_argument("--collection", default="llm_cache_v1")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many duplicates exist")
+    parser.add_argument("--reembed", action="store_true",
+                        help="Recompute every vector from the canonical prompt text, not only legacy entries")
+    parser.add_argument("--keep-legacy-vectors", action="store_true",
+                        help="Don't re-embed legacy (pre-canonical-key) entries; they will mostly miss")
+    args = parser.parse_args()
+    compact(args.path, args.collection, args.batch_size, args.dry_run, args.reembed, args.keep_legacy_vectors)
+
+
+if __name__ == "__main__":
+    main()
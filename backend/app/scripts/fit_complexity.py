@@ -0,0 +1,73 @@
+"""
+Fit the complexity classifier from labeled prompts and report its accuracy.
+
+Input is JSONL, one example per line:
+    {"prompt": "write a python function that ...", "label": "complex"}
+    {"messages": [{"role": "user", "content": "hi"}], "label": "simple"}
+
+Prompts are embedded with the cache's model, from the same cache-key text
+the router sees. Accuracy is k-fold cross-validated and compared with the
+keyword matcher. Then a model fitted on every example is written to
+COMPLEXITY_MODEL_PATH, which the backend loads at startup.
+
+    cd backend
+    python -m app.scripts.fit_complexity --data data/complexity_examples.jsonl
+    python -m app.scripts.fit_complexity --data my_labels.jsonl --folds 10 --dry-run
+"""
+import argparse
+import numpy as np
+from app.core.cache import EMBEDDING_MODEL_NAME, _load_model
+from app.core.config import settings
+from app.services.complexity import LABELS, CentroidClassifier, example_text, keyword_is_complex, load_examples
+
+
+def _report(name: str, y_true: list, y_pred: list):
+    y_true, y_pred = np.array(y_true), np.array(y_pred)
+    accuracy = (y_true == y_pred).mean()
+    print(f"\n{name}: accuracy {accuracy:.1%} ({int((y_true == y_pred).sum())}/{len(y_true)})")
+    print(f"{'':>16}{'pred simple':>14}{'pred complex':>14}")
+    for label in LABELS:
+        row = [int(((y_true == label) & (y_pred == p)).sum()) for p in LABELS]
+        print(f"{'true ' + label:>16}{row[0]:>14}{row[1]:>14}")
+
+
+def main(data: str, out: str, folds: int, seed: int, dry_run: bool):
+    examples = load_examples(data)
+    labels = [e["label"] for e in examples]
+    texts = [example_text(e) for e in examples]
+    print(f"{len(examples)} examples ({labels.count('simple')} simple, {labels.count('complex')} complex)")
+
+    print(f"Embedding with {EMBEDDING_MODEL_NAME}...")
+    vectors = np.asarray(_load_model().encode(texts, batch_size=64))
+
+    # k-fold cross-validation: every example is predicted by a model that never saw it
+    order = np.random.default_rng(seed).permutation(len(examples))
+    predicted = [None] * len(examples)
+    for k in range(folds):
+        test = order[k::folds]
+        train = np.setdiff1d(order, test)
+        model = CentroidClassifier.fit(vectors[train], [labels[i] for i in train])
+        for i in test:
+            predicted[i] = model.predict(vectors[i])
+    _report(f"centroid ({folds}-fold CV)", labels, predicted)
+
+    keyword = ["complex" if keyword_is_complex(e.get("prompt") or text) else "simple" for e, text in zip(examples, texts)]
+    _report("keyword matcher (baseline)", labels, keyword)
+
+    model = CentroidClassifier.fit(vectors, labels, EMBEDDING_MODEL_NAME)
+    if dry_run:
+        print("\n--dry-run: model not saved")
+        return
+    model.save(out)
+    print(f"\n✅ Saved classifier (bias {model.bias:+.4f}) to {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the embedding-based complexity classifier")
+    parser.add_argument("--data", default=settings.COMPLEXITY_EXAMPLES_PATH)
+    parser.add_argument("--out", default=settings.COMPLEXITY_MODEL_PATH)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dry-run", action="store_true", help="Report accuracy without writing the model")
+    args = parser.parse_args()
+    main(args.data, args.out, args.folds, args.seed, args.dry_run)
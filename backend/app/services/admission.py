@@ -0,0 +1,116 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+from app.core.config import settings
+from app.services.latency import LATENCY
+from app.services.registry import REGISTRY
+
+
+class AdmissionRejected(Exception):
+    """The provider's queue is full or would take longer than the caller's
+    wait budget; the router spills the request over to the next provider."""
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a FIFO wait queue for one provider. Expected
+    wait is (rounds of `concurrency` requests ahead of us) x (the provider's
+    EWMA service time), so a caller can decide to go elsewhere instead of
+    queueing behind a single GPU until its timeout.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters = deque()
+        self._recent_waits = deque(maxlen=200)
+        self.stats = {"admitted": 0, "queued_total": 0, "spilled": 0, "max_queue_depth": 0}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def service_time(self) -> float:
+        ewma = LATENCY[self.name].ewma
+        return ewma if ewma is not None else settings.ADMISSION_DEFAULT_SERVICE_SECONDS
+
+    def expected_wait(self) -> float:
+        """Seconds a request arriving now would queue before starting"""
+        if self.in_flight < self.concurrency and not self._waiters:
+            return 0.0
+        rounds = math.ceil((len(self._waiters) + 1) / self.concurrency)
+        return rounds * self.service_time()
+
+    async def acquire(self, max_wait: Optional[float] = None):
+        """Take a slot, queueing if needed. max_wait=None queues whatever the
+        expected wait (used when no other provider is left)."""
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            self._recent_waits.append(0.0)
+            return
+        expected = self.expected_wait()
+        if len(self._waiters) >= self.max_queue or (max_wait is not None and expected > max_wait):
+            self.stats["spilled"] += 1
+            raise AdmissionRejected(
+                f"{self.name} queue: {len(self._waiters)} waiting, ~{expected:.1f}s expected wait")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.stats["queued_total"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._waiters))
+        start = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # the slot was handed to us as we were cancelled: pass it on
+            elif future in self._waiters:
+                self._waiters.remove(future)  # (release() may already have skipped past it)
+            raise
+        self.stats["admitted"] += 1
+        self._recent_waits.append(time.monotonic() - start)
+
+    def release(self):
+        # Hand the slot straight to the next waiter (in_flight stays the same)
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, max_wait: Optional[float] = None):
+        await self.acquire(max_wait)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> dict:
+        waits = sorted(self._recent_waits)
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "expected_wait_s": round(self.expected_wait(), 2),
+            "wait_ms_avg": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "wait_ms_p95": round(waits[min(int(0.95 * len(waits)), len(waits) - 1)] * 1000, 1) if waits else 0.0,
+            **self.stats,
+        }
+
+
+ADMISSION = {
+    name: AdmissionController(name, spec.max_concurrency, spec.max_queue)
+    for name, spec in REGISTRY.items()
+}
+
+
+def get_admission_stats() -> dict:
+    return {name: controller.snapshot() for name, controller in ADMISSION.items()}
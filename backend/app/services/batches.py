@@ -0,0 +1,218 @@
+import asyncio
+import copy
+import time
+import uuid
+from collections import OrderedDict
+from app.core.config import settings
+from app.core.cache import check_cache_many
+from app.services.providers import provider_service
+from app.services.admission import AdmissionRejected
+from app.services.rate_limits import RateLimitedError
+
+# Batch jobs: many chat requests in one HTTP call. Identical prompts are
+# answered once, cache lookups are embedded and searched in bulk, and misses
+# go through the normal router (per-provider concurrency slots and RPM/TPM
+# scheduling) with at most BATCH_MAX_CONCURRENCY of a job's requests in
+# flight. A request that fails only because every provider is out of quota
+# (or queue space) is retried after the provider's Retry-After, so a large
+# job runs at the providers' rate instead of failing. Jobs live in the
+# worker that accepted them.
+
+# Failures worth waiting out: the provider is fine, just busy
+RETRYABLE = (RateLimitedError, AdmissionRejected)
+
+FINISHED = ("completed", "failed", "cancelled")
+
+
+class BatchError(Exception):
+    """Invalid batch input (reported as HTTP 400)"""
+
+
+def parse_requests(items: list) -> list:
+    """
+    Normalize batch input lines to (custom_id, messages). Accepts the OpenAI
+    batch line format ({"custom_id", "body": {"messages": [...]}}) or plain
+    {"custom_id", "messages"}.
+    """
+    if not items:
+        raise BatchError("Batch contains no requests")
+    if len(items) > settings.BATCH_MAX_REQUESTS:
+        raise BatchError(f"Batch has {len(items)} requests (limit {settings.BATCH_MAX_REQUESTS})")
+    parsed = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise BatchError(f"Request {i} is not a JSON object")
+        body = item.get("body") if isinstance(item.get("body"), dict) else item
+        messages = body.get("messages")
+        if not messages or not isinstance(messages, list):
+            raise BatchError(f"Request {i} has no messages")
+        parsed.append((item.get("custom_id", f"request-{i}"), messages))
+    return parsed
+
+
+class BatchJob:
+    def __init__(self, requests: list):
+        self.id = f"batch_{uuid.uuid4().hex[:24]}"
+        self.requests = requests
+        self.status = "queued"
+        self.created_at = int(time.time())
+        self.completed_at = None
+        self.error = None
+        self.results = []  # output lines in completion order (append-only)
+        self.counts = {"total": len(requests), "unique": 0, "cached": 0, "completed": 0, "failed": 0, "retried": 0}
+        self.task = None
+        self._updated = asyncio.Event()
+
+    def _add_result(self, index: int, response: dict = None, error: str = None, cached: bool = False):
+        custom_id, _ = self.requests[index]
+        self.results.append({
+            "id": f"{self.id}_req_{index}",
+            "custom_id": custom_id,
+            "index": index,
+            "cached": cached,
+            "response": {"status_code": 200, "body": response} if error is None else None,
+            "error": {"message": error} if error is not None else None,
+        })
+        self.counts["failed" if error is not None else "completed"] += 1
+        self._notify()
+
+    def _notify(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def results_stream(self):
+        """Yield output lines as they are produced until the job finishes"""
+        sent = 0
+        while True:
+            updated = self._updated
+            while sent < len(self.results):
+                yield self.results[sent]
+                sent += 1
+            if self.status in FINISHED:
+                return
+            await updated.wait()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "object": "batch",
+            "status": self.status,
+            "created_at": self.created_at,
+            "completed_at": self.completed_at,
+            "error": self.error,
+            "request_counts": {
+                "total": self.counts["total"],
+                "completed": self.counts["completed"],
+                "failed": self.counts["failed"],
+            },
+            "unique_prompts": self.counts["unique"],
+            "cached": self.counts["cached"],
+            "retried": self.counts["retried"],
+        }
+
+
+async def _route_with_retry(job: BatchJob, messages: list, lookup) -> dict:
+    async def upstream(messages: list, lookup) -> dict:
+        # Retries re-enter the provider fallback only, inside route_request's
+        # accounting, so a retried item is still one request and one miss
+        for attempt in range(settings.BATCH_MAX_RETRIES + 1):
+            try:
+                return await provider_service._route_uncached(messages, lookup)
+            except Exception as e:
+                # The router wraps the last provider's error ("All providers failed ...")
+                cause = e.__cause__ if isinstance(e.__cause__, RETRYABLE) else e
+                if not isinstance(cause, RETRYABLE) or attempt == settings.BATCH_MAX_RETRIES:
+                    raise
+                job.counts["retried"] += 1
+                await asyncio.sleep(max(getattr(cause, "retry_after", 0.0), 1.0))
+
+    return await provider_service.route_request(messages, lookup=lookup, endpoint="batch", upstream=upstream)
+
+
+async def _run(job: BatchJob):
+    job.status = "in_progress"
+    job._notify()
+    try:
+        lookups = await check_cache_many([messages for _, messages in job.requests])
+        groups = OrderedDict()  # cache key -> (lookup, [indices])
+        for index, lookup in enumerate(lookups):
+            groups.setdefault(lookup.key, (lookup, []))[1].append(index)
+        job.counts["unique"] = len(groups)
+        job.counts["cached"] = sum(len(indices) for lookup, indices in groups.values() if lookup.hit)
+
+        limit = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+
+        async def answer(lookup, indices):
+            messages = job.requests[indices[0]][1]
+            cached = lookup.hit
+            try:
+                if cached:
+                    response = await provider_service.route_request(messages, lookup=lookup, endpoint="batch")
+                else:
+                    async with limit:
+                        response = await _route_with_retry(job, messages, lookup)
+            except Exception as e:
+                for index in indices:
+                    job._add_result(index, error=str(e))
+                return
+            for n, index in enumerate(indices):
+                job._add_result(index, response if n == 0 else copy.deepcopy(response), cached=cached)
+
+        # Cached answers first: they are immediate and free
+        ordered = sorted(groups.values(), key=lambda group: not group[0].hit)
+        await asyncio.gather(*[answer(lookup, indices) for lookup, indices in ordered])
+        job.status = "completed"
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+        raise
+    except Exception as e:
+        print(f"❌ Batch {job.id} failed: {e}")
+        job.status, job.error = "failed", str(e)
+    finally:
+        job.completed_at = int(time.time())
+        job._notify()
+        print(f"📦 Batch {job.id} {job.status}: {job.counts}")
+
+
+class BatchManager:
+    def __init__(self):
+        self.jobs = OrderedDict()
+
+    def submit(self, items: list) -> BatchJob:
+        job = BatchJob(parse_requests(items))
+        self.jobs[job.id] = job
+        self._prune()
+        job.task = asyncio.create_task(_run(job))
+        print(f"📦 Batch {job.id} accepted: {len(job.requests)} request(s)")
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        job = self.jobs.get(job_id)
+        if job is not None and job.task is not None and not job.task.done():
+            job.task.cancel()
+            job.status = "cancelling"  # "cancelled" once the task has stopped
+        return job
+
+    def _prune(self):
+        # Keep at most BATCH_MAX_JOBS; only finished jobs are forgotten
+        for job_id in [j for j, job in self.jobs.items() if job.status in FINISHED]:
+            if len(self.jobs) <= settings.BATCH_MAX_JOBS:
+                break
+            del self.jobs[job_id]
+
+    async def close(self):
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+
+    def get_stats(self) -> dict:
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"jobs": len(self.jobs), **statuses}
+
+
+batch_manager = BatchManager()
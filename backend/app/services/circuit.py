@@ -0,0 +1,178 @@
+import asyncio
+import time
+from collections import deque
+import httpx
+from app.core.config import settings
+from app.services.http_clients import http_clients
+from app.services.registry import REGISTRY
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Per-provider breaker. Closed: calls flow and outcomes land in a rolling
+    time window. It opens when the window's error rate (timeouts included)
+    crosses CIRCUIT_ERROR_RATE, or after CIRCUIT_CONSECUTIVE_FAILURES in a
+    row. Open: calls are refused instantly. After CIRCUIT_OPEN_SECONDS (or a
+    successful health probe) it goes half-open and lets one trial call
+    through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.outcomes = deque()  # (timestamp, ok)
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.stats = {"opened": 0, "rejected": 0, "timeouts": 0, "probes": 0, "probe_failures": 0}
+
+    def _trim(self, now: float):
+        while self.outcomes and now - self.outcomes[0][0] > settings.CIRCUIT_WINDOW_SECONDS:
+            self.outcomes.popleft()
+
+    def _cooled_down(self) -> bool:
+        return time.time() - self.opened_at >= settings.CIRCUIT_OPEN_SECONDS
+
+    def available(self) -> bool:
+        """Would a call be let through right now? (does not claim the trial)"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return self._cooled_down()
+        return not self.trial_in_flight
+
+    def before_call(self):
+        """Claim permission for one call, or raise CircuitOpenError"""
+        if self.state == OPEN and self._cooled_down():
+            self._transition(HALF_OPEN)
+        if self.state == CLOSED:
+            return
+        if self.state == HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return
+        self.stats["rejected"] += 1
+        raise CircuitOpenError(f"{self.name} circuit is {self.state}")
+
+    def record(self, ok: bool, timeout: bool = False):
+        now = time.time()
+        if timeout:
+            self.stats["timeouts"] += 1
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = False
+            self._transition(CLOSED if ok else OPEN)
+            return
+        if self.state == OPEN:
+            return  # a call that started before the circuit opened
+        self.outcomes.append((now, ok))
+        self._trim(now)
+        self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+        if not ok and self._should_open():
+            self._transition(OPEN)
+
+    def release(self):
+        """The call was abandoned (hedge loser, client gone): free the trial slot"""
+        if self.state == HALF_OPEN:
+            self.trial_in_flight = False
+
+    def _should_open(self) -> bool:
+        if self.consecutive_failures >= settings.CIRCUIT_CONSECUTIVE_FAILURES:
+            return True
+        if len(self.outcomes) < settings.CIRCUIT_MIN_CALLS:
+            return False
+        errors = sum(1 for _, ok in self.outcomes if not ok)
+        return errors / len(self.outcomes) >= settings.CIRCUIT_ERROR_RATE
+
+    def _transition(self, state: str):
+        if state == self.state:
+            if state == OPEN:
+                self.opened_at = time.time()
+            return
+        print(f"🔌 {self.name} circuit: {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.time()
+            self.stats["opened"] += 1
+            self.trial_in_flight = False
+        elif state == CLOSED:
+            self.outcomes.clear()
+            self.consecutive_failures = 0
+
+    def snapshot(self) -> dict:
+        self._trim(time.time())
+        errors = sum(1 for _, ok in self.outcomes if not ok)
+        retry_in = settings.CIRCUIT_OPEN_SECONDS - (time.time() - self.opened_at)
+        return {
+            "state": self.state,
+            "error_rate": round(errors / len(self.outcomes), 3) if self.outcomes else 0.0,
+            "window_calls": len(self.outcomes),
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_s": round(max(retry_in, 0), 1) if self.state == OPEN else 0,
+            **self.stats,
+        }
+
+
+BREAKERS = {name: CircuitBreaker(name) for name in REGISTRY}
+
+
+def _probe_request(provider: str):
+    """(url, headers) of a cheap authenticated GET that proves the provider is up"""
+    spec = REGISTRY[provider]
+    if not spec.configured:
+        return None
+    if spec.kind == "gemini":
+        return f"{spec.base_url}/models?key={spec.api_key}", {}
+    headers = {"Authorization": f"Bearer {spec.api_key}"} if spec.api_key else {}
+    return f"{spec.base_url}/models", headers
+
+
+async def probe(provider: str):
+    """True/False if the provider answered the probe, None if it can't be probed"""
+    request = _probe_request(provider)
+    if request is None:
+        return None
+    url, headers = request
+    breaker = BREAKERS[provider]
+    breaker.stats["probes"] += 1
+    try:
+        response = await http_clients.get(provider).get(
+            url, headers=headers, timeout=settings.CIRCUIT_PROBE_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return True
+    except httpx.HTTPError as e:
+        breaker.stats["probe_failures"] += 1
+        print(f"🩺 {provider} probe failed: {e!r}")
+        return False
+
+
+async def health_probe_loop():
+    """Probe providers with open circuits. A passing probe moves the circuit
+    to half-open right away, so the next real request is the trial call
+    instead of waiting out the full CIRCUIT_OPEN_SECONDS. A failing probe
+    changes nothing: the cool-down keeps running and the usual half-open
+    trial still happens, since some providers (chat-only keys, proxies
+    without /models) fail the probe while serving completions fine."""
+    if settings.USE_MOCK_LLM:
+        return
+    while True:
+        await asyncio.sleep(settings.CIRCUIT_PROBE_INTERVAL_SECONDS)
+        for name, breaker in BREAKERS.items():
+            if breaker.state != OPEN:
+                continue
+            try:
+                healthy = await probe(name)
+                if healthy:
+                    breaker._transition(HALF_OPEN)
+            except Exception as e:
+                print(f"⚠️ Health probe error for {name}: {e}")
+
+
+def get_circuit_stats() -> dict:
+    return {name: breaker.snapshot() for name, breaker in BREAKERS.items()}
@@ -0,0 +1,181 @@
+import json
+import os
+import re
+import time
+import numpy as np
+from app.core.config import settings
+from app.core.keys import build_cache_key
+
+LABELS = ("simple", "complex")
+
+# Fallback when no embedding is available (cache still warming up / disabled).
+# Word boundaries so "encode" or "barcode" don't count as "code".
+COMPLEX_KEYWORDS = re.compile(
+    r"\b(?:"
+    r"code|coding|functions?|python|javascript|react|sql|"  # Coding
+    r"story|stories|poems?|essays?|novels?|haiku|"  # Creative Writing
+    r"logic|reasoning|solve|math|calculus|"  # Critical Thinking
+    r"analy[sz]e|analysis|summary|summari[sz]e|extract"  # Data Processing
+    r")\b",
+    re.IGNORECASE,
+)
+
+# Very long prompts go to the big models whatever they say
+LONG_PROMPT_CHARS = 800
+
+COMPLEXITY_STATS = {
+    "mode": "keywords",
+    "centroid": 0,
+    "keyword": 0,
+    "long_prompt": 0,
+    "complex": 0,
+    "simple": 0,
+    "time_us_avg": 0.0,
+}
+
+
+def example_text(example: dict) -> str:
+    """Embedding text for a labeled example, built exactly like a cache key
+    so training vectors and lookup vectors come from the same input"""
+    messages = example.get("messages") or [{"role": "user", "content": example["prompt"]}]
+    return build_cache_key(messages, settings.CACHE_KEY_MAX_CHARS, settings.CACHE_KEY_BLOCK_CHARS).text
+
+
+def load_examples(path: str) -> list:
+    """JSONL rows of {"prompt": ... | "messages": [...], "label": "simple" | "complex"}"""
+    examples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if row.get("label") not in LABELS:
+                raise ValueError(f"Bad label {row.get('label')!r} in {path} (expected simple/complex)")
+            examples.append(row)
+    return examples
+
+
+class CentroidClassifier:
+    """
+    Nearest-centroid model over normalized prompt embeddings. The decision
+    is cos(v, complex) - cos(v, simple) + bias > 0: two dot products on a
+    vector the semantic cache already computed.
+    """
+
+    def __init__(self, centroids: np.ndarray, bias: float = 0.0, embedding_model: str = None, meta: dict = None):
+        self.centroids = centroids.astype(np.float32)
+        self.bias = bias
+        # Both centroids are unit length, so the decision is one dot product
+        self._direction = self.centroids[1] - self.centroids[0]
+        self.embedding_model = embedding_model
+        self.meta = meta or {}
+
+    @staticmethod
+    def _unit(rows: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+        return rows / np.where(norms > 0, norms, 1)
+
+    @classmethod
+    def fit(cls, vectors, labels: list, embedding_model: str = None) -> "CentroidClassifier":
+        x = cls._unit(np.asarray(vectors, dtype=np.float32))
+        y = np.array([LABELS.index(label) for label in labels])
+        if len(set(y.tolist())) < 2:
+            raise ValueError("Need examples of both simple and complex prompts")
+        centroids = cls._unit(np.stack([x[y == i].mean(axis=0) for i in range(len(LABELS))]))
+        # Tune the bias on the training margins (a 1-d threshold search)
+        margins = x @ centroids[1] - x @ centroids[0]
+        ordered = np.sort(margins)
+        candidates = np.concatenate([[0.0], -(ordered[:-1] + ordered[1:]) / 2])
+        accuracy = [((margins + b > 0) == (y == 1)).mean() for b in candidates]
+        bias = float(candidates[int(np.argmax(accuracy))])
+        return cls(centroids, bias, embedding_model, {"examples": len(y), "fitted_at": time.time()})
+
+    def margin(self, vector) -> float:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return float(v @ self._direction / (norm if norm > 0 else 1) + self.bias)
+
+    def predict(self, vector) -> str:
+        return LABELS[int(self.margin(vector) > 0)]
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "embedding_model": self.embedding_model,
+                "labels": list(LABELS),
+                "centroids": self.centroids.tolist(),
+                "bias": self.bias,
+                **self.meta,
+            }, f)
+
+    @classmethod
+    def load(cls, path: str) -> "CentroidClassifier":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        meta = {k: v for k, v in data.items() if k not in ("embedding_model", "labels", "centroids", "bias")}
+        return cls(np.array(data["centroids"]), data["bias"], data.get("embedding_model"), meta)
+
+
+# Attached by init_classifier() once the embedding model is up
+classifier = None
+
+
+async def init_classifier(embedder, embedding_model: str) -> bool:
+    """Load the fitted model from COMPLEXITY_MODEL_PATH, or fit one from the
+    bundled examples with the (already warm) embedder. Until this runs,
+    or if it fails (returns False), routing uses the keyword matcher."""
+    global classifier
+    try:
+        if os.path.exists(settings.COMPLEXITY_MODEL_PATH):
+            model = CentroidClassifier.load(settings.COMPLEXITY_MODEL_PATH)
+            if model.embedding_model != embedding_model:
+                raise ValueError(f"{settings.COMPLEXITY_MODEL_PATH} was fitted with {model.embedding_model}, not {embedding_model}")
+            source = settings.COMPLEXITY_MODEL_PATH
+        elif os.path.exists(settings.COMPLEXITY_EXAMPLES_PATH):
+            examples = load_examples(settings.COMPLEXITY_EXAMPLES_PATH)
+            vectors = await embedder.encode_many([example_text(e) for e in examples])
+            model = CentroidClassifier.fit(vectors, [e["label"] for e in examples], embedding_model)
+            source = f"{len(examples)} examples in {settings.COMPLEXITY_EXAMPLES_PATH}"
+        else:
+            print("⚠️ No complexity model or examples found, using keyword routing")
+            return False
+        classifier = model
+        COMPLEXITY_STATS["mode"] = "centroid"
+        print(f"✅ Complexity classifier ready ({source})")
+        return True
+    except Exception as e:
+        print(f"⚠️ Complexity classifier unavailable, using keyword routing: {e}")
+        return False
+
+
+def keyword_is_complex(text: str) -> bool:
+    return COMPLEX_KEYWORDS.search(text) is not None
+
+
+def is_complex(messages: list, vector=None) -> bool:
+    """Tier decision for a prompt. `vector` is the cache lookup embedding;
+    without it (or without a fitted model) the keyword matcher decides."""
+    start = time.perf_counter()
+    combined_text = " ".join(m.get("content") or "" for m in messages if isinstance(m.get("content"), str))
+    if len(combined_text) > LONG_PROMPT_CHARS:
+        COMPLEXITY_STATS["long_prompt"] += 1
+        result = True
+    elif vector is not None and classifier is not None:
+        COMPLEXITY_STATS["centroid"] += 1
+        result = classifier.predict(vector) == "complex"
+    else:
+        COMPLEXITY_STATS["keyword"] += 1
+        result = keyword_is_complex(combined_text)
+
+    COMPLEXITY_STATS["complex" if result else "simple"] += 1
+    n = COMPLEXITY_STATS["complex"] + COMPLEXITY_STATS["simple"]
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    COMPLEXITY_STATS["time_us_avg"] = round(COMPLEXITY_STATS["time_us_avg"] + (elapsed_us - COMPLEXITY_STATS["time_us_avg"]) / n, 1)
+    return result
+
+
+def get_complexity_stats() -> dict:
+    stats = dict(COMPLEXITY_STATS)
+    if classifier is not None:
+        stats["model"] = {"examples": classifier.meta.get("examples"), "bias": round(classifier.bias, 4)}
+    return stats
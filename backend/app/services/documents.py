@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import pypdf
+from multipart.multipart import MultipartParser, parse_options_header
+from app.core.config import settings
+from app.core.exact_cache import LRUTTLCache
+
+# Document text extraction for /api/parse-document. The multipart upload is
+# streamed straight to one temp file (hashed on the way, size-limited as it
+# arrives), PDF pages are extracted in parallel chunks in a process pool, so
+# a 300-page PDF no longer blocks the event loop, and results are cached by
+# content hash. Pool workers are spawned and import this module, so it must
+# not pull in the embedding model or the router.
+
+# Boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+DOCUMENT_STATS = {
+    "documents": 0,
+    "pages": 0,
+    "cache_hits": 0,
+    "rejected": 0,
+}
+
+
+class DocumentError(Exception):
+    """The upload can't be processed; `status_code` is the HTTP status to report"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# --- Pool workers (run in separate processes) ---
+
+# The last PDF this worker parsed, as (sha256, reader): the chunks of one
+# document are queued back to back, so most jobs reuse it instead of
+# re-reading and re-parsing the whole file. Keyed by content hash, not path.
+_reader = (None, None)
+
+
+def _open_pdf(path: str, digest: str) -> pypdf.PdfReader:
+    global _reader
+    if _reader[0] != digest:
+        _reader = (digest, pypdf.PdfReader(path))
+    return _reader[1]
+
+
+def _page_count(path: str, digest: str) -> int:
+    return len(_open_pdf(path, digest).pages)
+
+
+def _extract_range(path: str, digest: str, start: int, stop: int) -> list:
+    reader = _open_pdf(path, digest)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _decode_text(path: str) -> str:
+    with open(path, "rb") as f:
+        contents = f.read()
+    try:
+        return contents.decode("utf-8")
+    except UnicodeDecodeError:
+        return contents.decode("latin-1")  # Try latin-1 fallback
+
+
+# --- Event loop side ---
+
+class _UploadWriter:
+    """MultipartParser callbacks that write the first file part named
+    `file` to a temp file; other fields are ignored"""
+
+    def __init__(self):
+        self.filename = None
+        self.path = None
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self._out = None
+        self._pending = []
+        self._header = b""
+        self._value = b""
+        self._disposition = b""
+        self._writing = False
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._disposition = b""
+        self._writing = False
+
+    def _header_field(self, data, start, end):
+        self._header += data[start:end]
+
+    def _header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        if self._header.lower() == b"content-disposition":
+            self._disposition = self._value
+        self._header = self._value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if self.path is not None or options.get(b"name") != b"file" or b"filename" not in options:
+            return
+        raw = options[b"filename"]
+        try:
+            self.filename = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            self.filename = raw.decode("latin-1")
+        suffix = os.path.splitext(self.filename)[1].lower()
+        fd, self.path = tempfile.mkstemp(prefix="smartroute-doc-", suffix=suffix)
+        self._out = os.fdopen(fd, "wb")
+        self._writing = True
+
+    def _part_data(self, data, start, end):
+        if self._writing:
+            self._pending.append(data[start:end])
+
+    def _part_end(self):
+        self._writing = False
+
+    def flush(self):
+        """Write what the last parser.write() produced (the callbacks only buffer it)"""
+        for chunk in self._pending:
+            self.size += len(chunk)
+            if self.size > settings.DOCUMENT_MAX_BYTES:
+                DOCUMENT_STATS["rejected"] += 1
+                raise DocumentError(f"File is larger than the {settings.DOCUMENT_MAX_BYTES} byte limit", status_code=413)
+            self.digest.update(chunk)
+            self._out.write(chunk)
+        self._pending.clear()
+        if self._out is not None and not self._writing:
+            self._out.close()
+            self._out = None
+
+    def discard(self):
+        if self._out is not None:
+            self._out.close()
+        if self.path is not None:
+            os.unlink(self.path)
+
+class DocumentExtractor:
+    def __init__(self):
+        self._pool = None
+        self.cache = LRUTTLCache(settings.DOCUMENT_CACHE_ENTRIES, settings.DOCUMENT_CACHE_TTL_SECONDS)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: the server process has threads (embedding model, HTTP pools)
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.DOCUMENT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def receive(self, request) -> tuple:
+        """
+        Stream the `file` part of a multipart upload to a temp file, hashing
+        it on the way. Starlette's form parsing would spool the whole body
+        before DOCUMENT_MAX_BYTES could be checked; here an oversized
+        Content-Length is refused before reading, and a body without one
+        as soon as the limit is passed. Returns (filename, path, sha256 hex).
+        """
+        content_type, options = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            raise DocumentError("Expected a multipart/form-data upload with a `file` field")
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > settings.DOCUMENT_MAX_BYTES + MULTIPART_OVERHEAD_BYTES:
+            DOCUMENT_STATS["rejected"] += 1
+            raise DocumentError(f"File is larger than the {settings.DOCUMENT_MAX_BYTES} byte limit", status_code=413)
+
+        upload = _UploadWriter()
+        parser = MultipartParser(options[b"boundary"], upload.callbacks())
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                upload.flush()
+            parser.finalize()
+        except BaseException:
+            upload.discard()
+            raise
+        if upload.path is None:
+            raise DocumentError("No `file` field in the upload", status_code=422)
+        return upload.filename, upload.path, upload.digest.hexdigest()
+
+    async def pages(self, path: str, is_pdf: bool, digest: str):
+        """
+        Async-iterate over the document's pages in order (a text file is one
+        page). PDF chunks of DOCUMENT_PAGES_PER_CHUNK pages are extracted
+        concurrently; each is yielded as soon as it and everything before it
+        are done. The first item is the page count. Complete results are cached.
+        """
+        cache_key = f"{digest}:{int(is_pdf)}"
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            DOCUMENT_STATS["cache_hits"] += 1
+            yield len(cached)
+            for text in cached:
+                yield text
+            return
+
+        if not is_pdf:
+            # Decoding is cheap; a thread keeps it off the loop without shipping the text between processes
+            text = await asyncio.to_thread(_decode_text, path)
+            self.cache.set(cache_key, [text])
+            DOCUMENT_STATS["documents"] += 1
+            yield 1
+            yield text
+            return
+
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        try:
+            count = await loop.run_in_executor(pool, _page_count, path, digest)
+        except Exception as e:
+            raise DocumentError(f"Invalid PDF file: {e}")
+        if count > settings.DOCUMENT_MAX_PAGES:
+            DOCUMENT_STATS["rejected"] += 1
+            raise DocumentError(f"PDF has {count} pages (limit {settings.DOCUMENT_MAX_PAGES})", status_code=413)
+        yield count
+
+        step = settings.DOCUMENT_PAGES_PER_CHUNK
+        chunks = [loop.run_in_executor(pool, _extract_range, path, digest, start, min(start + step, count))
+                  for start in range(0, count, step)]
+        texts = []
+        try:
+            for chunk in chunks:
+                try:
+                    page_texts = await chunk
+                except Exception as e:
+                    raise DocumentError(f"Invalid PDF file: {e}")
+                texts.extend(page_texts)
+                for text in page_texts:
+                    yield text
+        finally:
+            # Client went away or a chunk failed: drop the queued chunks
+            for chunk in chunks:
+                if chunk.done() and not chunk.cancelled():
+                    chunk.exception()  # retrieved, so asyncio doesn't log it
+                else:
+                    chunk.cancel()
+        self.cache.set(cache_key, texts)
+        DOCUMENT_STATS["documents"] += 1
+        DOCUMENT_STATS["pages"] += count
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> dict:
+        return {**DOCUMENT_STATS, "cached_documents": len(self.cache)}
+
+
+def join_pages(texts: list) -> str:
+    """Same layout as before: non-empty pages, each followed by a newline"""
+    return "".join(text + "\n" for text in texts if text)
+
+
+document_extractor = DocumentExtractor()
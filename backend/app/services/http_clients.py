@@ -0,0 +1,91 @@
+import httpx
+from app.core.config import settings
+from app.services.registry import REGISTRY
+
+try:
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _provider_configs() -> dict:
+    """Per-provider connection settings from the registry (LM Studio speaks plain HTTP/1.1)"""
+    return {
+        name: {"timeout": spec.timeout_seconds, "http2": spec.http2}
+        for name, spec in REGISTRY.items()
+    }
+
+
+class ProviderHTTPClients:
+    """
+    One long-lived httpx.AsyncClient per upstream provider, created at startup
+    and closed at shutdown, so calls reuse warm keep-alive connections instead
+    of paying a TCP+TLS handshake every time. Connection setup is counted via
+    httpcore's trace hook to show how often a request actually reused one.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self.stats = {
+            name: {"requests": 0, "new_connections": 0, "tls_handshakes": 0, "connect_errors": 0}
+            for name in _provider_configs()
+        }
+
+    def _create(self, name: str, config: dict) -> httpx.AsyncClient:
+        provider_stats = self.stats[name]
+
+        async def trace(event: str, info: dict):
+            if event == "connection.connect_tcp.complete":
+                provider_stats["new_connections"] += 1
+            elif event == "connection.start_tls.complete":
+                provider_stats["tls_handshakes"] += 1
+            elif event == "connection.connect_tcp.failed":
+                provider_stats["connect_errors"] += 1
+
+        async def on_request(request: httpx.Request):
+            provider_stats["requests"] += 1
+            request.extensions["trace"] = trace
+
+        return httpx.AsyncClient(
+            http2=config["http2"] and settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(config["timeout"], connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            event_hooks={"request": [on_request]},
+        )
+
+    async def start(self):
+        for name, config in _provider_configs().items():
+            if name not in self._clients:
+                self._clients[name] = self._create(name, config)
+        print(f"HTTP clients ready for {', '.join(self._clients)} (HTTP/2: {settings.HTTP2_ENABLED and HTTP2_AVAILABLE})")
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            # Used outside the app lifespan (scripts, tests): create on demand
+            client = self._create(name, _provider_configs()[name])
+            self._clients[name] = client
+        return client
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def get_stats(self) -> dict:
+        out = {}
+        for name, s in self.stats.items():
+            reused = max(s["requests"] - s["new_connections"] - s["connect_errors"], 0)
+            out[name] = {
+                **s,
+                "reuse_rate": round(reused / s["requests"] * 100, 1) if s["requests"] else 0,
+            }
+        return out
+
+
+http_clients = ProviderHTTPClients()
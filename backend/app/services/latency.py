@@ -0,0 +1,84 @@
+import time
+from collections import deque
+from app.core.config import settings
+from app.services.circuit import BREAKERS, CLOSED
+from app.services.registry import REGISTRY
+
+
+class LatencyTracker:
+    """Rolling latency for one provider: an EWMA for ranking plus a fixed
+    window of recent samples for p50/p95 (used as the hedging trigger)."""
+
+    def __init__(self, alpha: float = None, window: int = None):
+        self.alpha = alpha or settings.LATENCY_EWMA_ALPHA
+        self.samples = deque(maxlen=window or settings.LATENCY_WINDOW)
+        self.ewma = None
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.last_call_at = 0.0
+
+    def record(self, seconds: float, ok: bool = True):
+        self.calls += 1
+        self.last_call_at = time.time()
+        if not ok:
+            self.errors += 1
+            self.consecutive_errors += 1
+            return
+        self.consecutive_errors = 0
+        self.samples.append(seconds)
+        self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+
+    def percentile(self, q: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    @property
+    def p50(self):
+        return self.percentile(0.50)
+
+    @property
+    def p95(self):
+        return self.percentile(0.95)
+
+    @property
+    def stale(self) -> bool:
+        """No recent calls: the EWMA may describe a slow period long over"""
+        return time.time() - self.last_call_at > settings.LATENCY_STALE_SECONDS
+
+    def snapshot(self) -> dict:
+        def ms(v):
+            return round(v * 1000, 1) if v is not None else None
+        return {
+            "ewma_ms": ms(self.ewma),
+            "p50_ms": ms(self.p50),
+            "p95_ms": ms(self.p95),
+            "samples": len(self.samples),
+            "calls": self.calls,
+            "errors": self.errors,
+            "consecutive_errors": self.consecutive_errors,
+        }
+
+
+# One tracker per upstream provider, fed by every call
+LATENCY = {name: LatencyTracker() for name in REGISTRY}
+
+
+def rank_providers(candidates: list) -> list:
+    """Order candidates fastest-healthy-first. Providers without (recent)
+    samples, or whose circuit is half-open, keep their configured position
+    ahead of measured ones, so a provider that lost the ranking or is
+    recovering still gets real traffic to measure. Open circuits go last."""
+    def key(item):
+        position, name = item
+        tracker = LATENCY[name]
+        state = BREAKERS[name].state
+        measured = tracker.ewma is not None and not tracker.stale and state == CLOSED
+        return (not BREAKERS[name].available(), measured, tracker.ewma if measured else position)
+    return [name for _, name in sorted(enumerate(candidates), key=key)]
+
+
+def get_latency_stats() -> dict:
+    return {name: tracker.snapshot() for name, tracker in LATENCY.items()}
@@ -0,0 +1,129 @@
+import asyncio
+from app.core.config import settings
+from app.services.streaming import sse_named_event
+
+# Push channel for the dashboard (GET /api/stats/stream). One producer task
+# per worker builds the /api/stats payload at most every
+# STATS_STREAM_MIN_INTERVAL_SECONDS, and only after something changed (or
+# every STATS_STREAM_REFRESH_SECONDS, to pick up other workers' traffic),
+# so the cost no longer grows with the number of open dashboards.
+#
+# Events:
+#   snapshot  the full payload (on connect, and to resync a slow client)
+#   delta     only the keys that changed; nested dicts are diffed, removed keys are null
+#   request   one per routed request, for the "latest request" panel
+
+
+def diff(old: dict, new: dict) -> dict:
+    """Changed leaves of `new` relative to `old` (dicts are merged, other values replaced)"""
+    changes = {}
+    for key, value in new.items():
+        before = old.get(key)
+        if isinstance(value, dict) and isinstance(before, dict):
+            nested = diff(before, value)
+            if nested:
+                changes[key] = nested
+        elif key not in old or before != value:
+            changes[key] = value
+    for key in old:
+        if key not in new:
+            changes[key] = None
+    return changes
+
+
+class StatsBroadcaster:
+    def __init__(self):
+        self._subscribers = set()
+        self._changed = None  # asyncio.Event, created inside the running loop
+        self._task = None
+        self._last = None
+        self.stats = {"clients": 0, "snapshots": 0, "deltas": 0, "request_events": 0, "resyncs": 0}
+
+    def notify(self):
+        """Stats changed: the producer sends a delta once the rate limit allows"""
+        if self._changed is not None:
+            self._changed.set()
+
+    def publish_request(self, event: dict):
+        """Push a routed request to every dashboard immediately (not coalesced)"""
+        if not self._subscribers:
+            return
+        self.stats["request_events"] += 1
+        self._broadcast(sse_named_event("request", event))
+        self.notify()
+
+    def _snapshot_message(self) -> bytes:
+        self.stats["snapshots"] += 1
+        return sse_named_event("snapshot", self._last)
+
+    def _broadcast(self, message: bytes):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A client that can't keep up skips its backlog and gets the current state instead
+                while not queue.empty():
+                    queue.get_nowait()
+                if self._last is not None:
+                    queue.put_nowait(self._snapshot_message())
+                self.stats["resyncs"] += 1
+
+    def _ensure_producer(self, build):
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(build))
+
+    async def _run(self, build):
+        while self._subscribers:
+            self._changed.clear()
+            try:
+                payload = await build()
+            except Exception as e:
+                print(f"Error building live stats: {e}")
+                payload = None
+            if payload is not None:
+                if self._last is None:
+                    self._last = payload
+                    self._broadcast(self._snapshot_message())
+                else:
+                    changes = diff(self._last, payload)
+                    self._last = payload
+                    if changes:
+                        self.stats["deltas"] += 1
+                        self._broadcast(sse_named_event("delta", changes))
+            # Coalesce: at most one update per interval, and none while nothing changes
+            await asyncio.sleep(settings.STATS_STREAM_MIN_INTERVAL_SECONDS)
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=max(
+                    settings.STATS_STREAM_REFRESH_SECONDS - settings.STATS_STREAM_MIN_INTERVAL_SECONDS, 0))
+            except asyncio.TimeoutError:
+                pass
+        self._last = None
+
+    async def subscribe(self, build):
+        """SSE byte stream for one dashboard. `build` is the coroutine function
+        that produces the /api/stats payload."""
+        queue = asyncio.Queue(maxsize=settings.STATS_STREAM_CLIENT_QUEUE)
+        self._subscribers.add(queue)
+        self.stats["clients"] = len(self._subscribers)
+        # Taken together with joining, so later deltas in the queue apply on top of it
+        # (without one, the producer's first build sends the snapshot)
+        snapshot = self._snapshot_message() if self._last is not None else None
+        try:
+            self._ensure_producer(build)
+            yield f"retry: {settings.STATS_STREAM_RETRY_MS}\n\n".encode("utf-8")
+            if snapshot is not None:
+                yield snapshot
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=settings.STATS_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"  # keeps proxies from closing an idle stream
+                yield message
+        finally:
+            self._subscribers.discard(queue)
+            self.stats["clients"] = len(self._subscribers)
+
+
+live_stats = StatsBroadcaster()
@@ -0,0 +1,47 @@
+from app.core.config import settings
+from app.services.circuit import BREAKERS
+from app.services.latency import LATENCY, rank_providers
+from app.services.registry import tier_providers
+from app.services.usage import avg_completion_tokens
+
+POLICIES = ("cost", "latency", "cost_under_slo")
+
+
+def _meets_slo(name: str) -> bool:
+    tracker = LATENCY[name]
+    if tracker.stale or not tracker.samples:
+        return True  # no recent evidence against it
+    return tracker.p95 * 1000 <= settings.ROUTING_LATENCY_SLO_MS
+
+
+def plan_route(tier: str, prompt_tokens: int, policy: str = None) -> list:
+    """
+    Provider names to try for this request, best first, under the routing
+    policy: "cost" (cheapest estimated request), "latency" (fastest rolling
+    EWMA), or "cost_under_slo" (cheapest among those whose p95 is within
+    ROUTING_LATENCY_SLO_MS, then the rest fastest-first). Providers whose
+    context window can't hold the prompt (`prompt_tokens`, from
+    usage.count_message_tokens) are left out.
+    """
+    policy = policy or settings.ROUTING_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown routing policy {policy!r} (expected one of {', '.join(POLICIES)})")
+
+    # Observed answer length for the tier once there is traffic, the setting until then
+    output_tokens = int(avg_completion_tokens(tier) or settings.ROUTING_EXPECTED_OUTPUT_TOKENS)
+    specs = tier_providers(tier)
+    fitting = [s for s in specs if s.context_tokens >= prompt_tokens + output_tokens]
+    if specs and not fitting:
+        raise Exception(f"Prompt (~{prompt_tokens} tokens) exceeds the context window of every {tier} provider")
+
+    if policy == "latency":
+        return rank_providers([s.name for s in fitting])
+
+    by_cost = sorted(fitting, key=lambda s: s.estimate_cost(prompt_tokens, output_tokens))
+    if policy == "cost":
+        ordered = [s.name for s in by_cost]
+    else:
+        within = [s.name for s in by_cost if _meets_slo(s.name)]
+        ordered = within + rank_providers([s.name for s in fitting if s.name not in within])
+    # Open circuits last, whatever the policy
+    return sorted(ordered, key=lambda name: not BREAKERS[name].available())
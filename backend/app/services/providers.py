@@ -1,9 +1,23 @@
 import httpx
+import copy
 import json
 import time
 import asyncio
 from app.core.config import settings
 from app.core.cache import check_cache, save_to_cache
+from app.core.metrics import (FAILED, FALLBACKS, IN_FLIGHT, REQUEST_SECONDS, ROUTED, STAGE_SECONDS,
+                              UPSTREAM_ERRORS, UPSTREAM_IN_FLIGHT, UPSTREAM_SECONDS)
+from app.services.http_clients import http_clients
+from app.services.complexity import is_complex
+from app.services.circuit import BREAKERS, CircuitOpenError
+from app.services.latency import LATENCY
+from app.services.live_stats import live_stats
+from app.services.policy import plan_route
+from app.services.registry import REGISTRY
+from app.services.admission import ADMISSION, AdmissionRejected
+from app.services.rate_limits import SCHEDULERS, RateLimitedError
+from app.services.usage import avg_completion_tokens, count_message_tokens, record_cached, record_usage
+from app.services.streaming import SSE_DONE, StreamAssembler, delta_content, replay_as_sse, sse_event
 
 # Simple in-memory stats for MVP Phase 1 (Week 1)
 STATS = {
@@ -13,6 +27,9 @@ STATS = {
     "cache_misses": 0,
     "provider_groq": 0,
     "provider_local": 0,
+    "coalesced_requests": 0,
+    "hedged_requests": 0,
+    "hedge_wins": 0,
     "latest_request": {
         "type": "Waiting...",
         "provider": "Waiting...",
@@ -20,273 +37,557 @@ STATS = {
     }
 }
 
-# Cost per 1k input tokens (Approx)
-COST_GPT4 = 0.03
-COST_GROQ = 0.0005 
-COST_GEMINI = 0.00035
+# Streaming (SSE) counters; time-to-first-token is measured from request start
+STREAM_STATS = {
+    "streams": 0,
+    "cached_replays": 0,
+    "errors": 0,
+    "ttft_ms_last": 0.0,
+    "ttft_ms_avg": 0.0,
+    "ttft_samples": 0,  # successful streams with at least one content token
+}
+
+class LeaderCancelled(Exception):
+    """Set on a single-flight future when the leading request was cancelled"""
+
+def _error_reason(error: Exception) -> str:
+    """Low-cardinality label for smartroute_upstream_errors_total"""
+    if isinstance(error, RateLimitedError):
+        return "rate_limited"
+    if isinstance(error, AdmissionRejected):
+        return "queue_full"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code}"
+    return "error"
+
+# Statuses that mean "this request is malformed / too large", not "this provider
+# is unhealthy". 401/403 (bad key), 404 (wrong model or URL) and the other 4xx
+# are provider-side misconfiguration and do count toward the breaker.
+CLIENT_ERROR_STATUSES = {400, 413, 422}
+
+def _is_client_error(error: Exception) -> bool:
+    """A request-shaped error must not count toward the circuit breaker or
+    the latency tracker"""
+    if not isinstance(error, httpx.HTTPStatusError):
+        return False
+    return error.response.status_code in CLIENT_ERROR_STATUSES
 
 class LLMProvider:
-    async def route_request(self, messages: list):
+    def __init__(self):
+        # Single-flight: canonical prompt key -> future of the in-progress upstream call
+        self._inflight = {}
+
+    async def route_request(self, messages: list, lookup=None, endpoint: str = "chat", upstream=None):
+        """Answer one chat request. Batch jobs pass the CacheLookup they
+        already ran (check_cache_many), so the cache isn't checked twice,
+        and may pass `upstream`, a wrapper around _route_uncached (e.g. one
+        that retries on rate limits) so retries stay one counted request."""
+        with IN_FLIGHT.track(endpoint), REQUEST_SECONDS.time(endpoint, "error") as timer:
+            return await self._route(messages, timer, lookup, upstream or self._route_uncached)
+
+    async def _route(self, messages: list, timer, lookup, upstream):
         STATS["total_requests"] += 1
+        live_stats.notify()
+        endpoint = timer.labels[0]
         
         # 1. CHECK CACHE
-        cached_response = check_cache(messages)
-        if cached_response:
+        if lookup is None:
+            lookup = await check_cache(messages)
+        if lookup.hit:
+            cached_response = lookup.response
             STATS["cache_hits"] += 1
-            STATS["total_savings"] += COST_GPT4 
+            STATS["total_savings"] += record_cached(messages, cached_response).savings
             cached_response["model"] = cached_response.get("model", "") + " (Cached)"
+            timer.labels = (endpoint, "hit")
             return cached_response
             
         STATS["cache_misses"] += 1
 
-        # 2. Analyze complexity
-        is_complex = self._analyze_complexity(messages)
+        # 2. Coalesce identical in-flight prompts. Followers await the leader's
+        # result; if the leader fails they get the same error (no retry storm),
+        # if it is cancelled (client went away) one follower takes over.
+        loop = asyncio.get_running_loop()
+        while True:
+            leader = self._inflight.get(lookup.key)
+            if leader is None:
+                break
+            STATS["coalesced_requests"] += 1
+            try:
+                response = copy.deepcopy(await asyncio.shield(leader))
+                timer.labels = (endpoint, "coalesced")
+                return response
+            except LeaderCancelled:
+                STATS["coalesced_requests"] -= 1
+                continue
 
-        # 3. Pick a provider
-        response = None
-        
-        # LOGIC UPDATE: Since OpenAI key is flaky (429), we prefer Gemini for "Smart" queries if OpenAI fails
-        # Or we can just default to Gemini for "Complex" if OpenAI is known bad.
-        # For now, let's try OpenAI -> Fallback Gemini.
-        
-        if is_complex:
-             # Check for Local LLM (Cost Savings!)
-             if settings.LM_STUDIO_URL:
-                 print(f"Routing to Local LLM (LM Studio) - Complex Query")
-                 try:
-                     response = await self._call_local_llm(messages)
-                     STATS["total_savings"] += COST_GPT4 # We saved the full cost of GPT-4!
-                     STATS["provider_local"] += 1
-                     STATS["latest_request"] = {
-                         "type": "Complex Query",
-                         "provider": "LOCAL LLM",
-                         "timestamp": time.time()
-                     }
-                     save_to_cache(messages, response)
-                     return response
-                 except Exception as e:
-                     print(f"⚠️ Local LLM Failed: {e}. Falling back to Cloud Providers.")
-             
-             print(f"Routing to Smart Tier (Complex query)")
-             # EMERGENCY FALLBACK: OpenAI/Gemini are 429/Expired. Using Groq Llama-3.1 for now.
-             print(f"⚠️ Primary Smart Providers (OpenAI/Gemini) unavailable/quota-exceeded. Routing to Groq Llama-3.1 (High Performance).")
-             # We use the same Groq method but maybe with a 'smart' prompt? For MVP just use Groq.
-             try:
-                 response = await self._call_groq(messages)
-                 response["model"] = "llama-3.1 (Fallback for GPT-4)" # Annotate for dashboard
-                 savings = COST_GPT4 - COST_GROQ
-                 STATS["total_savings"] += savings
-                 STATS["provider_groq"] += 1
-                 STATS["latest_request"] = {
-                     "type": "Complex Query (Fallback)",
-                     "provider": "GROQ",
-                     "timestamp": time.time()
-                 }
-                 save_to_cache(messages, response)
-                 return response
-             except Exception:
-                 pass # If Groq fails, fall through...
-                 
-        elif not is_complex and settings.GROQ_API_KEY:
-            print(f"Routing to Groq (Simple query)")
-            response = await self._call_groq(messages)
-            savings = COST_GPT4 - COST_GROQ
-            STATS["total_savings"] += savings
-            STATS["provider_groq"] += 1
-            STATS["latest_request"] = {
-                "type": "Simple Query",
-                "provider": "GROQ",
-                "timestamp": time.time()
-            }
-            save_to_cache(messages, response)
-            return response
-            
+        future = loop.create_future()
+        self._inflight[lookup.key] = future
+        try:
+            response = await upstream(messages, lookup)
+        except asyncio.CancelledError:
+            self._fail_leader(future, LeaderCancelled())
+            raise
+        except Exception as e:
+            self._fail_leader(future, e)
+            raise
         else:
-             raise Exception("No available providers configured")
+            future.set_result(copy.deepcopy(response))
+        finally:
+            self._inflight.pop(lookup.key, None)
+        timer.labels = (endpoint, "miss")
+        return response
 
-    def _analyze_complexity(self, messages: list) -> bool:
-        combined_text = " ".join([m.get("content", "") for m in messages])
-        
-        # Expanded keywords for "Smart" routing based on user feedback
-        complex_keywords = [
-            "code", "function", "python", "javascript", "react", "sql", # Coding
-            "story", "poem", "essay", "novel", "haiku", # Creative Writing
-            "logic", "reasoning", "solve", "math", "calculus", # Critical Thinking
-            "analysis", "summary", "extract" # Data Processing
-        ]
-        
-        if any(keyword in combined_text.lower() for keyword in complex_keywords):
-            return True
-        if len(combined_text) > 800:
-            print("DEBUGGING COMPLEXITY: Length > 800 -> COMPLEX")
-            return True
-        print("DEBUGGING COMPLEXITY: Simple query")
-        return False
-        if len(combined_text) > 800:
-            return True
-        return False
+    @staticmethod
+    def _fail_leader(future: asyncio.Future, exc: BaseException):
+        future.set_exception(exc)
+        # Mark retrieved: with no followers waiting, asyncio would log it as unhandled
+        future.exception()
 
-    async def _call_local_llm(self, messages: list):
-        if settings.USE_MOCK_LLM:
-             # Reuse Groq mock for now as placeholder
-             return await self._call_groq(messages)
+    async def _route_uncached(self, messages: list, lookup):
+        # 3. Analyze complexity
+        tier = "complex" if self._analyze_complexity(messages, lookup.vector) else "simple"
+        prompt_tokens = count_message_tokens(messages)  # once: routing, quota reservations, usage
 
-        print(f"DEBUG: Calling Local LLM (Mythomax)...")
-        headers = {"Content-Type": "application/json"}
-        # LM Studio is OpenAI compatible!
-        data = {
-            "messages": messages,
-            "model": "mythomax-l2-13b", # This is often ignored by LM Studio local server, but good practice
-            "temperature": 0.7
-        }
-        async with httpx.AsyncClient() as client:
+        # 4. Order the tier's providers by the routing policy, falling back down the list
+        candidates = self._candidates(tier, prompt_tokens)
+        if not candidates:
+            raise Exception("No available providers configured")
+        candidates = self._closed_circuits(candidates)
+        print(f"Routing {tier} query: {' -> '.join(candidates)}")
+
+        last_error = None
+        attempted = set()  # including hedge backups, so a failed one isn't called again
+        while True:
+            remaining = [p for p in candidates if p not in attempted]
+            if not remaining:
+                break
             try:
-                response = await client.post(
-                    f"{settings.LM_STUDIO_URL}/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=120.0 # Local models can be slow
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                print(f"❌ Local LLM Error: {e.response.status_code} - {e.response.text}")
-                raise e
+                provider, response, seconds = await self._call_with_hedge(remaining, messages, tier, prompt_tokens, attempted)
+            except Exception as e:
+                print(f"⚠️ {REGISTRY[remaining[0]].label} failed: {e}. Trying next provider.")
+                last_error = e
+                continue
+            self._record_route(provider, tier, messages, response, seconds, prompt_tokens,
+                               fallback=provider != candidates[0])
+            await save_to_cache(messages, response, lookup)
+            return response
+
+        FAILED.inc(tier)
+        raise Exception(f"All providers failed for {tier} query: {last_error}") from last_error
+
+    def _candidates(self, tier: str, prompt_tokens: int) -> list:
+        """Configured providers for a tier, ordered by settings.ROUTING_POLICY"""
+        return plan_route(tier, prompt_tokens)
 
-    async def _call_groq(self, messages: list):
+    @staticmethod
+    def _closed_circuits(candidates: list) -> list:
+        """Drop providers whose circuit is open, so they cost nothing instead of a timeout"""
+        available = [p for p in candidates if BREAKERS[p].available()]
+        if not available:
+            raise CircuitOpenError(f"All providers unavailable (circuit open): {', '.join(candidates)}")
+        skipped = [p for p in candidates if p not in available]
+        if skipped:
+            print(f"🔌 Skipping open circuit(s): {', '.join(skipped)}")
+        return available
+
+    @staticmethod
+    def _queue_budget(provider: str, last: bool):
+        """How long to queue for a concurrency slot before spilling over (None: no limit)"""
+        return None if last else REGISTRY[provider].queue_wait_budget_seconds
+
+    async def _call_provider(self, provider: str, messages: list) -> dict:
+        spec = REGISTRY[provider]
         if settings.USE_MOCK_LLM:
-            await asyncio.sleep(0.5) # Simulate network latency
-            return {
-                "id": "mock-groq-123",
-                "object": "chat.completion",
-                "created": int(time.time()),
-                "model": "llama-3.1-8b-instant",
-                "choices": [{
-                    "index": 0,
-                    "message": {"role": "assistant", "content": f"[MOCK GROQ] Simulated response for: {messages[-1]['content'][:20]}..."},
-                    "finish_reason": "stop"
-                }]
-            }
+            return await self._mock_response(spec, messages)
+        if spec.kind == "gemini":
+            return await self._call_gemini(spec, messages)
+        return await self._call_openai_compatible(spec, messages)
 
-        if not settings.GROQ_API_KEY:
-            raise Exception("GROQ_API_KEY not set")
-        
-        print(f"DEBUG: Calling Groq (Llama-3.1)...")
-        headers = {
-            "Authorization": f"Bearer {settings.GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "messages": messages,
-            "model": "llama-3.1-8b-instant", # NEW MODEL ID
-            "temperature": 0.7
+    @staticmethod
+    def _token_estimate(prompt_tokens: int, tier: str) -> int:
+        """Tokens to reserve against a TPM budget: the prompt plus a typical answer"""
+        return prompt_tokens + int(avg_completion_tokens(tier) or settings.ROUTING_EXPECTED_OUTPUT_TOKENS)
+
+    async def _timed_call(self, provider: str, messages: list, tier: str, prompt_tokens: int, last: bool) -> tuple:
+        """Call a provider through its circuit breaker and rate-limit scheduler,
+        feeding its latency tracker. Returns (response, seconds spent upstream)."""
+        breaker = BREAKERS[provider]
+        scheduler = SCHEDULERS[provider]
+        breaker.before_call()
+        reserved = self._token_estimate(prompt_tokens, tier)
+        max_wait = settings.RATE_LIMIT_LAST_RESORT_WAIT_SECONDS if last else settings.RATE_LIMIT_MAX_WAIT_SECONDS
+        try:
+            await scheduler.acquire(reserved, max_wait)
+            try:
+                async with ADMISSION[provider].slot(self._queue_budget(provider, last)):
+                    start = time.perf_counter()
+                    with UPSTREAM_IN_FLIGHT.track(provider):
+                        response = await self._call_provider(provider, messages)
+            except AdmissionRejected:
+                scheduler.refund(reserved)
+                raise
+        except asyncio.CancelledError:
+            # Lost a hedge race or the client left: not the provider's health
+            breaker.release()
+            raise
+        except (RateLimitedError, AdmissionRejected) as e:
+            # No quota or queue full: not the provider's health either
+            breaker.release()
+            UPSTREAM_ERRORS.inc(provider, tier, _error_reason(e))
+            raise
+        except Exception as e:
+            self._record_outcome(provider, tier, start, ok=False, error=e)
+            raise
+        self._record_outcome(provider, tier, start, ok=True)
+        if (response.get("usage") or {}).get("total_tokens") is not None:
+            scheduler.settle(reserved, response["usage"]["total_tokens"])
+        return response, time.perf_counter() - start
+
+    @staticmethod
+    def _record_outcome(provider: str, tier: str, start: float, ok: bool, error: Exception = None):
+        seconds = time.perf_counter() - start
+        if not ok and _is_client_error(error):
+            BREAKERS[provider].release()  # bad input from one client mustn't open the circuit for all
+        else:
+            LATENCY[provider].record(seconds, ok=ok)
+            BREAKERS[provider].record(ok, timeout=isinstance(error, httpx.TimeoutException))
+        UPSTREAM_SECONDS.observe(seconds, provider, "ok" if ok else "error")
+        if not ok:
+            UPSTREAM_ERRORS.inc(provider, tier, _error_reason(error))
+
+    def _hedge_delay(self, provider: str):
+        """Seconds to wait before hedging: the primary's p95, once we trust it"""
+        tracker = LATENCY[provider]
+        if not settings.HEDGE_ENABLED or len(tracker.samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return tracker.p95
+
+    async def _call_with_hedge(self, candidates: list, messages: list, tier: str, prompt_tokens: int,
+                               attempted: set) -> tuple:
+        """
+        Call candidates[0]. If it is still running past its p95 and a second
+        candidate exists, send a duplicate there; the first successful answer
+        wins and the other call is cancelled. Every provider called is added
+        to `attempted`. Returns (provider, response, seconds).
+        """
+        primary = candidates[0]
+        attempted.add(primary)
+        # Queue only briefly for quota or a slot while another provider could take the request
+        tasks = {asyncio.create_task(self._timed_call(primary, messages, tier, prompt_tokens,
+                                                    last=len(candidates) == 1)): primary}
+        delay = self._hedge_delay(primary) if len(candidates) > 1 else None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    backup = candidates[1]
+                    print(f"⏱️ {primary} slower than its p95 ({delay * 1000:.0f}ms), hedging to {backup}")
+                    STATS["hedged_requests"] += 1
+                    attempted.add(backup)
+                    tasks[asyncio.create_task(self._timed_call(backup, messages, tier, prompt_tokens, last=False))] = backup
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task] != primary:
+                            STATS["hedge_wins"] += 1
+                        return (tasks[task], *task.result())
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _record_route(self, provider: str, tier: str, messages: list, response: dict,
+                      seconds: float, prompt_tokens: int, fallback: bool = False):
+        """Usage/cost accounting and dashboard bookkeeping for an answered (non-cached) request"""
+        spec = REGISTRY[provider]
+        usage = record_usage(provider, tier, messages, response, seconds, prompt_tokens)
+        if tier in spec.model_labels:
+            response["model"] = spec.model_labels[tier] # Annotate for dashboard
+        # We saved the difference to sending the same tokens to the baseline (GPT-4o)
+        STATS["total_savings"] += usage.savings
+        STATS[f"provider_{provider}"] = STATS.get(f"provider_{provider}", 0) + 1
+        ROUTED.inc(provider, tier)
+        if fallback:
+            FALLBACKS.inc(provider, tier)
+        STATS["latest_request"] = {
+            "type": f"{tier.capitalize()} Query" + (" (Fallback)" if fallback else ""),
+            "provider": spec.label,
+            "timestamp": time.time()
         }
-        async with httpx.AsyncClient() as client:
+        live_stats.publish_request({
+            **STATS["latest_request"],
+            "provider_id": provider,
+            "tier": tier,
+            "fallback": fallback,
+            "latency_ms": round(seconds * 1000, 1),
+            "cost": round(usage.cost, 6),
+        })
+
+    async def stream_request(self, messages: list):
+        """
+        Streaming counterpart of route_request: yields Server-Sent Event bytes.
+        Upstream chunks from Groq / LM Studio are passed through as they arrive
+        and assembled into a full response that is cached when the stream ends.
+        Cache hits are replayed as a synthetic stream.
+        """
+        with IN_FLIGHT.track("stream"), REQUEST_SECONDS.time("stream", "error") as timer:
+            async for event in self._stream(messages, timer):
+                yield event
+
+    async def _stream(self, messages: list, timer):
+        STATS["total_requests"] += 1
+        live_stats.notify()
+        STREAM_STATS["streams"] += 1
+        start = time.perf_counter()
+
+        lookup = await check_cache(messages)
+        if lookup.hit:
+            cached_response = lookup.response
+            STATS["cache_hits"] += 1
+            STATS["total_savings"] += record_cached(messages, cached_response).savings
+            STREAM_STATS["cached_replays"] += 1
+            cached_response["model"] = cached_response.get("model", "") + " (Cached)"
+            first_token = None
+            for event in replay_as_sse(cached_response):
+                if first_token is None and delta_content(event):
+                    first_token = time.perf_counter()
+                yield event
+            self._record_ttft(start, first_token)
+            timer.labels = ("stream", "hit")
+            return
+
+        STATS["cache_misses"] += 1
+        tier = "complex" if self._analyze_complexity(messages, lookup.vector) else "simple"
+        prompt_tokens = count_message_tokens(messages)
+        # Same ranking as route_request (no hedging: a stream can't be un-sent)
+        try:
+            plan = self._candidates(tier, prompt_tokens)
+            if not plan:
+                raise Exception("No available providers configured")
+            plan = self._closed_circuits(plan)
+        except Exception as e:
+            STREAM_STATS["errors"] += 1
+            yield sse_event({"error": {"message": str(e)}})
+            yield SSE_DONE
+            return
+
+        for provider in plan:
+            label = REGISTRY[provider].label
+            assembler = StreamAssembler()
+            last = provider == plan[-1]
+            reserved = self._token_estimate(prompt_tokens, tier)
+            try:
+                BREAKERS[provider].before_call()
+            except CircuitOpenError:
+                continue  # half-open trial already taken by another request
+            try:
+                await SCHEDULERS[provider].acquire(reserved, settings.RATE_LIMIT_LAST_RESORT_WAIT_SECONDS
+                                                   if last else settings.RATE_LIMIT_MAX_WAIT_SECONDS)
+            except RateLimitedError as e:
+                BREAKERS[provider].release()
+                UPSTREAM_ERRORS.inc(provider, tier, _error_reason(e))
+                print(f"🚦 {e}. Trying next provider.")
+                continue
+            started = False
+            first_token = None
             try:
-                response = await client.post(
-                    "https://api.groq.com/openai/v1/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=30.0
-                )
+                async with ADMISSION[provider].slot(self._queue_budget(provider, last)):
+                    stream_start = time.perf_counter()
+                    with UPSTREAM_IN_FLIGHT.track(provider):
+                        async for event in self._stream_provider(provider, messages, assembler):
+                            started = True
+                            # The first chunk is usually the role-only delta, not a token
+                            if first_token is None and assembler.parts:
+                                first_token = time.perf_counter()
+                            yield event
+            except (asyncio.CancelledError, GeneratorExit):
+                BREAKERS[provider].release()
+                raise
+            except RateLimitedError as e:
+                BREAKERS[provider].release()  # upstream 429, always before the first token
+                UPSTREAM_ERRORS.inc(provider, tier, _error_reason(e))
+                print(f"🚦 {e}. Trying next provider.")
+                continue
+            except AdmissionRejected as e:
+                BREAKERS[provider].release()
+                SCHEDULERS[provider].refund(reserved)
+                UPSTREAM_ERRORS.inc(provider, tier, _error_reason(e))
+                print(f"⏳ {e}. Trying next provider.")
+                continue
+            except Exception as e:
+                self._record_outcome(provider, tier, stream_start, ok=False, error=e)
+                if started:
+                    # Bytes already reached the client; we can't switch providers mid-answer
+                    print(f"❌ Stream from {label} broke mid-response: {e}")
+                    STREAM_STATS["errors"] += 1
+                    yield sse_event({"error": {"message": f"Upstream stream failed: {e}"}})
+                    yield SSE_DONE
+                    return
+                print(f"⚠️ Streaming from {label} failed before first token: {e}. Trying next provider.")
+                continue
+
+            self._record_outcome(provider, tier, stream_start, ok=True)
+            self._record_ttft(start, first_token)
+            response = assembler.to_response()
+            if assembler.usage:
+                SCHEDULERS[provider].settle(reserved, response["usage"].get("total_tokens", reserved))
+            self._record_route(provider, tier, messages, response, time.perf_counter() - stream_start,
+                               prompt_tokens, fallback=provider != plan[0])
+            await save_to_cache(messages, response, lookup)
+            timer.labels = ("stream", "miss")
+            yield SSE_DONE
+            return
+
+        STREAM_STATS["errors"] += 1
+        FAILED.inc(tier)
+        yield sse_event({"error": {"message": "All providers failed"}})
+        yield SSE_DONE
+
+    def _record_ttft(self, start: float, first_token: float):
+        """Time to the first content token, for streams that completed (failed
+        streams and empty answers aren't counted)"""
+        if first_token is None:
+            return
+        ttft = (first_token - start) * 1000
+        STREAM_STATS["ttft_samples"] += 1
+        n = STREAM_STATS["ttft_samples"]
+        STREAM_STATS["ttft_ms_last"] = round(ttft, 1)
+        STREAM_STATS["ttft_ms_avg"] = round(STREAM_STATS["ttft_ms_avg"] + (ttft - STREAM_STATS["ttft_ms_avg"]) / n, 1)
+
+    async def _stream_provider(self, provider: str, messages: list, assembler: StreamAssembler):
+        """Yield SSE events from an OpenAI-compatible upstream, feeding the assembler"""
+        spec = REGISTRY[provider]
+        if settings.USE_MOCK_LLM or spec.kind != "openai":
+            # No upstream stream (mock mode / Gemini): replay the full answer
+            response = await self._call_provider(provider, messages)
+            for event in replay_as_sse(response):
+                if event != SSE_DONE:
+                    assembler.add(json.loads(event[len(b"data: "):]))
+                    yield event
+            return
+
+        url, headers, data = self._chat_request(spec, messages)
+        client = http_clients.get(provider)
+        async with client.stream("POST", url, headers=headers, json={**data, "stream": True}) as response:
+            SCHEDULERS[provider].observe(response.headers)
+            if response.status_code == 429:
+                raise SCHEDULERS[provider].rate_limited(response.headers)
+            if response.status_code >= 400:
+                body = (await response.aread()).decode("utf-8", "replace")
+                print(f"❌ {provider} stream error: {response.status_code} - {body}")
                 response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                print(f"❌ Groq Error: {e.response.status_code} - {e.response.text}")
-                raise e
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                try:
+                    assembler.add(json.loads(payload))
+                except ValueError:
+                    continue
+                yield f"data: {payload}\n\n".encode("utf-8")
 
-    async def _call_openai(self, messages: list):
-        if settings.USE_MOCK_LLM:
-            await asyncio.sleep(1.5) # Simulate standard latency
-            return {
-                "id": "mock-gpt4-123",
-                "object": "chat.completion",
-                "created": int(time.time()),
-                "model": "gpt-4o",
-                "choices": [{
-                    "index": 0,
-                    "message": {"role": "assistant", "content": f"[MOCK GPT-4o] Intelligent simulated response for: {messages[-1]['content'][:20]}..."},
-                    "finish_reason": "stop"
-                }]
-            }
+    def _chat_request(self, spec, messages: list) -> tuple:
+        """(url, headers, body) for an OpenAI-compatible chat endpoint"""
+        headers = {"Content-Type": "application/json"}
+        if spec.api_key_setting:
+            if not spec.api_key:
+                raise Exception(f"{spec.api_key_setting} not set")
+            headers["Authorization"] = f"Bearer {spec.api_key}"
+        return (
+            f"{spec.base_url}/chat/completions",
+            headers,
+            {
+                "messages": messages,
+                "model": spec.model, # LM Studio ignores this and serves whatever is loaded
+                "temperature": 0.7
+            },
+        )
+
+    def _analyze_complexity(self, messages: list, vector=None) -> bool:
+        # Reuses the cache lookup embedding when there is one (no extra encode)
+        with STAGE_SECONDS.time("classify"):
+            return is_complex(messages, vector)
 
-        print(f"DEBUG: Calling OpenAI...")
-        headers = {
-            "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
-            "Content-Type": "application/json"
+    async def _mock_response(self, spec, messages: list) -> dict:
+        await asyncio.sleep(spec.mock_latency_seconds) # Simulate network latency
+        return {
+            "id": f"mock-{spec.name}-123",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": spec.model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": f"[MOCK {spec.label}] Simulated response for: {messages[-1]['content'][:20]}..."},
+                "finish_reason": "stop"
+            }]
         }
+
+    async def _call_openai_compatible(self, spec, messages: list) -> dict:
+        print(f"DEBUG: Calling {spec.label} ({spec.model})...")
+        url, headers, data = self._chat_request(spec, messages)
+        # Each provider has its own pooled client with the registry timeout
+        client = http_clients.get(spec.name)
+        try:
+            response = await client.post(url, headers=headers, json=data)
+            SCHEDULERS[spec.name].observe(response.headers)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429:
+                raise SCHEDULERS[spec.name].rate_limited(e.response.headers) from e
+            print(f"❌ {spec.label} Error: {e.response.status_code} - {e.response.text}")
+            raise e
+
+    async def _call_gemini(self, spec, messages: list) -> dict:
+        print(f"DEBUG: Calling {spec.label} ({spec.model})...")
+        last_message = messages[-1]["content"]
+        url = f"{spec.base_url}/models/{spec.model}:generateContent?key={spec.api_key}"
         data = {
-            "messages": messages,
-            "model": "gpt-4o",
-            "temperature": 0.7
+            "contents": [{"parts": [{"text": last_message}]}]
         }
-        async with httpx.AsyncClient() as client:
+        
+        client = http_clients.get(spec.name)
+        try:
+            response = await client.post(url, json=data)
+            if response.status_code == 429:
+                raise SCHEDULERS[spec.name].rate_limited(response.headers)
+            response.raise_for_status()
+            result = response.json()
+            
+            # Safe access to avoid index errors if safety filters block content
             try:
-                response = await client.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=60.0
-                )
-                response.raise_for_status()
-                return response.json()
-            except httpx.HTTPStatusError as e:
-                print(f"❌ OpenAI Error: {e.response.status_code} - {e.response.text}")
-                raise e
+                part = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0]
+                generated_text = part.get("text", "I'm sorry, I couldn't generate a response.")
+            except IndexError:
+                print(f"⚠️ Gemini Safety Filter triggered or empty response: {result}")
+                generated_text = "I'm sorry, I couldn't generate a response (Safety Filter)."
 
-    async def _call_gemini(self, messages: list):
-        if settings.USE_MOCK_LLM:
-            await asyncio.sleep(1.0)
             return {
-                "id": "mock-gemini-123",
+                "id": "chatcmpl-gemini",
                 "object": "chat.completion",
                 "created": int(time.time()),
-                "model": "gemini-2.0-flash-001",
+                "model": spec.model,
                 "choices": [{
                     "index": 0,
-                    "message": {"role": "assistant", "content": f"[MOCK GEMINI] Balanced simulated response for: {messages[-1]['content'][:20]}..."},
+                    "message": {
+                        "role": "assistant",
+                        "content": generated_text
+                    },
                     "finish_reason": "stop"
                 }]
             }
-
-        print(f"DEBUG: Calling Gemini...")
-        last_message = messages[-1]["content"]
-        # Upgrading to Gemini 2.0 Flash as requested/available
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-001:generateContent?key={settings.GEMINI_API_KEY}"
-        data = {
-            "contents": [{"parts": [{"text": last_message}]}]
-        }
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, json=data, timeout=30.0)
-                response.raise_for_status()
-                result = response.json()
-                
-                # Safe access to avoid index errors if safety filters block content
-                try:
-                    part = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0]
-                    generated_text = part.get("text", "I'm sorry, I couldn't generate a response.")
-                except IndexError:
-                    print(f"⚠️ Gemini Safety Filter triggered or empty response: {result}")
-                    generated_text = "I'm sorry, I couldn't generate a response (Safety Filter)."
-
-                return {
-                    "id": "chatcmpl-gemini",
-                    "object": "chat.completion",
-                    "created": int(time.time()),
-                    "model": "gemini-2.0-flash-001",
-                    "choices": [{
-                        "index": 0,
-                        "message": {
-                            "role": "assistant",
-                            "content": generated_text
-                        },
-                        "finish_reason": "stop"
-                    }]
-                }
-            except httpx.HTTPStatusError as e:
-                print(f"❌ Gemini Error: {e.response.status_code} - {e.response.text}")
-                raise e
+        except httpx.HTTPStatusError as e:
+            print(f"❌ Gemini Error: {e.response.status_code} - {e.response.text}")
+            raise e
 
 provider_service = LLMProvider()
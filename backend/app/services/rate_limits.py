@@ -0,0 +1,227 @@
+import asyncio
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from app.core.config import settings
+from app.services.registry import REGISTRY
+
+
+class RateLimitedError(Exception):
+    """The provider is (or would be) over its rate limit for longer than we
+    are willing to wait; the router moves on to the next provider."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Continuous-refill bucket that may go negative: a caller reserves its
+    cost up front and sleeps off the deficit, so waiters queue FIFO without
+    a polling loop. capacity=None means unlimited.
+    """
+
+    def __init__(self, capacity: Optional[float], per_seconds: float = 60.0):
+        self.per_seconds = per_seconds
+        self.capacity = capacity
+        self.level = capacity or 0.0
+        self.updated = time.monotonic()
+
+    @property
+    def limited(self) -> bool:
+        return bool(self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.limited:
+            rate = self.capacity / self.per_seconds
+            self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` could be taken (0 if available now)"""
+        if not self.limited:
+            return 0.0
+        self._refill()
+        deficit = min(amount, self.capacity) - self.level
+        return max(deficit, 0.0) * self.per_seconds / self.capacity
+
+    def take(self, amount: float):
+        if self.limited:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        if self.limited:
+            self._refill()
+            self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+    def sync(self, limit: Optional[float], remaining: Optional[float]):
+        """Adopt the server's view from x-ratelimit-* headers"""
+        if limit and not self.limited:
+            # First sight of a limit we weren't configured with
+            self.capacity = limit
+            self.level = remaining if remaining is not None else limit
+            self.updated = time.monotonic()
+            return
+        if limit:
+            self.capacity = limit
+        if remaining is not None and self.limited:
+            self._refill()
+            self.level = min(self.level, remaining)
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """'1m30.5s', '6s', '120ms', '2' -> seconds (OpenAI/Groq reset headers)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    return sum(float(n) * units[u] for n, u in parts) if parts else None
+
+
+def parse_retry_after(value: str) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _number(headers, name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class ProviderScheduler:
+    """
+    Client-side RPM/TPM budget for one provider. Limits start from the
+    registry and are corrected by every response's x-ratelimit-* headers
+    (so a tier upgrade is picked up without a config change). A 429 blocks
+    the provider for its Retry-After. Callers that would wait longer than
+    their budget, or find the wait queue full, get RateLimitedError and
+    spill over to the next provider instead.
+    """
+
+    def __init__(self, name: str, rpm: Optional[int], tpm: Optional[int], max_queue: int,
+                 request_header_window: float = 60.0):
+        self.name = name
+        # Groq's x-ratelimit-*-requests headers count per day, OpenAI's per minute
+        self.request_header_window = request_header_window
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_queue = max_queue
+        self.blocked_until = 0.0
+        self.waiting = 0
+        self.stats = {"admitted": 0, "waited": 0, "wait_seconds": 0.0, "spilled": 0, "upstream_429": 0}
+
+    def estimated_wait(self, tokens: int) -> float:
+        return max(
+            self.requests.wait_for(1),
+            self.tokens.wait_for(tokens),
+            self.blocked_until - time.monotonic(),
+            0.0,
+        )
+
+    async def acquire(self, tokens: int, max_wait: float):
+        """Reserve one request and `tokens` tokens, sleeping for up to max_wait"""
+        wait = self.estimated_wait(tokens)
+        if wait > 0 and (wait > max_wait or self.waiting >= self.max_queue):
+            self.stats["spilled"] += 1
+            raise RateLimitedError(f"{self.name} rate limited (~{wait:.1f}s wait)", retry_after=wait)
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.stats["admitted"] += 1
+        if wait <= 0:
+            return
+        self.waiting += 1
+        self.stats["waited"] += 1
+        self.stats["wait_seconds"] += wait
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self.refund(tokens)
+            raise
+        finally:
+            self.waiting -= 1
+
+    def refund(self, tokens: int):
+        """Return a reservation whose request never went out"""
+        self.requests.give_back(1)
+        self.tokens.give_back(tokens)
+
+    def settle(self, reserved: int, actual: int):
+        """Correct the token reservation once the real usage is known"""
+        if actual > reserved:
+            self.tokens.take(actual - reserved)
+        elif reserved > actual:
+            self.tokens.give_back(reserved - actual)
+
+    def observe(self, headers):
+        """Sync buckets with the x-ratelimit-* headers of any response"""
+        remaining_requests = _number(headers, "x-ratelimit-remaining-requests")
+        if self.request_header_window == self.requests.per_seconds:
+            self.requests.sync(_number(headers, "x-ratelimit-limit-requests"), remaining_requests)
+        elif remaining_requests == 0:
+            # Out of a longer (e.g. daily) allowance: nothing to do but wait for the reset
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests")) or 0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + reset)
+        self.tokens.sync(_number(headers, "x-ratelimit-limit-tokens"),
+                         _number(headers, "x-ratelimit-remaining-tokens"))
+
+    def rate_limited(self, headers) -> RateLimitedError:
+        """Record an upstream 429 and block until it says we may retry"""
+        self.stats["upstream_429"] += 1
+        self.observe(headers)
+        reset_requests = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if self.request_header_window != self.requests.per_seconds:
+            reset_requests = None  # a daily reset says nothing about this 429
+        retry_after = (
+            parse_retry_after(headers.get("retry-after"))
+            or parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            or reset_requests
+            or settings.RATE_LIMIT_DEFAULT_RETRY_SECONDS
+        )
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        print(f"🚦 {self.name} returned 429, backing off {retry_after:.1f}s")
+        return RateLimitedError(f"{self.name} returned 429 (retry after {retry_after:.1f}s)", retry_after)
+
+    def snapshot(self) -> dict:
+        def bucket(b: TokenBucket):
+            if not b.limited:
+                return None
+            b._refill()
+            return {"limit_per_min": b.capacity, "available": round(b.level, 1)}
+        return {
+            "requests": bucket(self.requests),
+            "tokens": bucket(self.tokens),
+            "waiting": self.waiting,
+            "blocked_for_s": round(max(self.blocked_until - time.monotonic(), 0.0), 1),
+            **{k: round(v, 2) if isinstance(v, float) else v for k, v in self.stats.items()},
+        }
+
+
+SCHEDULERS = {
+    name: ProviderScheduler(name, spec.rpm, spec.tpm, settings.RATE_LIMIT_MAX_QUEUE,
+                            spec.request_limit_window_seconds)
+    for name, spec in REGISTRY.items()
+}
+
+
+def get_rate_limit_stats() -> dict:
+    return {name: scheduler.snapshot() for name, scheduler in SCHEDULERS.items()}
@@ -0,0 +1,172 @@
+import json
+import os
+from dataclasses import dataclass, field, fields
+from typing import Optional
+from app.core.config import settings
+
+
+@dataclass
+class ProviderSpec:
+    """
+    Everything the router needs to know about one upstream. `kind` picks the
+    wire format: "openai" for any OpenAI-compatible /chat/completions API
+    (LM Studio, Groq, OpenAI, ...), "gemini" for Google's generateContent.
+    Prices are USD per 1k tokens; left unset they come from MODEL_PRICES.
+    """
+    name: str
+    label: str
+    kind: str
+    base_url: str
+    model: str
+    tiers: list
+    input_cost_per_1k: Optional[float] = None
+    output_cost_per_1k: Optional[float] = None
+    context_tokens: int = 8192
+    timeout_seconds: float = 30.0
+    max_concurrency: int = 16
+    max_queue: int = 100  # requests allowed to wait for a concurrency slot
+    queue_wait_budget_seconds: Optional[float] = None  # spill over past this expected wait
+    rpm: Optional[int] = None  # client-side limits; also learned from x-ratelimit-* headers
+    tpm: Optional[int] = None
+    request_limit_window_seconds: float = 60.0  # window of x-ratelimit-*-requests
+    api_key_setting: Optional[str] = None  # Settings field (or env var) holding the key
+    http2: bool = True
+    enabled: bool = True
+    # Dashboard model name per tier, e.g. to flag a cheap model standing in for GPT-4
+    model_labels: dict = field(default_factory=dict)
+    mock_latency_seconds: float = 0.5
+
+    @property
+    def api_key(self) -> Optional[str]:
+        if not self.api_key_setting:
+            return None
+        return getattr(settings, self.api_key_setting, None) or os.environ.get(self.api_key_setting)
+
+    @property
+    def configured(self) -> bool:
+        if not self.enabled:
+            return False
+        if settings.USE_MOCK_LLM:
+            return True
+        return bool(self.base_url) and (self.api_key_setting is None or bool(self.api_key))
+
+    def prices(self, model: str = None) -> tuple:
+        """(prompt, completion) USD per 1k tokens. Explicit registry prices win
+        (e.g. local = free whatever is loaded); otherwise the model that
+        answered, then the configured model, is looked up in MODEL_PRICES."""
+        if self.input_cost_per_1k is not None and self.output_cost_per_1k is not None:
+            return self.input_cost_per_1k, self.output_cost_per_1k
+        return model_price(model) or model_price(self.model) or (0.0, 0.0)
+
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        prompt_price, completion_price = self.prices()
+        return (input_tokens * prompt_price + output_tokens * completion_price) / 1000
+
+
+# USD per 1k (prompt, completion) tokens, by the model name upstreams report
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "llama-3.1-8b-instant": (0.00005, 0.00008),
+    "llama-3.3-70b-versatile": (0.00059, 0.00079),
+    "gemini-2.0-flash-001": (0.0001, 0.0004),
+}
+
+
+def model_price(model: str):
+    """MODEL_PRICES entry for a model name, matching dated snapshots
+    ("gpt-4o-2024-08-06" -> "gpt-4o"); None if unknown"""
+    model = (model or "").split(" (")[0]  # strip dashboard annotations like " (Cached)"
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model.startswith(name + "-"):
+            return MODEL_PRICES[name]
+    return None
+
+
+def _default_providers() -> list:
+    # Order is the tie-break preference within a tier
+    return [
+        ProviderSpec(
+            name="local", label="LOCAL LLM", kind="openai",
+            base_url=settings.LM_STUDIO_URL, model="mythomax-l2-13b",
+            tiers=["complex"],
+            input_cost_per_1k=0.0, output_cost_per_1k=0.0,  # runs on our own hardware
+            context_tokens=4096,
+            timeout_seconds=settings.LOCAL_LLM_TIMEOUT_SECONDS,
+            # One GPU: more concurrency just queues inside LM Studio, so queue here
+            # where the expected wait is visible and can spill to the cloud
+            max_concurrency=settings.LOCAL_MAX_CONCURRENCY,
+            max_queue=settings.LOCAL_MAX_QUEUE,
+            queue_wait_budget_seconds=settings.LOCAL_QUEUE_WAIT_BUDGET_SECONDS,
+            http2=False,
+        ),
+        ProviderSpec(
+            name="groq", label="GROQ", kind="openai",
+            base_url="https://api.groq.com/openai/v1", model="llama-3.1-8b-instant",
+            tiers=["simple", "complex"],
+            context_tokens=131072,
+            timeout_seconds=settings.GROQ_TIMEOUT_SECONDS,
+            max_concurrency=32,
+            rpm=settings.GROQ_RPM, tpm=settings.GROQ_TPM,  # e.g. 30 / 6000 on the free tier
+            request_limit_window_seconds=86400,  # Groq reports requests per day
+            api_key_setting="GROQ_API_KEY",
+            model_labels={"complex": "llama-3.1 (Fallback for GPT-4)"},
+        ),
+        ProviderSpec(
+            name="gemini", label="GEMINI", kind="gemini",
+            base_url="https://generativelanguage.googleapis.com/v1beta", model="gemini-2.0-flash-001",
+            tiers=["simple", "complex"],
+            context_tokens=1048576,
+            timeout_seconds=settings.GEMINI_TIMEOUT_SECONDS,
+            max_concurrency=16,
+            api_key_setting="GEMINI_API_KEY",
+            mock_latency_seconds=1.0,
+        ),
+        ProviderSpec(
+            name="openai", label="OPENAI", kind="openai",
+            base_url="https://api.openai.com/v1", model="gpt-4o",
+            tiers=["complex"],
+            context_tokens=128000,
+            timeout_seconds=settings.OPENAI_TIMEOUT_SECONDS,
+            max_concurrency=16,
+            api_key_setting="OPENAI_API_KEY",
+            mock_latency_seconds=1.5,
+        ),
+    ]
+
+
+def load_registry(path: str = None) -> dict:
+    """
+    Built-in providers, overlaid with PROVIDERS_FILE if set: a JSON list of
+    objects keyed by "name". Known names merge field-by-field (e.g. just
+    {"name": "openai", "enabled": false}); new names add a provider.
+    """
+    specs = {spec.name: spec for spec in _default_providers()}
+    path = path or settings.PROVIDERS_FILE
+    if not path:
+        return specs
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+    known = {f.name for f in fields(ProviderSpec)}
+    for entry in overrides:
+        unknown = set(entry) - known
+        if unknown:
+            raise ValueError(f"Unknown provider field(s) in {path}: {', '.join(sorted(unknown))}")
+        current = specs.get(entry["name"])
+        if current is None:
+            specs[entry["name"]] = ProviderSpec(**entry)
+        else:
+            specs[entry["name"]] = ProviderSpec(**{**current.__dict__, **entry})
+    print(f"Loaded provider registry: {', '.join(n for n, s in specs.items() if s.enabled)}")
+    return specs
+
+
+REGISTRY = load_registry()
+
+
+def tier_providers(tier: str) -> list:
+    """Configured providers serving a tier, in registry order"""
+    return [spec for spec in REGISTRY.values() if tier in spec.tiers and spec.configured]
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import time
+import redis.asyncio as redis
+from app.core.config import settings
+from app.core.metrics import REQUEST_SECONDS
+from app.services.providers import STATS
+
+# STATS stays a plain per-process dict (free to update on the hot path).
+# Every STATS_FLUSH_INTERVAL_SECONDS this module diffs it against what was
+# last flushed and adds the deltas to Redis, so /api/stats shows the sum over
+# all uvicorn workers. The same deltas land in fixed-size ring buffers of
+# time slots for the rolling 1m/5m/1h windows. Without Redis (or while it
+# is unreachable) the in-process rings answer, i.e. this worker only.
+
+REDIS_KEY_PREFIX = "smartroute:stats:"
+
+# Rolling windows: seconds -> ring it is read from
+WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+# (slot seconds, slot count): 5s slots cover 5 minutes, 1 minute slots cover the hour
+RINGS = {"fine": (5, 60), "coarse": (60, 60)}
+
+# Windowed counters (STATS keys) and latency histogram bounds (REQUEST_SECONDS)
+WINDOW_FIELDS = ("total_requests", "cache_hits", "cache_misses", "total_savings")
+LATENCY_BOUNDS = REQUEST_SECONDS.buckets
+
+
+def _ring_for(seconds: int) -> str:
+    return "fine" if seconds <= RINGS["fine"][0] * RINGS["fine"][1] else "coarse"
+
+
+def _percentile(counts: list, q: float):
+    """histogram_quantile-style estimate (linear within a bucket), in ms"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if seen + count >= rank and count:
+            if i == len(LATENCY_BOUNDS):
+                return round(LATENCY_BOUNDS[-1] * 1000, 1)  # beyond the last bound
+            lower = LATENCY_BOUNDS[i - 1] if i else 0.0
+            upper = LATENCY_BOUNDS[i]
+            return round((lower + (upper - lower) * (rank - seen) / count) * 1000, 1)
+        seen += count
+    return round(LATENCY_BOUNDS[-1] * 1000, 1)
+
+
+class RingBuffer:
+    """`size` slots of `resolution` seconds; a slot is reused once it is `size` slots old"""
+
+    def __init__(self, resolution: int, size: int):
+        self.resolution = resolution
+        self.size = size
+        self._ids = [None] * size
+        self._slots = [None] * size
+
+    def add(self, now: float, deltas: dict):
+        slot_id = int(now // self.resolution)
+        pos = slot_id % self.size
+        if self._ids[pos] != slot_id:
+            self._ids[pos], self._slots[pos] = slot_id, {}
+        _merge(self._slots[pos], deltas)
+
+    def window(self, now: float, seconds: int) -> list:
+        newest = int(now // self.resolution)
+        oldest = newest - max(seconds // self.resolution, 1) + 1
+        return [slot for slot_id, slot in zip(self._ids, self._slots)
+                if slot_id is not None and oldest <= slot_id <= newest]
+
+    def clear(self):
+        self._ids = [None] * self.size
+        self._slots = [None] * self.size
+
+
+def _merge(target: dict, deltas: dict):
+    for key, value in deltas.items():
+        target[key] = target.get(key, 0) + value
+
+
+def _summarize(slots: list, seconds: int) -> dict:
+    totals = {}
+    for slot in slots:
+        _merge(totals, slot)
+    hits, misses = totals.get("cache_hits", 0), totals.get("cache_misses", 0)
+    counts = [int(totals.get(f"lat_{i}", 0)) for i in range(len(LATENCY_BOUNDS) + 1)]
+    requests = int(totals.get("total_requests", 0))
+    return {
+        "requests": requests,
+        "rate_per_s": round(requests / seconds, 3),
+        "hit_rate": round(hits / (hits + misses) * 100, 1) if hits + misses else 0,
+        "latency_ms_p50": _percentile(counts, 0.50),
+        "latency_ms_p95": _percentile(counts, 0.95),
+        "latency_ms_p99": _percentile(counts, 0.99),
+        "savings": round(totals.get("total_savings", 0.0), 4),
+    }
+
+
+class StatsStore:
+    def __init__(self):
+        self.backend = settings.STATS_BACKEND  # "redis" or "local"
+        self._client = None
+        self._disabled_until = 0.0
+        self._baseline = {}
+        self._latency_baseline = [0] * (len(LATENCY_BOUNDS) + 1)
+        self._latest_sent = 0
+        self._unsent = {}  # deltas Redis did not take yet: retried on the next flush
+        self._totals = {}  # this worker's flushed totals (the local backend)
+        self._rings = {name: RingBuffer(*shape) for name, shape in RINGS.items()}
+        self.stats = {"flushes": 0, "redis_errors": 0}
+        if self.backend == "redis":
+            self._client = redis.from_url(
+                settings.REDIS_URL,
+                socket_timeout=settings.REDIS_TIMEOUT_SECONDS,
+                socket_connect_timeout=settings.REDIS_TIMEOUT_SECONDS,
+                decode_responses=True,
+            )
+
+    @property
+    def shared(self) -> bool:
+        return self._client is not None and time.monotonic() >= self._disabled_until
+
+    def _fail(self, e: Exception):
+        self.stats["redis_errors"] += 1
+        if self.shared:
+            print(f"⚠️ Redis stats store unavailable ({e}). Showing this worker only for 30s")
+        self._disabled_until = time.monotonic() + 30.0
+
+    def _collect(self) -> dict:
+        """Deltas of numeric STATS keys and latency buckets since the last flush"""
+        deltas = {}
+        for key, value in STATS.items():
+            if isinstance(value, (int, float)):
+                delta = value - self._baseline.get(key, 0)
+                if delta:
+                    deltas[key] = delta
+                self._baseline[key] = value
+        counts = REQUEST_SECONDS.bucket_counts()
+        for i, (count, before) in enumerate(zip(counts, self._latency_baseline)):
+            if count != before:
+                deltas[f"lat_{i}"] = count - before
+        self._latency_baseline = counts
+        return deltas
+
+    async def flush(self):
+        """Push this worker's new counts. Cheap and safe to call often: the
+        diff is taken synchronously, so concurrent flushes never double-count."""
+        now = time.time()
+        deltas = self._collect()
+        latest = STATS.get("latest_request") or {}
+        latest_changed = latest.get("timestamp", 0) > self._latest_sent
+        self._latest_sent = max(self._latest_sent, latest.get("timestamp", 0))
+        if deltas:
+            _merge(self._totals, deltas)
+            windowed = {k: v for k, v in deltas.items() if k in WINDOW_FIELDS or k.startswith("lat_")}
+            for ring in self._rings.values():
+                ring.add(now, windowed)
+        if self._client is None:
+            return
+        _merge(self._unsent, deltas)  # kept while Redis is down, sent once it is back
+        if not self.shared:
+            return
+        if not self._unsent and not latest_changed:
+            return
+        pending, self._unsent = self._unsent, {}
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for key, value in pending.items():
+                if not key.startswith("lat_"):
+                    pipe.hincrbyfloat(REDIS_KEY_PREFIX + "totals", key, value)
+            windowed = {k: v for k, v in pending.items() if k in WINDOW_FIELDS or k.startswith("lat_")}
+            for name, (resolution, size) in RINGS.items():
+                if not windowed:
+                    break
+                slot_key = f"{REDIS_KEY_PREFIX}{name}:{int(now // resolution)}"
+                for key, value in windowed.items():
+                    pipe.hincrbyfloat(slot_key, key, value)
+                # Expiry turns the per-slot keys into a ring of `size` slots
+                pipe.expire(slot_key, resolution * (size + 1))
+            if latest_changed:
+                pipe.set(REDIS_KEY_PREFIX + "latest", json.dumps(latest))
+            await pipe.execute()
+            self.stats["flushes"] += 1
+        except Exception as e:
+            _merge(self._unsent, pending)
+            self._fail(e)
+
+    async def snapshot(self) -> dict:
+        """Totals (all workers when shared) plus rolling windows"""
+        await self.flush()
+        now = time.time()
+        if self.shared:
+            try:
+                return await self._redis_snapshot(now)
+            except Exception as e:
+                self._fail(e)
+        return {
+            "source": "local",
+            "totals": dict(self._totals),
+            "latest_request": STATS.get("latest_request"),
+            "windows": {name: _summarize(self._rings[_ring_for(s)].window(now, s), s)
+                        for name, s in WINDOWS.items()},
+        }
+
+    async def _redis_snapshot(self, now: float) -> dict:
+        pipe = self._client.pipeline(transaction=False)
+        pipe.hgetall(REDIS_KEY_PREFIX + "totals")
+        pipe.get(REDIS_KEY_PREFIX + "latest")
+        slot_ids = {}
+        for name, (resolution, size) in RINGS.items():
+            newest = int(now // resolution)
+            slot_ids[name] = list(range(newest - size + 1, newest + 1))
+            for slot_id in slot_ids[name]:
+                pipe.hgetall(f"{REDIS_KEY_PREFIX}{name}:{slot_id}")
+        results = await pipe.execute()
+        totals = {k: float(v) for k, v in results[0].items()}
+        latest = json.loads(results[1]) if results[1] else STATS.get("latest_request")
+
+        rings, i = {}, 2
+        for name, ids in slot_ids.items():
+            rings[name] = dict(zip(ids, results[i:i + len(ids)]))
+            i += len(ids)
+        windows = {}
+        for name, seconds in WINDOWS.items():
+            ring = _ring_for(seconds)
+            resolution = RINGS[ring][0]
+            newest = int(now // resolution)
+            oldest = newest - max(seconds // resolution, 1) + 1
+            slots = [{k: float(v) for k, v in slot.items()}
+                     for slot_id, slot in rings[ring].items() if oldest <= slot_id <= newest]
+            windows[name] = _summarize(slots, seconds)
+        return {"source": "redis", "totals": totals, "latest_request": latest, "windows": windows}
+
+    async def reset(self):
+        """Forget everything (all workers): called after STATS itself was reset"""
+        self._baseline = {k: v for k, v in STATS.items() if isinstance(v, (int, float))}
+        self._latency_baseline = REQUEST_SECONDS.bucket_counts()
+        self._unsent, self._totals = {}, {}
+        for ring in self._rings.values():
+            ring.clear()
+        if self._client is None:
+            return
+        try:
+            keys = [k async for k in self._client.scan_iter(match=REDIS_KEY_PREFIX + "*", count=500)]
+            if keys:
+                await self._client.delete(*keys)
+        except Exception as e:
+            self._fail(e)
+
+    async def close(self):
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+
+    def get_stats(self) -> dict:
+        return {"backend": self.backend, "shared": self.shared, **self.stats}
+
+
+stats_store = StatsStore()
+
+
+async def stats_flush_loop():
+    """Background task: push this worker's counts every STATS_FLUSH_INTERVAL_SECONDS"""
+    while True:
+        await asyncio.sleep(settings.STATS_FLUSH_INTERVAL_SECONDS)
+        try:
+            await stats_store.flush()
+        except Exception as e:
+            print(f"Error flushing stats: {e}")
@@ -0,0 +1,96 @@
+import json
+import re
+import time
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+
+def sse_event(payload: dict) -> bytes:
+    return f"data: {json.dumps(payload, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+def sse_named_event(event: str, payload: dict) -> bytes:
+    """An SSE frame with an `event:` type (EventSource addEventListener)"""
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+def replay_as_sse(response: dict, words_per_chunk: int = 4):
+    """Turn a full chat.completion into the chunk sequence an upstream stream
+    would have produced, so streaming clients see one protocol for hits and misses"""
+    choice = (response.get("choices") or [{}])[0]
+    content = (choice.get("message") or {}).get("content") or ""
+    base = {
+        "id": response.get("id", "chatcmpl-cached"),
+        "object": "chat.completion.chunk",
+        "created": response.get("created", int(time.time())),
+        "model": response.get("model", ""),
+    }
+
+    yield sse_event({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+    words = re.findall(r"\S+\s*|\s+", content)
+    for i in range(0, len(words), words_per_chunk):
+        piece = "".join(words[i:i + words_per_chunk])
+        yield sse_event({**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+    yield sse_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": choice.get("finish_reason", "stop")}]})
+    yield SSE_DONE
+
+
+def delta_content(event: bytes) -> str:
+    """Content text of one SSE chunk event ("" for the role-only first chunk,
+    the finish chunk and [DONE])"""
+    if not event.startswith(b"data: {"):
+        return ""
+    chunk = json.loads(event[len(b"data: "):])
+    choices = chunk.get("choices") or [{}]
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+class StreamAssembler:
+    """Accumulates OpenAI-style chat.completion.chunk objects into the
+    equivalent non-streamed chat.completion, for caching once the stream ends"""
+
+    def __init__(self):
+        self.id = None
+        self.model = None
+        self.created = None
+        self.parts = []
+        self.finish_reason = None
+        self.usage = None
+
+    def add(self, chunk: dict):
+        self.id = self.id or chunk.get("id")
+        self.model = self.model or chunk.get("model")
+        self.created = self.created or chunk.get("created")
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        # Groq reports usage on the last chunk under x_groq
+        if (chunk.get("x_groq") or {}).get("usage"):
+            self.usage = chunk["x_groq"]["usage"]
+        for choice in chunk.get("choices") or []:
+            if choice.get("index", 0) != 0:
+                continue
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                self.parts.append(content)
+            if choice.get("finish_reason"):
+                self.finish_reason = choice["finish_reason"]
+
+    @property
+    def content(self) -> str:
+        return "".join(self.parts)
+
+    def to_response(self) -> dict:
+        response = {
+            "id": self.id or "chatcmpl-stream",
+            "object": "chat.completion",
+            "created": self.created or int(time.time()),
+            "model": self.model or "",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.content},
+                "finish_reason": self.finish_reason or "stop"
+            }]
+        }
+        if self.usage:
+            response["usage"] = self.usage
+        return response
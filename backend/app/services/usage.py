@@ -0,0 +1,209 @@
+import asyncio
+import json
+import threading
+from dataclasses import dataclass
+from app.services.registry import REGISTRY
+from app.core.config import settings
+
+# tiktoken's cl100k_base, loaded by init_tokenizer() from the warmup task:
+# on a cold cache it downloads its BPE file, which must not hold up startup.
+# Until then (or if it can't load) tokens are estimated from the length.
+_ENCODING = None
+
+# Per-message framing tokens in the chat format (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _empty_bucket() -> dict:
+    return {
+        "requests": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "estimated_requests": 0,  # usage missing upstream, counted locally
+        "cost": 0.0,
+        "baseline_cost": 0.0,
+        "generation_seconds": 0.0,
+    }
+
+
+USAGE_STATS = {
+    "providers": {},
+    "tiers": {},
+    "cached": _empty_bucket(),
+}
+
+
+@dataclass
+class Usage:
+    prompt_tokens: int
+    completion_tokens: int
+    estimated: bool
+    cost: float = 0.0
+    baseline_cost: float = 0.0
+
+    @property
+    def savings(self) -> float:
+        return self.baseline_cost - self.cost
+
+
+def _load_encoding():
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def _in_daemon_thread(fn) -> asyncio.Future:
+    """Run fn in a daemon thread: tiktoken's download has no timeout, and a
+    stuck executor thread would also hold up interpreter shutdown"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result, error):
+        if not future.done():
+            future.set_exception(error) if error is not None else future.set_result(result)
+
+    def run():
+        try:
+            result, error = fn(), None
+        except Exception as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:
+            pass  # loop already closed
+
+    threading.Thread(target=run, name="tokenizer-load", daemon=True).start()
+    return future
+
+
+async def init_tokenizer() -> bool:
+    global _ENCODING
+    try:
+        _ENCODING = await asyncio.wait_for(_in_daemon_thread(_load_encoding),
+                                           timeout=settings.TOKENIZER_LOAD_TIMEOUT_SECONDS)
+        print("✅ Tokenizer ready (tiktoken cl100k_base)")
+        return True
+    except Exception as e:  # not installed, offline without a cached BPE file, or too slow
+        print(f"⚠️ tiktoken unavailable ({e!r}). Estimating ~4 characters per token")
+        return False
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)  # ~4 chars per token for English
+
+
+def count_message_tokens(messages: list) -> int:
+    """Prompt tokens of a chat request. The router counts once per request
+    and passes the number on (routing, RPM/TPM reservations, usage)."""
+    total = 0
+    for m in messages:
+        content = m.get("content") or ""
+        total += count_tokens(content if isinstance(content, str) else json.dumps(content))
+        total += MESSAGE_OVERHEAD_TOKENS
+    return total
+
+
+def _response_text(response: dict) -> str:
+    choice = (response.get("choices") or [{}])[0]
+    return (choice.get("message") or {}).get("content") or ""
+
+
+def baseline_price() -> tuple:
+    """Prices of the model every answer is compared against for savings"""
+    return REGISTRY[settings.SAVINGS_BASELINE_PROVIDER].prices()
+
+
+def measure(messages: list, response: dict, prompt_tokens: int = None) -> Usage:
+    """Token counts for one exchange: the upstream `usage` block when it has
+    one, else local counts. Missing usage is written back into the response
+    so clients always get an OpenAI-shaped `usage`."""
+    usage = response.get("usage") or {}
+    if usage.get("prompt_tokens") is not None and usage.get("completion_tokens") is not None:
+        return Usage(int(usage["prompt_tokens"]), int(usage["completion_tokens"]), estimated=False)
+    if prompt_tokens is None:
+        prompt_tokens = count_message_tokens(messages)
+    result = Usage(prompt_tokens, count_tokens(_response_text(response)), estimated=True)
+    response["usage"] = {
+        "prompt_tokens": result.prompt_tokens,
+        "completion_tokens": result.completion_tokens,
+        "total_tokens": result.prompt_tokens + result.completion_tokens,
+    }
+    return result
+
+
+def _price(usage: Usage, price: tuple) -> float:
+    return (usage.prompt_tokens * price[0] + usage.completion_tokens * price[1]) / 1000
+
+
+def _add(bucket: dict, usage: Usage, seconds: float):
+    bucket["requests"] += 1
+    bucket["prompt_tokens"] += usage.prompt_tokens
+    bucket["completion_tokens"] += usage.completion_tokens
+    bucket["estimated_requests"] += int(usage.estimated)
+    bucket["cost"] += usage.cost
+    bucket["baseline_cost"] += usage.baseline_cost
+    bucket["generation_seconds"] += seconds
+
+
+def record_usage(provider: str, tier: str, messages: list, response: dict, seconds: float,
+                 prompt_tokens: int = None) -> Usage:
+    """Price an answered request and add it to the per-provider and per-tier totals"""
+    usage = measure(messages, response, prompt_tokens)
+    usage.cost = _price(usage, REGISTRY[provider].prices(response.get("model")))
+    usage.baseline_cost = _price(usage, baseline_price())
+    _add(USAGE_STATS["providers"].setdefault(provider, _empty_bucket()), usage, seconds)
+    _add(USAGE_STATS["tiers"].setdefault(tier, _empty_bucket()), usage, seconds)
+    return usage
+
+
+def record_cached(messages: list, response: dict) -> Usage:
+    """A cache hit costs nothing; it saves what the baseline would have charged"""
+    usage = measure(messages, response)
+    usage.baseline_cost = _price(usage, baseline_price())
+    _add(USAGE_STATS["cached"], usage, 0.0)
+    return usage
+
+
+def avg_completion_tokens(tier: str):
+    """Observed mean completion length for a tier (None until there is traffic)"""
+    bucket = USAGE_STATS["tiers"].get(tier)
+    if not bucket or not bucket["requests"]:
+        return None
+    return bucket["completion_tokens"] / bucket["requests"]
+
+
+def _summary(bucket: dict) -> dict:
+    requests = bucket["requests"]
+    seconds = bucket["generation_seconds"]
+    return {
+        **bucket,
+        "cost": round(bucket["cost"], 6),
+        "baseline_cost": round(bucket["baseline_cost"], 6),
+        "savings": round(bucket["baseline_cost"] - bucket["cost"], 6),
+        "generation_seconds": round(seconds, 3),
+        "tokens_per_second": round(bucket["completion_tokens"] / seconds, 1) if seconds else 0,
+        "cost_per_1k_requests": round(bucket["cost"] / requests * 1000, 4) if requests else 0,
+    }
+
+
+def get_usage_stats() -> dict:
+    totals = _empty_bucket()
+    for bucket in list(USAGE_STATS["providers"].values()) + [USAGE_STATS["cached"]]:
+        for key in totals:
+            totals[key] += bucket[key]
+    return {
+        "tokenizer": "tiktoken:cl100k_base" if _ENCODING is not None else "chars/4",
+        "total": _summary(totals),
+        "cached": _summary(USAGE_STATS["cached"]),
+        "providers": {name: _summary(b) for name, b in USAGE_STATS["providers"].items()},
+        "tiers": {name: _summary(b) for name, b in USAGE_STATS["tiers"].items()},
+    }
+
+
+def reset_usage():
+    USAGE_STATS["providers"].clear()
+    USAGE_STATS["tiers"].clear()
+    USAGE_STATS["cached"] = _empty_bucket()
@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+# Settings are read once at import: keep the tests offline (mock LLMs, no
+# Redis) and away from the real cache directories before anything imports app.*
+os.environ.setdefault("USE_MOCK_LLM", "true")
+os.environ.setdefault("REDIS_CACHE_ENABLED", "false")
+os.environ.setdefault("STATS_BACKEND", "local")
+os.environ.setdefault("CACHE_BACKEND", "numpy")
+os.environ.setdefault("NUMPY_INDEX_PATH", tempfile.mkdtemp(prefix="smartroute-test-index-"))
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
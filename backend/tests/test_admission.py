@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from app.services.admission import AdmissionController, AdmissionRejected
+
+pytestmark = pytest.mark.anyio
+
+# A registry name: the expected wait reads that provider's latency tracker
+PROVIDER = "local"
+
+
+async def _queued(controller: AdmissionController, n: int = 1) -> list:
+    tasks = [asyncio.create_task(controller.acquire()) for _ in range(n)]
+    await asyncio.sleep(0)
+    return tasks
+
+
+async def test_release_hands_the_slot_to_the_first_waiter():
+    controller = AdmissionController(PROVIDER, concurrency=1, max_queue=4)
+    await controller.acquire()
+    first, second = await _queued(controller, 2)
+    assert controller.queued == 2
+
+    controller.release()
+    await first
+    assert not second.done()
+    assert controller.in_flight == 1
+
+    controller.release()
+    await second
+    controller.release()
+    assert controller.in_flight == 0
+
+
+async def test_cancelled_waiter_leaves_the_queue():
+    controller = AdmissionController(PROVIDER, concurrency=1, max_queue=4)
+    await controller.acquire()
+    (waiter,) = await _queued(controller)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert controller.queued == 0
+    controller.release()
+    assert controller.in_flight == 0
+
+
+async def test_slot_handed_to_a_cancelled_waiter_is_passed_on():
+    controller = AdmissionController(PROVIDER, concurrency=1, max_queue=4)
+    await controller.acquire()
+    first, second = await _queued(controller, 2)
+
+    controller.release()  # slot handed to `first`...
+    first.cancel()        # ...which is cancelled before it runs
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    await second
+    assert controller.in_flight == 1
+    controller.release()
+    assert controller.in_flight == 0
+
+
+async def test_waiter_already_skipped_by_release_cancels_cleanly():
+    controller = AdmissionController(PROVIDER, concurrency=1, max_queue=4)
+    await controller.acquire()
+    first, second = await _queued(controller, 2)
+
+    first.cancel()        # cancels first's queue future right away...
+    controller.release()  # ...so release skips it and admits `second`
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    await second
+    assert controller.queued == 0
+    assert controller.in_flight == 1
+
+
+async def test_full_queue_or_long_wait_spills_over():
+    controller = AdmissionController(PROVIDER, concurrency=1, max_queue=1)
+    await controller.acquire()
+    await _queued(controller)
+    with pytest.raises(AdmissionRejected):
+        await controller.acquire()  # queue full
+    assert controller.stats["spilled"] == 1
+
+    roomy = AdmissionController(PROVIDER, concurrency=1, max_queue=8)
+    await roomy.acquire()
+    with pytest.raises(AdmissionRejected):
+        await roomy.acquire(max_wait=0.0)  # any queueing exceeds the budget
@@ -0,0 +1,49 @@
+import pytest
+from app.services import batches
+from app.services.providers import STATS, provider_service
+from app.services.rate_limits import RateLimitedError
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_retried_item_counts_as_one_request(monkeypatch):
+    calls = []
+
+    async def flaky(messages, lookup):
+        calls.append(1)
+        if len(calls) == 1:
+            cause = RateLimitedError("groq rate limited", retry_after=0.0)
+            raise Exception("All providers failed for simple query") from cause
+        return {"choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+
+    monkeypatch.setattr(provider_service, "_route_uncached", flaky)
+    monkeypatch.setattr(batches.settings, "BATCH_MAX_RETRIES", 2)
+    requests_before, misses_before = STATS["total_requests"], STATS["cache_misses"]
+
+    job = batches.batch_manager.submit(
+        [{"custom_id": "a", "messages": [{"role": "user", "content": "retried batch prompt"}]}])
+    await job.task
+
+    assert job.status == "completed"
+    assert job.counts["retried"] == 1
+    assert job.counts["completed"] == 1
+    assert len(calls) == 2
+    assert STATS["total_requests"] - requests_before == 1
+    assert STATS["cache_misses"] - misses_before == 1
+
+
+async def test_identical_prompts_are_answered_once(monkeypatch):
+    calls = []
+
+    async def answer(messages, lookup):
+        calls.append(1)
+        return {"choices": [{"message": {"role": "assistant", "content": "same"}}]}
+
+    monkeypatch.setattr(provider_service, "_route_uncached", answer)
+    prompt = [{"role": "user", "content": "duplicate batch prompt"}]
+    job = batches.batch_manager.submit([{"custom_id": str(i), "messages": prompt} for i in range(3)])
+    await job.task
+
+    assert len(calls) == 1
+    assert job.counts["unique"] == 1
+    assert job.counts["completed"] == 3
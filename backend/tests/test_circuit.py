@@ -0,0 +1,79 @@
+import httpx
+import pytest
+from app.core.config import settings
+from app.services.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from app.services.providers import _is_client_error
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_CONSECUTIVE_FAILURES", 3)
+    monkeypatch.setattr(settings, "CIRCUIT_MIN_CALLS", 5)
+    monkeypatch.setattr(settings, "CIRCUIT_ERROR_RATE", 0.5)
+    monkeypatch.setattr(settings, "CIRCUIT_WINDOW_SECONDS", 60.0)
+    monkeypatch.setattr(settings, "CIRCUIT_OPEN_SECONDS", 30.0)
+
+
+def _open(breaker: CircuitBreaker):
+    for _ in range(settings.CIRCUIT_CONSECUTIVE_FAILURES):
+        breaker.before_call()
+        breaker.record(ok=False)
+
+
+def test_consecutive_failures_open_the_circuit():
+    breaker = CircuitBreaker("t")
+    breaker.record(ok=False)
+    breaker.record(ok=False)
+    assert breaker.state == CLOSED
+    breaker.record(ok=False)
+    assert breaker.state == OPEN
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_error_rate_opens_the_circuit():
+    breaker = CircuitBreaker("t")
+    for ok in (True, False, True, False, True, False):
+        breaker.record(ok=ok)
+    assert breaker.state == OPEN
+
+
+def test_half_open_allows_one_trial_that_closes_on_success():
+    breaker = CircuitBreaker("t")
+    _open(breaker)
+    breaker.opened_at -= settings.CIRCUIT_OPEN_SECONDS  # cool-down over
+    assert breaker.available()
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # the trial is taken
+    breaker.record(ok=True)
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_failures == 0
+
+
+def test_failed_trial_reopens_and_released_trial_frees_the_slot():
+    breaker = CircuitBreaker("t")
+    _open(breaker)
+    breaker.opened_at -= settings.CIRCUIT_OPEN_SECONDS
+    breaker.before_call()
+    breaker.release()  # e.g. a hedge loser: no verdict, next caller may try
+    breaker.before_call()
+    breaker.record(ok=False)
+    assert breaker.state == OPEN
+    assert not breaker.available()
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://provider.test/chat/completions")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.mark.parametrize("status, client_error", [
+    (400, True), (413, True), (422, True),
+    (401, False), (403, False), (404, False), (429, False), (500, False), (503, False),
+])
+def test_only_request_shaped_errors_are_exempt(status, client_error):
+    assert _is_client_error(_status_error(status)) is client_error
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from app.core.embeddings import EmbeddingBatcher
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeModel:
+    """Records every encode() call; `gate` holds the encode thread until set"""
+
+    def __init__(self, gate: threading.Event = None):
+        self.calls = []
+        self.gate = gate
+
+    def encode(self, texts, batch_size=None):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.calls.append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts])
+
+
+async def test_concurrent_duplicates_share_one_encode():
+    model = FakeModel()
+    batcher = EmbeddingBatcher(model, max_batch_size=8, max_wait_ms=20, memo_size=0)
+    try:
+        results = await asyncio.gather(*(batcher.encode(t) for t in ["a", "bb", "a", "a", "bb"]))
+    finally:
+        await batcher.close()
+    assert model.calls == [["a", "bb"]]
+    assert results == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0], [1.0, 1.0], [2.0, 1.0]]
+
+
+async def test_memo_answers_repeats_without_the_model():
+    model = FakeModel()
+    batcher = EmbeddingBatcher(model, max_batch_size=8, max_wait_ms=0, memo_size=16)
+    try:
+        first = await batcher.encode("hello")
+        again = await batcher.encode("hello")
+    finally:
+        await batcher.close()
+    assert first == again
+    assert len(model.calls) == 1
+    assert batcher.stats["memo_hits"] == 1
+
+
+async def test_cancelled_caller_does_not_cancel_the_shared_vector():
+    gate = threading.Event()
+    model = FakeModel(gate)
+    batcher = EmbeddingBatcher(model, max_batch_size=8, max_wait_ms=0, memo_size=0)
+    try:
+        quitter = asyncio.create_task(batcher.encode("shared"))
+        stayer = asyncio.create_task(batcher.encode("shared"))
+        await asyncio.sleep(0.05)  # both waiting on the one in-flight encode
+        quitter.cancel()
+        gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await quitter
+        assert await stayer == [6.0, 1.0]
+    finally:
+        gate.set()
+        await batcher.close()
+    assert model.calls == [["shared"]]
+
+
+async def test_encode_many_batches_and_dedupes():
+    model = FakeModel()
+    batcher = EmbeddingBatcher(model, max_batch_size=2, max_wait_ms=0, memo_size=16)
+    try:
+        vectors = await batcher.encode_many(["a", "bb", "a", "ccc"])
+    finally:
+        await batcher.close()
+    assert model.calls == [["a", "bb"], ["ccc"]]
+    assert [v[0] for v in vectors] == [1.0, 2.0, 1.0, 3.0]
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from app.services import rate_limits
+from app.services.rate_limits import ProviderScheduler, RateLimitedError, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limits.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_refills_continuously(clock):
+    bucket = TokenBucket(60, per_seconds=60.0)  # 1 per second
+    bucket.take(60)
+    assert bucket.wait_for(1) == pytest.approx(1.0)
+    clock.now += 30
+    assert bucket.wait_for(30) == pytest.approx(0.0)
+    assert bucket.wait_for(31) == pytest.approx(1.0)
+
+
+def test_bucket_goes_negative_so_waiters_queue(clock):
+    bucket = TokenBucket(10, per_seconds=10.0)
+    bucket.take(10)
+    bucket.take(5)  # reserved ahead: the next caller waits behind it
+    assert bucket.wait_for(1) == pytest.approx(6.0)
+    bucket.give_back(5)
+    assert bucket.wait_for(1) == pytest.approx(1.0)
+
+
+def test_unlimited_bucket_never_waits(clock):
+    bucket = TokenBucket(None)
+    bucket.take(10 ** 6)
+    assert bucket.wait_for(10 ** 6) == 0.0
+
+
+def test_headers_teach_an_unconfigured_limit(clock):
+    bucket = TokenBucket(None)
+    bucket.sync(limit=100, remaining=3)
+    assert bucket.limited
+    assert bucket.level == 3
+    bucket.sync(limit=100, remaining=1)  # the server's view wins when lower
+    assert bucket.level == 1
+
+
+@pytest.mark.anyio
+async def test_scheduler_spills_when_the_wait_exceeds_the_budget(clock):
+    scheduler = ProviderScheduler("t", rpm=1, tpm=None, max_queue=4)
+    await scheduler.acquire(10, max_wait=0.0)
+    with pytest.raises(RateLimitedError) as raised:
+        await scheduler.acquire(10, max_wait=5.0)
+    assert raised.value.retry_after == pytest.approx(60.0)
+    assert scheduler.stats["spilled"] == 1
+
+
+@pytest.mark.anyio
+async def test_cancelled_wait_refunds_the_reservation(clock):
+    scheduler = ProviderScheduler("t", rpm=60, tpm=None, max_queue=4)  # 1 request per second
+    for _ in range(60):
+        await scheduler.acquire(1, max_wait=0.0)
+    waiter = asyncio.create_task(scheduler.acquire(1, max_wait=10.0))
+    await asyncio.sleep(0)
+    assert scheduler.waiting == 1
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler.waiting == 0
+    assert scheduler.requests.wait_for(1) == pytest.approx(1.0)  # back to one request short
+
+
+def test_429_blocks_for_retry_after(clock):
+    scheduler = ProviderScheduler("t", rpm=None, tpm=None, max_queue=4)
+    error = scheduler.rate_limited({"retry-after": "7"})
+    assert error.retry_after == pytest.approx(7.0)
+    assert scheduler.estimated_wait(1) == pytest.approx(7.0)
+    clock.now += 7
+    assert scheduler.estimated_wait(1) == 0.0
+
+
+def test_parse_duration():
+    assert rate_limits.parse_duration("1m30.5s") == pytest.approx(90.5)
+    assert rate_limits.parse_duration("120ms") == pytest.approx(0.12)
+    assert rate_limits.parse_duration("2") == 2.0
+    assert rate_limits.parse_duration("") is None
@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from app.core.cache import CacheLookup
+from app.services.providers import LLMProvider
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "same prompt"}]
+
+
+def _lookup() -> CacheLookup:
+    return CacheLookup(key="k-single-flight", prompt_text="same prompt")
+
+
+async def test_followers_share_the_leaders_answer():
+    router = LLMProvider()
+    calls = []
+    release = asyncio.Event()
+
+    async def upstream(messages, lookup):
+        calls.append(lookup.key)
+        await release.wait()
+        return {"choices": [{"message": {"content": "answer"}}]}
+
+    tasks = [asyncio.create_task(router.route_request(MESSAGES, lookup=_lookup(), upstream=upstream))
+             for _ in range(3)]
+    await asyncio.sleep(0.01)
+    release.set()
+    results = await asyncio.gather(*tasks)
+    assert len(calls) == 1
+    assert all(r["choices"][0]["message"]["content"] == "answer" for r in results)
+    # Each caller gets its own copy (the router annotates responses in place)
+    assert len({id(r) for r in results}) == 3
+    assert router._inflight == {}
+
+
+async def test_leader_failure_is_shared_not_retried():
+    router = LLMProvider()
+    calls = []
+
+    async def upstream(messages, lookup):
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    results = await asyncio.gather(
+        *(router.route_request(MESSAGES, lookup=_lookup(), upstream=upstream) for _ in range(3)),
+        return_exceptions=True)
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+async def test_cancelled_leader_hands_off_to_a_follower():
+    router = LLMProvider()
+    calls = []
+
+    async def upstream(messages, lookup):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"choices": [{"message": {"content": f"answer {len(calls)}"}}]}
+
+    leader = asyncio.create_task(router.route_request(MESSAGES, lookup=_lookup(), upstream=upstream))
+    await asyncio.sleep(0.01)
+    follower = asyncio.create_task(router.route_request(MESSAGES, lookup=_lookup(), upstream=upstream))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+
+    response = await follower
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    assert len(calls) == 2  # the follower became the new leader
+    assert response["choices"][0]["message"]["content"] == "answer 2"
+    assert router._inflight == {}
@@ -32,22 +32,54 @@ function Dashboard() {
             }
         };
 
-        const interval = setInterval(fetchStats, 1000); // Increased polling freq to 1s for "real-time" feel
-        fetchStats(); // Initial fetch
-        return () => clearInterval(interval);
+        // Fallback: poll every 1s when the push stream is unavailable
+        let interval = null;
+        const startPolling = () => {
+            if (interval) return;
+            fetchStats();
+            interval = setInterval(fetchStats, 1000);
+        };
+
+        if (typeof EventSource === 'undefined') {
+            startPolling();
+            return () => clearInterval(interval);
+        }
+
+        // Push: a full snapshot, then coalesced deltas and per-request events
+        const source = new EventSource('http://localhost:8000/api/stats/stream');
+        source.addEventListener('snapshot', (e) => setStats(prev => ({ ...prev, ...JSON.parse(e.data) })));
+        source.addEventListener('delta', (e) => setStats(prev => mergeDelta(prev, JSON.parse(e.data))));
+        source.addEventListener('request', (e) => {
+            const { type, provider, timestamp } = JSON.parse(e.data);
+            setStats(prev => ({ ...prev, latest_request: { type, provider, timestamp } }));
+        });
+        source.onerror = () => {
+            // CONNECTING means the browser is retrying on its own; CLOSED means it gave up
+            if (source.readyState === EventSource.CLOSED) {
+                console.warn("Stats stream unavailable, falling back to polling");
+                startPolling();
+            }
+        };
+
+        return () => {
+            source.close();
+            clearInterval(interval);
+        };
     }, []);
 
     const purgeCache = async () => {
         if (!confirm("Are you sure you want to purge the cache? This will reset all stats.")) return;
         try {
             await fetch('http://localhost:8000/api/cache/clear', { method: 'POST' });
-            setStats({
+            // Keep the rest of the payload: stream deltas are applied on top of it
+            setStats(prev => ({
+                ...prev,
                 requests: 0,
                 savings: 0,
                 hit_rate: 0,
                 provider_groq: 0,
                 provider_local: 0
-            });
+            }));
         } catch (err) {
             console.error("Failed to purge cache", err);
         }
@@ -91,7 +123,12 @@ function Dashboard() {
 
             <div className="grid grid-cols-1 md:grid-cols-3 gap-6 mb-12">
                 {/* Metric Cards */}
-                <MetricCard title="Total Requests" value={stats.requests} icon="📊" />
+                <MetricCard
+                    title="Total Requests"
+                    value={stats.requests}
+                    subValue={stats.usage ? `${stats.usage.total.tokens_per_second} tok/s · $${stats.usage.total.cost_per_1k_requests.toFixed(2)} / 1k req` : undefined}
+                    icon="📊"
+                />
                 <MetricCard
                     title="Est. Savings"
                     value={`$${(stats.savings || 0).toFixed(4)}`}
@@ -194,6 +231,21 @@ function Dashboard() {
     );
 }
 
+// Apply a /api/stats/stream delta: nested objects merge, null removes a key
+function mergeDelta(target, delta) {
+    const result = { ...target };
+    for (const [key, value] of Object.entries(delta)) {
+        if (value === null) {
+            delete result[key];
+        } else if (typeof value === 'object' && !Array.isArray(value) && result[key] && typeof result[key] === 'object' && !Array.isArray(result[key])) {
+            result[key] = mergeDelta(result[key], value);
+        } else {
+            result[key] = value;
+        }
+    }
+    return result;
+}
+
 function MetricCard({ title, value, subValue, success, icon, action }) {
     return (
         <div className="glass-card glass-card-hover p-8 rounded-3xl relative overflow-hidden group">
@@ -4,10 +4,12 @@ export function Playground() {
     const [prompt, setPrompt] = useState('');
     const [result, setResult] = useState(null);
     const [loading, setLoading] = useState(false);
+    const [error, setError] = useState(null);
 
     const testRoute = async () => {
         setLoading(true);
         setResult(null);
+        setError(null);
         try {
             const start = Date.now();
             const res = await fetch('http://localhost:8000/v1/chat/completions', {
@@ -15,20 +17,55 @@ export function Playground() {
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                     messages: [{ role: 'user', content: prompt }],
-                    model: 'gpt-4o' // We ask for GPT-4, looking for arbitrage
+                    model: 'gpt-4o', // We ask for GPT-4, looking for arbitrage
+                    stream: true // Tokens render as they arrive (cache hits are replayed the same way)
                 })
             });
-            const data = await res.json();
-            const duration = Date.now() - start;
-
-            setResult({
-                model: data.model,
-                content: data.choices[0].message.content,
-                duration: duration,
-                isCached: data.model.includes('Cached')
+
+            // An error status has a JSON body ({detail}), not an event stream
+            if (!res.ok) throw new Error(await errorMessage(res));
+
+            // Parse the Server-Sent Events stream: "data: {...}\n\n" ... "data: [DONE]"
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let model = '';
+            let content = '';
+            let ttft = null;
+            const show = () => setResult({
+                model: model,
+                content: content,
+                duration: Date.now() - start,
+                ttft: ttft,
+                isCached: model.includes('Cached')
             });
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const event of events) {
+                    if (!event.startsWith('data: ')) continue;
+                    const payload = event.slice(6);
+                    if (payload === '[DONE]') continue;
+                    const chunk = JSON.parse(payload);
+                    if (chunk.error) throw new Error(chunk.error.message);
+                    model = model || chunk.model || '';
+                    const delta = chunk.choices?.[0]?.delta?.content || '';
+                    content += delta;
+                    // The first chunk is usually the role-only delta; time the first actual token
+                    if (ttft === null && delta) {
+                        ttft = Date.now() - start;
+                        setLoading(false);
+                    }
+                    if (ttft !== null) show();
+                }
+            }
+            show(); // final duration (and an empty answer, which never had a token)
         } catch (err) {
             console.error(err);
+            setError(err.message);
         }
         setLoading(false);
     };
@@ -74,7 +111,7 @@ export function Playground() {
                                             body: formData
                                         });
 
-                                        if (!res.ok) throw new Error("Upload failed");
+                                        if (!res.ok) throw new Error(await errorMessage(res));
 
                                         const data = await res.json();
                                         const textContent = data.text;
@@ -114,7 +151,13 @@ export function Playground() {
 
                 {/* Visualizer */}
                 <div className="bg-black/20 rounded-2xl p-6 border border-white/5 relative overflow-hidden backdrop-blur-sm min-h-[300px]">
-                    {!result && !loading && (
+                    {error && !loading && (
+                        <div className="mb-4 p-4 rounded-lg border border-red-500/30 bg-red-500/10 text-red-300 text-sm font-mono whitespace-pre-wrap break-words">
+                            {error}
+                        </div>
+                    )}
+
+                    {!result && !loading && !error && (
                         <div className="h-full flex flex-col items-center justify-center text-zinc-600 space-y-4 opacity-50">
                             <div className="text-6xl animate-pulse-slow">🔮</div>
                             <p className="font-mono text-sm tracking-widest">AWAITING INPUT</p>
@@ -147,6 +190,9 @@ export function Playground() {
                                 <div className="text-right">
                                     <span className="text-zinc-500 text-[10px] uppercase tracking-wider font-bold">Latency</span>
                                     <div className="text-xl font-mono text-white/90">{result.duration}ms</div>
+                                    {result.ttft !== null && (
+                                        <div className="text-[10px] font-mono text-zinc-500">first token {result.ttft}ms</div>
+                                    )}
                                 </div>
                             </div>
 
@@ -170,6 +216,15 @@ export function Playground() {
     );
 }
 
+async function errorMessage(res) {
+    try {
+        const body = await res.json();
+        return typeof body.detail === 'string' ? body.detail.split('\n')[0] : `HTTP ${res.status}`;
+    } catch {
+        return `HTTP ${res.status}`;
+    }
+}
+
 function StepLabel({ text, active, completed, highlight }) {
     let icon = "⚪";
     let color = "text-zinc-600";